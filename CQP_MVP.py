@@ -1,28 +1,52 @@
+import asyncio
 import os
-import subprocess
-import matplotlib.pyplot as plt
+import threading
+import time
+from dataclasses import dataclass, field
 from dotenv import load_dotenv
-import openai
 
 # Import classes related to the agent setup
 from llama_index.llms.openai import OpenAI
-from llama_index.core.agent import ReActAgent, FunctionCallingAgentWorker, AgentRunner
+from llama_index.core.agent import FunctionCallingAgentWorker, AgentRunner
 
 # Import classes for chat messages and tools
-from llama_index.core.llms import ChatMessage
-from llama_index.core.tools import BaseTool, FunctionTool, QueryEngineTool, ToolMetadata
+from llama_index.core.llms import ChatMessage, MessageRole
+from llama_index.core.memory import ChatMemoryBuffer
+from llama_index.core.tools import FunctionTool, QueryEngineTool, ToolMetadata
 
 # Import classes for data indexing and storage
-from llama_index.core import VectorStoreIndex, StorageContext, SimpleDirectoryReader, load_index_from_storage
+from llama_index.core import VectorStoreIndex
 from llama_index.core.objects import ObjectIndex
 
-from streamlit import pyplot as plt
+from artifact_store import DEFAULT_SESSION, Artifact, artifact_session, get_artifact_store
+from chart_data import TABLES_NAME, ChartDataStore
+from chart_render import CHART_FORMAT, CHART_FORMATS, render_chart
+from embedding_cache import install_embedding_cache, report_embedding_cache
+from index_store import INDEX_ROOT, IndexStore
+# The chart processing functions moved to ingestion and are still importable from here
+from ingestion import (
+    file_sha256,
+    generate_chart_data_from_pdf,
+    generate_chart_data_from_svg,
+    generate_pdf_from_svg,
+    pdf_processing,
+    process_document,
+    svg_processing,
+)
+from response_cache import ResponseCache, cache_scope
+from tracing import TracedTool, get_tracer
+
+
 
-# Load environment variables
-load_dotenv()
-# Retrieve API keys from environment variables. Keep separate file .env in the same directory as this file and add teh keys there. 
-openai_api_key = os.getenv("OPENAI_API_KEY")
 
+def _save_chart(data, title, format=CHART_FORMAT):
+    """
+    Stores the rendered chart as an artifact of the current session and returns its handle,
+    which the agent passes through to the inquiry result.
+    """
+    artifact = get_artifact_store().save(data, title, f".{format}", CHART_FORMATS[format])
+    print(f"Saved chart as {artifact.path}")
+    return artifact
 
 
 def create_bar_chart(data, title="Bar Chart", x_label="X-axis", y_label="Y-axis", color="skyblue"):
@@ -35,37 +59,15 @@ def create_bar_chart(data, title="Bar Chart", x_label="X-axis", y_label="Y-axis"
       - If a dictionary, expects {x_label: y_value}.
       - If a list of tuples, expects [(x_label, y_value), ...].
       - If a list of values, each value is plotted with a default x_label.
+      - Column dicts {"x": [...], "y": [...]}, NumPy arrays and pandas Series are plotted as they are.
     - title (str): The title of the chart.
     - x_label (str): The label for the x-axis.
     - y_label (str): The label for the y-axis.
     - color (str): The color of the bars in the chart.
+
+    Returns the Artifact of the saved chart.
     """
-    # Handle a simple list of values by assigning default x_labels
-    if isinstance(data, list) and all(isinstance(item, (int, float)) for item in data):
-        data = {f"Item {i+1}": val for i, val in enumerate(data)}
-    # Handle a list of tuples
-    elif isinstance(data, list) and all(isinstance(item, tuple) for item in data):
-        data = {item[0]: item[1] for item in data}
-    elif not isinstance(data, dict):
-        raise ValueError("Data must be a dictionary, a list of tuples, or a list of numeric values.")
-
-    fig, ax = plt.subplots()
-    ax.bar(data.keys(), data.values(), color=color)
-    ax.set_title(title)
-    ax.set_xlabel(x_label)
-    ax.set_ylabel(y_label)
-    plt.xticks(rotation=45)
-    plt.tight_layout()
-
-    # Save the figure
-    directory = "temp_img"
-    if not os.path.exists(directory):
-        os.makedirs(directory)
-    current_time = datetime.datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
-    filename = f"{directory}/{title.replace(' ', '_')}_{current_time}.png"
-    plt.savefig(filename)
-    plt.close(fig)
-    print(f"Saved chart as {filename}")
+    return _save_chart(render_chart("bar", data, title, x_label, y_label, color), title)
 
 
 
@@ -79,106 +81,31 @@ def create_line_chart(data, title="Line Chart", x_label="X-axis", y_label="Y-axi
       - If a dictionary, expects {x_label: y_value}.
       - If a list of tuples, expects [(x_label, y_value), ...].
       - If a list of values, each value is plotted with a default x_label.
+      - Column dicts {"x": [...], "y": [...]}, NumPy arrays and pandas Series are plotted as they are.
     - title (str): The title of the chart.
     - x_label (str): The label for the x-axis.
     - y_label (str): The label for the y-axis.
     - color (str): The color of the line in the chart.
-    """
-    # Handle a simple list of values by assigning default x_labels
-    if isinstance(data, list) and all(isinstance(item, (int, float)) for item in data):
-        data = {f"Item {i+1}": val for i, val in enumerate(data)}
-    # Handle a list of tuples
-    elif isinstance(data, list) and all(isinstance(item, tuple) for item in data):
-        data = {item[0]: item[1] for item in data}
-    elif not isinstance(data, dict):
-        raise ValueError("Data must be a dictionary, a list of tuples, or a list of numeric values.")
-
-    fig, ax = plt.subplots()
-    
-    ax.plot(list(data.keys()), list(data.values()), color=color, marker='o')  # Added a marker for better visibility
-    ax.set_title(title)
-    ax.set_xlabel(x_label)
-    ax.set_ylabel(y_label)
-    plt.xticks(rotation=45)
-    plt.tight_layout()
-
-    # Save the figure
-    directory = "temp_img"
-    if not os.path.exists(directory):
-        os.makedirs(directory)
-    current_time = datetime.datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
-    filename = f"{directory}/{title.replace(' ', '_')}_{current_time}.png"
-    plt.savefig(filename)
-    plt.close(fig)
-    print(f"Saved chart as {filename}")
-
-def generate_chart_data_from_pdf(pdf_file):
-    print("Running inkscape...")
-
-    output_svg_name = pdf_file + ".svg"
-    completed = subprocess.run(["inkscape", "--export-filename=" + output_svg_name, pdf_file])
-    print(completed.stdout)
-    print(completed.stderr)
-
-    print("Inkscape done!")
-
-    return generate_chart_data_from_svg(output_svg_name)
-
-def generate_pdf_from_svg(svg_file):
-    print("Running inkscape...")
-
-    output_pdf_name = svg_file + ".pdf"
-    completed = subprocess.run(["inkscape", "--export-filename=" + output_pdf_name, svg_file])
-    print(completed.stdout)
-    print(completed.stderr)
-
-    print("Inkscape done!")
-
-    return output_pdf_name
-    
-def generate_chart_data_from_svg(svg_file):
-    svg_file = open(svg_file)
-
-    line_buffer = ""
-    for line in svg_file:
-        line_buffer = line_buffer + line
-    prompt = '''Generate a .txt file that describes the chart within the following SVG file. Label every data point. For example: 
-            Title of the chart is "Apple Stock Price Over the Last 10 Years".
-            • Chart type is a bar chart.
-            • Chart created using matplotlib.
-            • X-axis is labeled "Year".
-            • Y-axis is labeled "Stock Price ($)".
-            • Data points are colored in skyblue.
-            • The chart measures stock price rates from 2015 to 2024.
-            • Year 2015 was $27.06.
-            • Year 2016 was $24.06.
-            • Year 2017 was $35.29.'''
-    # Use the OpenAI API for Query and Response
-    load_dotenv()
-    openai.api_key = os.getenv("OPENAI_API_KEY")
-    response = openai.chat.completions.create(
-        model="gpt-4-turbo",
-        messages=[
-                {"role": "system", "content": prompt},
-                {"role": "user", "content": line_buffer}
-        ]
-    )
 
-    # Extracting text response from the OpenAI response object
-    response = response.choices[0].message.content
+    Returns the Artifact of the saved chart.
+    """
+    return _save_chart(render_chart("line", data, title, x_label, y_label, color), title)
 
-    print(response)
+def _threaded(fn):
+    """
+    Returns an async version of fn for async agents. The agent would run fn in an executor
+    without the caller's context variables, this runs it with them, so that charts still
+    land in the artifact session of the inquiry.
+    """
+    async def run(*args, **kwargs):
+        return await asyncio.to_thread(fn, *args, **kwargs)
+    return run
 
-    with open(svg_file + "chart_description.txt", "w") as f:
-        f.write(response)
-        print(f"{response}")
-        return svg_file + "chart_description.txt"
-    
-    
 
 # Define the bar chart creation tool
 bar_chart_tool = FunctionTool.from_defaults(
     fn=create_bar_chart,  
+    async_fn=_threaded(create_bar_chart),
     name="bar_chart_creator",
     description="Generates a dynamic bar chart based on provided data and parameters."
 )
@@ -187,148 +114,426 @@ bar_chart_tool = FunctionTool.from_defaults(
 # Define the bar chart creation tool
 line_chart_tool = FunctionTool.from_defaults(
     fn=create_line_chart,  
+    async_fn=_threaded(create_line_chart),
     name="line_chart_creator",
     description="Generates a dynamic line chart based on provided data and parameters."
 )
 
-def pdf_processing(pdf_file):
-    text_docs = SimpleDirectoryReader(
-        input_files=[pdf_file]
-    ).load_data()
+# Names of the persisted indexes below the index store root and the document they are built from
+TEXT_INDEX = "textdata"
+CHART_INDEX = "chartdata"
+DEFAULT_DOCUMENT = "./test_files/final.pdf"
+# Chat history kept per agent, older messages are dropped beyond this many tokens
+SESSION_MEMORY_TOKENS = 3000
 
-    output_text = generate_chart_data_from_pdf(pdf_file)
 
-    chart_docs = SimpleDirectoryReader(
-        input_files=[output_text]
-    ).load_data()
+class SessionAgentRunner(AgentRunner):
+    """
+    AgentRunner that drops every task once its response is final. The delete_task_on_finish
+    option of AgentRunner deletes the task before the response sources are read from it,
+    which fails every chat.
+    """
 
-    return text_docs, chart_docs
+    def finalize_response(self, task_id, step_output=None):
+        response = super().finalize_response(task_id, step_output)
+        self.delete_task(task_id)
+        return response
 
-def svg_processing(svg_file):
-    pdf_file = generate_pdf_from_svg(svg_file)
-    text_docs = SimpleDirectoryReader(
-        input_files=[pdf_file]
-    ).load_data()
 
-    output_text = generate_chart_data_from_svg(svg_file)
+class AppContext:
+    """
+    The application state shared by the CLI and the web app: the text and chart indexes,
+    the chart data tables, their query engine tools, the ObjectIndex over the tools and the agent. Nothing is
+    loaded when the context is created, each part is built on first use and kept for the
+    lifetime of the process. The time spent on every part is kept in timings.
 
-    chart_docs = SimpleDirectoryReader(
-        input_files=[output_text]
-    ).load_data()
+    Parameters:
+    - index_root (str): Directory of the index store holding the text and chart indexes.
+    - documents (list of str): Documents that are indexed at startup if missing or changed.
+    - model (str): OpenAI model used by the agent.
+    - llm (LLM): Function calling LLM used instead of the OpenAI model, e.g. an offline fake.
+    """
 
-    return text_docs, chart_docs
+    def __init__(self, index_root=INDEX_ROOT, documents=(DEFAULT_DOCUMENT,), model="gpt-4-turbo", llm=None):
+        start = time.perf_counter()
+        # Load environment variables. Keep separate file .env in the same directory as this file and add the keys there.
+        load_dotenv()
+        self.openai_api_key = os.getenv("OPENAI_API_KEY")
+        self.index_store = IndexStore(index_root)
+        self.documents = list(documents)
+        self.model = model
+        self.timings = {"environment": time.perf_counter() - start}
+        self._components = {} if llm is None else {"llm": llm}
+        self._lock = threading.RLock()
+
+    def _component(self, name, build):
+        with self._lock:
+            if name not in self._components:
+                start = time.perf_counter()
+                self._components[name] = build()
+                self.timings[name] = time.perf_counter() - start
+            return self._components[name]
+
+    @property
+    def embed_model(self):
+        # Chunk and tool description embeddings are cached on disk and shared by all processes
+        return self._component("embed_model", install_embedding_cache)
+
+    def _load_indexes(self):
+        self.embed_model
+        stored = {name: self.index_store.load_or_create(name) for name in (TEXT_INDEX, CHART_INDEX)}
+
+        # Only sources that are new or changed since they were indexed are processed again
+        stale = {}
+        hashes = {}
+        for index in stored.values():
+            stale.update(index.stale_sources(self.documents, hashes))
+        for source, sha256 in stale.items():
+            print(f"Indexing {source}")
+            text_docs, chart_docs = process_document(source, sha256)
+            stored[TEXT_INDEX].replace_source(source, sha256, text_docs)
+            stored[CHART_INDEX].replace_source(source, sha256, chart_docs)
+
+        for index in stored.values():
+            if index.dirty:
+                self.index_store.save(index)
+        report_embedding_cache(self.embed_model)
+        return stored
+
+    @property
+    def stored_indexes(self):
+        return self._component("indexes", self._load_indexes)
+
+    @property
+    def text_index(self):
+        return self.stored_indexes[TEXT_INDEX].index
+
+    @property
+    def chart_index(self):
+        return self.stored_indexes[CHART_INDEX].index
+
+    def _load_chart_data(self):
+        path = os.path.join(self.index_store.root, TABLES_NAME)
+        indexed = {source: entry["sha256"] for source, entry in self.stored_indexes[CHART_INDEX].sources.items()}
+        if os.path.exists(path):
+            try:
+                chart_data = ChartDataStore.load(path)
+                if chart_data.sources == indexed:
+                    return chart_data
+            except (OSError, ValueError, KeyError) as error:
+                print(f"Rebuilding the chart tables: {error}")
+        # The tables are derived from the chart descriptions in the chart index
+        chart_data = ChartDataStore.from_nodes(self.chart_index.docstore.docs.values(), path)
+        chart_data.sources = indexed
+        chart_data.save()
+        return chart_data
+
+    @property
+    def chart_data(self):
+        return self._component("chart_data", self._load_chart_data)
+
+    def _build_query_engine_tools(self):
+        text_engine = self.text_index.as_query_engine(similarity_top_k=3)
+        chart_engine = self.chart_index.as_query_engine(similarity_top_k=3)
+
+        # Every tool call is timed as a span of the inquiry, see tracing
+        tools = [
+            QueryEngineTool(
+                query_engine=text_engine,
+                metadata=ToolMetadata(
+                    name="textdata",
+                    description=(
+                        "Provides information about text in the document. "
+                        "Use a detailed plain text question as input to the tool."
+                    ),
+                ),
+            ),
+            QueryEngineTool(
+                query_engine=chart_engine,
+                metadata=ToolMetadata(
+                    name="chartdata",
+                    description=(
+                        "Provides information about chart data in the document."
+                        "Use a detailed plain text question as input to the tool."
+                    ),
+                ),
+            ),
+            FunctionTool.from_defaults(
+                fn=self.chart_data.query,
+                async_fn=_threaded(self.chart_data.query),
+                name="chart_table",
+                description=(
+                    "Answers numeric questions about chart data exactly, e.g. the value in a given year, "
+                    "the minimum, maximum, mean, sum or change over a range, and returns the data points "
+                    "of a series as a {x: value} dictionary that can be passed to the chart creators. "
+                    "Prefer it over chartdata for numbers."
+                ),
+            ),
+            bar_chart_tool,
+            line_chart_tool,
+        ]
+        return [TracedTool(tool) for tool in tools]
+
+    @property
+    def query_engine_tools(self):
+        return self._component("query_engine_tools", self._build_query_engine_tools)
+
+    @property
+    def obj_index(self):
+        return self._component("obj_index", lambda: ObjectIndex.from_objects(
+            self.query_engine_tools,
+            index_cls=VectorStoreIndex,
+            embed_model=self.embed_model,
+        ))
+
+    @property
+    def llm(self):
+        return self._component("llm", lambda: OpenAI(model=self.model))
+
+    def new_agent(self, memory_token_limit=SESSION_MEMORY_TOKENS):
+        """
+        Creates an agent with its own conversation memory, e.g. one per web app session.
+        All agents share the indexes, the tools and the LLM client.
+
+        Parameters:
+        - memory_token_limit (int): Tokens of chat history the agent keeps.
+        """
+        agent_worker = FunctionCallingAgentWorker.from_tools(
+            tool_retriever=self.obj_index.as_retriever(similarity_top_k=5),
+            llm=self.llm,
+            verbose=True,
+            allow_parallel_tool_calls=True,
+        )
+        memory = ChatMemoryBuffer.from_defaults(llm=self.llm, token_limit=memory_token_limit)
+        # Finished tasks are dropped so that a long session does not keep every step in memory
+        return SessionAgentRunner(agent_worker, memory=memory)
+
+    @property
+    def agent(self):
+        return self._component("agent", self.new_agent)
+
+    def add_document(self, path):
+        """
+        Adds a PDF or SVG document to the loaded indexes without rebuilding them. Documents
+        are keyed by the hash of the file, so a file that is already indexed is skipped.
+        The query engines and the agent see the new documents right away.
+
+        Parameters:
+        - path (str): Path of the PDF or SVG document.
+
+        Returns True if the document was added and False if it was already indexed.
+        """
+        sha256 = file_sha256(path)
+        with self._lock:
+            stored = self.stored_indexes
+            if all(index.contains(sha256) for index in stored.values()):
+                print(f"{path} is already indexed")
+                return False
+
+            start = time.perf_counter()
+            text_docs, chart_docs = process_document(path, sha256)
+            stored[TEXT_INDEX].replace_source(path, sha256, text_docs)
+            stored[CHART_INDEX].replace_source(path, sha256, chart_docs)
+            for index in stored.values():
+                self.index_store.save(index)
+            self.chart_data.replace_from_documents(path, sha256, chart_docs)
+            self.chart_data.save()
+            self.response_cache.invalidate(self.cache_scope)
+            self.timings[f"add {os.path.basename(path)}"] = time.perf_counter() - start
+        print(f"Added {len(text_docs)} text and {len(chart_docs)} chart documents from {path}")
+        return True
+
+    @property
+    def response_cache(self):
+        return self._component("response_cache", lambda: ResponseCache(
+            embed=lambda question: self.embed_model.get_query_embedding(question)
+        ))
+
+    @property
+    def cache_scope(self):
+        """
+        Identifies the indexed content and the tool set, cached responses are only reused
+        while both are unchanged.
+        """
+        sources = {name: index.sources for name, index in self.stored_indexes.items()}
+        tools = [(tool.metadata.name, tool.metadata.description) for tool in self.query_engine_tools]
+        return cache_scope(sources, tools, self.model)
+
+    def timing_report(self):
+        """
+        Returns the time spent on each part of the context as a printable table.
+        """
+        lines = [f"{'component':<24}{'seconds':>10}"]
+        for name, seconds in self.timings.items():
+            lines.append(f"{name:<24}{seconds:>10.3f}")
+        lines.append(f"{'total':<24}{sum(self.timings.values()):>10.3f}")
+        return "\n".join(lines)
+
+
+_app_context = None
+_app_context_lock = threading.Lock()
+
+
+def get_app_context():
+    """
+    Returns the process-wide application context, creating it on first use.
+    """
+    global _app_context
+    with _app_context_lock:
+        if _app_context is None:
+            _app_context = AppContext()
+        return _app_context
 
-try:
-    storage_context = StorageContext.from_defaults(
-        persist_dir="./test_files/textdata"
-    )
-    text_index = load_index_from_storage(storage_context)
 
-    storage_context = StorageContext.from_defaults(
-        persist_dir="./test_files/chartdata"
-    )
-    chart_index = load_index_from_storage(storage_context)
+@dataclass
+class InquiryResult:
+    text: str
+    image_path: str = None
+    artifacts: list = field(default_factory=list)
+    cached: bool = False
+    # The spans of the inquiry are get_tracer().trace(trace_id)
+    trace_id: str = None
 
-    index_loaded = True
-except:
-    index_loaded = False
+    @property
+    def image(self):
+        """
+        The last chart of the answer as st.image accepts it: PNG bytes or SVG markup.
+        """
+        for artifact in reversed(self.artifacts):
+            if artifact.data is not None and artifact.content_type.startswith("image/"):
+                return artifact.data.decode("utf-8") if artifact.content_type == "image/svg+xml" else artifact.data
+        return None
 
-if not index_loaded:
-    # load data
-    text_docs, chart_docs = pdf_processing("./test_files/final.pdf")
 
-    # build index
-    text_index = VectorStoreIndex.from_documents(text_docs)
-    chart_index = VectorStoreIndex.from_documents(chart_docs)
+@dataclass
+class InquiryProgress:
+    tool: str
+    output: str
 
-    # persist index
-    text_index.storage_context.persist(persist_dir="./test_files/textdata")
-    chart_index.storage_context.persist(persist_dir="./test_files/textdata")
 
-text_engine = text_index.as_query_engine(similarity_top_k=3)
-chart_engine = chart_index.as_query_engine(similarity_top_k=3)
+def _inquiry_result(context, question, scope, history, response):
+    # The chart tools return Artifact handles, which the agent keeps in the tool outputs
+    artifacts = [source.raw_output for source in response.sources if isinstance(source.raw_output, Artifact)]
+    image_path = next((a.path for a in reversed(artifacts) if a.content_type.startswith("image/")), None)
 
-query_engine_tools = [
-    QueryEngineTool(
-        query_engine=text_engine,
-        metadata=ToolMetadata(
-            name="textdata",
-            description=(
-                "Provides information about text in the document. "
-                "Use a detailed plain text question as input to the tool."
-            ),
-        ),
-    ),
-    QueryEngineTool(
-        query_engine=chart_engine,
-        metadata=ToolMetadata(
-            name="chartdata",
-            description=(
-                "Provides information about chart data in the document."
-                "Use a detailed plain text question as input to the tool."
-            ),
-        ),
-    ),
-    bar_chart_tool,
-    line_chart_tool,
-]
-
-obj_index = ObjectIndex.from_objects(
-    query_engine_tools,
-    index_cls=VectorStoreIndex,
-)
+    context.response_cache.put(question, scope, response, image_path, artifacts, history)
+    return InquiryResult(str(response), image_path, artifacts)
 
-llm = OpenAI(model="gpt-4-turbo")
-agent_worker = FunctionCallingAgentWorker.from_tools(
-    tool_retriever=obj_index.as_retriever(similarity_top_k=5),
-    llm=llm,
-    verbose=True,
-    allow_parallel_tool_calls=True,
-)
-agent = AgentRunner(agent_worker)
 
+def _replay(cached, question, agent, session):
+    """
+    Answers question with a cached response as if the agent had given it: the exchange
+    enters the agent's memory, so follow-up questions can refer to it, and the charts
+    are copied into the artifacts of session.
+    """
+    agent.memory.put(ChatMessage(role=MessageRole.USER, content=question))
+    agent.memory.put(ChatMessage(role=MessageRole.ASSISTANT, content=cached.response))
+    store = get_artifact_store()
+    artifacts = [store.copy(artifact, session or DEFAULT_SESSION) for artifact in cached.artifacts]
+    image_path = next((a.path for a in reversed(artifacts) if a.content_type.startswith("image/")), None)
+    return InquiryResult(cached.response, image_path if artifacts else cached.image_path, artifacts, cached=True)
 
 
-import datetime
-import os
-import matplotlib.pyplot as plt
-import matplotlib.image as mpimg
+def run_inquiry(question, agent=None, session=None):
+    """
+    Answers a question with a single agent call and returns the text of the answer
+    together with the artifacts (charts) the agent's tools created for it.
 
-def process_inquiry_and_show_latest_image(question):
+    Parameters:
+    - question (str): The inquiry that might lead to image creation.
+    - agent (AgentRunner): The agent of the conversation, the shared agent by default.
+    - session (str): Namespace of the created artifacts, e.g. the web app session id.
     """
-    Processes a given inquiry using an agent's chat function that might generate an image,
-    prints the response, and displays the path to the newest image created in the 'temp_img'
-    directory if available, along with the image itself.
+    context = get_app_context()
+    agent = agent or context.agent
+    with get_tracer().span("inquiry", "inquiry", question=question[:200]) as span:
+        scope = context.cache_scope
+        # A copy, the memory's message list grows with the answer
+        history = list(agent.chat_history)
+        cached = context.response_cache.get(question, scope, history)
+        span.attributes["cached"] = cached is not None
+        if cached is not None:
+            # Repeated questions about unchanged documents are answered without the agent
+            print(f"{cached.response}")
+            result = _replay(cached, question, agent, session)
+        else:
+            with artifact_session(session or DEFAULT_SESSION):
+                response = agent.chat(question)
+            print(f"{response}")
+            result = _inquiry_result(context, question, scope, history, response)
+        result.trace_id = span.trace_id
+        return result
+
+
+async def astream_inquiry(question, agent=None, session=None):
+    """
+    Async version of run_inquiry that reports progress while the agent works. Yields an
+    InquiryProgress for every tool call as soon as the agent step that made it finishes,
+    and the InquiryResult last. The tool calls of one step run concurrently. Closing the
+    generator or cancelling the task iterating it stops the agent and discards the
+    unfinished exchange, so it does not enter the conversation memory.
 
     Parameters:
     - question (str): The inquiry that might lead to image creation.
+    - agent (AgentRunner): The agent of the conversation, the shared agent by default.
+    - session (str): Namespace of the created artifacts, e.g. the web app session id.
     """
-    inquiry_time = datetime.datetime.now()
-    response = agent.chat(question)
-    
+    context = get_app_context()
+    agent = agent or context.agent
+    scope = context.cache_scope
+    history = list(agent.chat_history)
+    tracer = get_tracer()
+    # The span is only made current around each await, the generator may be resumed in other tasks
+    inquiry = tracer.start_span("inquiry", "inquiry", question=question[:200])
+    with tracer.activate(inquiry):
+        # The cache may embed the question, which is a blocking API call
+        cached = await asyncio.to_thread(context.response_cache.get, question, scope, history)
+    if cached is not None:
+        result = _replay(cached, question, agent, session)
+        tracer.end_span(inquiry, cached=True)
+        result.trace_id = inquiry.trace_id
+        yield result
+        return
+
+    task = agent.create_task(question)
+    response = None
+    try:
+        while True:
+            with artifact_session(session or DEFAULT_SESSION), tracer.activate(inquiry):
+                step_output = await agent.arun_step(task.task_id)
+            for source in step_output.output.sources:
+                yield InquiryProgress(source.tool_name, str(source))
+            if step_output.is_last:
+                break
+        response = agent.finalize_response(task.task_id, step_output)
+    finally:
+        if response is None:
+            agent.delete_task(task.task_id)
+            tracer.end_span(inquiry, error="stopped")
+
     print(f"{response}")
+    with tracer.activate(inquiry):
+        result = _inquiry_result(context, question, scope, history, response)
+    tracer.end_span(inquiry, cached=False)
+    result.trace_id = inquiry.trace_id
+    yield result
 
-    # Check the 'temp_img' directory for the newest file created after the inquiry
-    directory = 'temp_img'
-    latest_file = None
-    latest_time = inquiry_time  # Start comparison from the inquiry time
 
-    if os.path.exists(directory):
-        for filename in os.listdir(directory):
-            file_path = os.path.join(directory, filename)
-            if os.path.isfile(file_path):
-                file_time = datetime.datetime.fromtimestamp(os.path.getmtime(file_path))
-                if file_time > latest_time:  # Compare creation time
-                    latest_time = file_time
-                    latest_file = file_path
+def process_inquiry_and_show_latest_image(question):
+    """
+    Processes a given inquiry using an agent's chat function that might generate an image,
+    prints the response, and returns the path to the image created for it, if any.
 
-    # Print the path to the latest image if available and display the image
-    if latest_file:
-        return latest_file  # Return the file path to be used in Streamlit
-    return None  # Return None if no file was created
+    Parameters:
+    - question (str): The inquiry that might lead to image creation.
+    """
+    return run_inquiry(question).image_path
 
 
 def main(): 
+    context = get_app_context()
+    context.agent
+    print(context.timing_report())
     while True:
         question = input("Ask your question (type 'exit' to quit): ")
         if question.lower() == 'exit':
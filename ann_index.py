@@ -0,0 +1,236 @@
+import math
+import os
+
+import numpy as np
+
+# Below this many vectors an exact scan is fast enough and no ANN index is trained
+MIN_TRAIN_SIZE = 1024
+ANN_KINDS = ("exact", "ivf", "hnsw")
+
+
+class IVFFlatIndex:
+    """
+    Inverted file index over the rows of a unit-normalized embedding matrix. The rows are
+    clustered with spherical k-means into nlist lists and a query only scans the rows of
+    the nprobe lists whose centroids are closest to it. Vectors themselves are not copied,
+    the index only keeps the centroids and the list of every row.
+
+    Parameters:
+    - nlist (int): Number of lists, by default about 2 * sqrt(rows).
+    - nprobe (int): Lists scanned per query. Higher values trade speed for recall.
+    - min_train_size (int): Rows needed before the index is trained.
+    - iterations (int): k-means iterations.
+    - seed (int): Seed of the k-means initialization.
+    """
+
+    kind = "ivf"
+
+    def __init__(self, nlist=None, nprobe=8, min_train_size=MIN_TRAIN_SIZE, iterations=10, seed=0):
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.min_train_size = min_train_size
+        self.iterations = iterations
+        self.seed = seed
+        self.centroids = None
+        self.labels = np.zeros(0, dtype=np.int32)
+        self.trained_size = 0
+        self._postings = None
+
+    @property
+    def params(self):
+        return {"nlist": self.nlist, "nprobe": self.nprobe, "min_train_size": self.min_train_size}
+
+    @property
+    def ready(self):
+        return self.centroids is not None
+
+    def _assign(self, vectors, batch=8192):
+        labels = np.empty(len(vectors), dtype=np.int32)
+        for start in range(0, len(vectors), batch):
+            block = np.asarray(vectors[start:start + batch], dtype=np.float32)
+            labels[start:start + batch] = np.argmax(block @ self.centroids.T, axis=1)
+        return labels
+
+    def train(self, vectors):
+        n = len(vectors)
+        nlist = min(self.nlist or max(1, int(2 * math.sqrt(n))), n)
+        rng = np.random.default_rng(self.seed)
+        sample_size = min(n, 32 * nlist)
+        sample = np.asarray(vectors[np.sort(rng.choice(n, sample_size, replace=False))], dtype=np.float32)
+        centroids = sample[rng.choice(sample_size, nlist, replace=False)]
+        for _ in range(self.iterations):
+            assignment = np.argmax(sample @ centroids.T, axis=1)
+            order = np.argsort(assignment, kind="stable")
+            counts = np.bincount(assignment, minlength=nlist)
+            sums = np.zeros_like(centroids)
+            filled = counts > 0
+            sums[filled] = np.add.reduceat(sample[order], np.cumsum(counts)[filled] - counts[filled])
+            empty = ~filled
+            # Empty lists are restarted from random sample rows
+            sums[empty] = sample[rng.choice(sample_size, int(empty.sum()))]
+            norms = np.linalg.norm(sums, axis=1, keepdims=True)
+            centroids = sums / np.where(norms == 0, 1, norms)
+        self.centroids = centroids
+        self.labels = self._assign(vectors)
+        self.trained_size = n
+        self._postings = None
+
+    def sync(self, vectors):
+        """
+        Brings the index up to date with vectors after rows were appended. The index is
+        trained once there are enough rows and retrained when the matrix has grown to four
+        times the size it was trained on, so that the lists stay balanced.
+        """
+        n = len(vectors)
+        if n < self.min_train_size:
+            self.centroids = None
+            self.labels = np.zeros(0, dtype=np.int32)
+            return
+        if not self.ready or n >= 4 * self.trained_size:
+            self.train(vectors)
+        elif len(self.labels) < n:
+            self.labels = np.concatenate([self.labels, self._assign(vectors[len(self.labels):])])
+            self._postings = None
+
+    def keep(self, rows):
+        """
+        Drops every row not in rows, which are the kept row numbers in ascending order.
+        """
+        if self.ready:
+            self.labels = self.labels[rows]
+            self._postings = None
+
+    def _lists(self):
+        if self._postings is None:
+            order = np.argsort(self.labels, kind="stable")
+            bounds = np.searchsorted(self.labels[order], np.arange(len(self.centroids) + 1))
+            self._postings = (order, bounds)
+        return self._postings
+
+    def candidates(self, query_vector):
+        order, bounds = self._lists()
+        probe = np.argsort(-(self.centroids @ query_vector))[:self.nprobe]
+        return np.sort(np.concatenate([order[bounds[i]:bounds[i + 1]] for i in probe]))
+
+    def search(self, vectors, query_vector, k):
+        """
+        Returns the row numbers and scores of the approximate top k rows.
+        """
+        rows = self.candidates(query_vector)
+        scores = np.asarray(vectors[rows], dtype=np.float32) @ query_vector
+        return _top_k(rows, scores, k)
+
+    def save(self, path):
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            np.savez(f, centroids=self.centroids, labels=self.labels, trained_size=self.trained_size)
+        os.replace(tmp_path, path)
+
+    def load(self, path, vectors):
+        with np.load(path) as data:
+            centroids, labels = data["centroids"], data["labels"]
+            trained_size = int(data["trained_size"])
+        if len(labels) != len(vectors) or centroids.shape[1] != vectors.shape[1]:
+            raise ValueError(f"{path} does not match the embedding matrix")
+        self.centroids, self.labels, self.trained_size = centroids, labels, trained_size
+        self._postings = None
+
+
+class HNSWIndex:
+    """
+    Hierarchical navigable small world graph from faiss (faiss-cpu). Rows are inserted
+    incrementally, deleting rows rebuilds the graph on the next search.
+
+    Parameters:
+    - m (int): Neighbours per node.
+    - ef_search (int): Candidate list size at query time. Higher values trade speed for recall.
+    - ef_construction (int): Candidate list size while inserting.
+    - min_train_size (int): Rows needed before the graph is built.
+    """
+
+    kind = "hnsw"
+
+    def __init__(self, m=32, ef_search=64, ef_construction=80, min_train_size=MIN_TRAIN_SIZE):
+        try:
+            import faiss
+        except ImportError:
+            raise ImportError("The hnsw index requires faiss-cpu, install it with `pip install faiss-cpu`") from None
+        self._faiss = faiss
+        self.m = m
+        self.ef_search = ef_search
+        self.ef_construction = ef_construction
+        self.min_train_size = min_train_size
+        self.graph = None
+
+    @property
+    def params(self):
+        return {"m": self.m, "ef_search": self.ef_search, "ef_construction": self.ef_construction,
+                "min_train_size": self.min_train_size}
+
+    @property
+    def ready(self):
+        return self.graph is not None
+
+    def sync(self, vectors):
+        if len(vectors) < self.min_train_size:
+            self.graph = None
+            return
+        if self.graph is None:
+            self.graph = self._faiss.IndexHNSWFlat(vectors.shape[1], self.m, self._faiss.METRIC_INNER_PRODUCT)
+            self.graph.hnsw.efConstruction = self.ef_construction
+        if self.graph.ntotal < len(vectors):
+            self.graph.add(np.ascontiguousarray(vectors[self.graph.ntotal:], dtype=np.float32))
+
+    def keep(self, rows):
+        self.graph = None
+
+    def search(self, vectors, query_vector, k):
+        self.graph.hnsw.efSearch = max(self.ef_search, k)
+        scores, rows = self.graph.search(query_vector[None, :].astype(np.float32), k)
+        found = rows[0] >= 0
+        return rows[0][found], scores[0][found]
+
+    def save(self, path):
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        self._faiss.write_index(self.graph, tmp_path)
+        os.replace(tmp_path, path)
+
+    def load(self, path, vectors):
+        graph = self._faiss.read_index(path)
+        if graph.ntotal != len(vectors) or graph.d != vectors.shape[1]:
+            raise ValueError(f"{path} does not match the embedding matrix")
+        self.graph = graph
+
+
+def _top_k(rows, scores, k):
+    if k < len(scores):
+        top = np.argpartition(-scores, k - 1)[:k]
+    else:
+        top = np.arange(len(scores))
+    top = top[np.argsort(-scores[top], kind="stable")]
+    return rows[top], scores[top]
+
+
+def exact_search(vectors, query_vector, k):
+    """
+    Returns the row numbers and scores of the exact top k rows of vectors.
+    """
+    scores = vectors @ query_vector.astype(vectors.dtype)
+    return _top_k(np.arange(len(scores)), scores, k)
+
+
+def create_ann_index(kind, **params):
+    """
+    Creates an ANN index by name, "exact" returns None.
+
+    Parameters:
+    - kind (str): "exact", "ivf" or "hnsw".
+    - params: Parameters of the index class, e.g. nprobe for "ivf" or ef_search for "hnsw".
+    """
+    if kind == "exact":
+        return None
+    if kind == "ivf":
+        return IVFFlatIndex(**params)
+    if kind == "hnsw":
+        return HNSWIndex(**params)
+    raise ValueError(f"Unknown ANN index {kind}, expected one of {ANN_KINDS}")
@@ -0,0 +1,195 @@
+import contextlib
+import contextvars
+import os
+import re
+import threading
+import time
+import uuid
+from dataclasses import dataclass, field
+
+# Defaults of the process-wide artifact store
+ARTIFACT_DIR = "./temp_img"
+MAX_ARTIFACT_BYTES = 256 * 1024 * 1024
+MAX_ARTIFACT_AGE = 24 * 60 * 60
+# Seconds between two cleanup scans of the artifact directory
+CLEANUP_INTERVAL = 60
+DEFAULT_SESSION = "default"
+# Sessions active within this many seconds keep all their artifacts, see touch_session
+SESSION_TIMEOUT = 60 * 60
+# Marker file whose modification time is the last activity of a session
+LIVE_MARKER = ".live"
+
+_SLUG_RE = re.compile(r"[^A-Za-z0-9_-]+")
+_current_session = contextvars.ContextVar("artifact_session", default=DEFAULT_SESSION)
+
+
+@dataclass
+class Artifact:
+    id: str
+    path: str
+    session: str
+    title: str
+    content_type: str
+    size: int
+    created: float
+    # The content as rendered, so the UI does not have to read it back from disk
+    data: bytes = field(default=None, repr=False, compare=False)
+
+    def __str__(self):
+        # This is what the agent sees as the output of a chart tool
+        return f"Created chart '{self.title}' as artifact {self.id}"
+
+
+def _slug(text):
+    return _SLUG_RE.sub("_", text or "").strip("_")[:60] or "artifact"
+
+
+@contextlib.contextmanager
+def artifact_session(session):
+    """
+    Stores the artifacts created inside the block under the namespace of session. The
+    session follows the agent into its tool calls, including async ones.
+    """
+    token = _current_session.set(_slug(session))
+    try:
+        yield
+    finally:
+        _current_session.reset(token)
+
+
+def current_session():
+    return _current_session.get()
+
+
+class ArtifactStore:
+    """
+    Directory of generated files, e.g. charts, with one subdirectory per session.
+    Artifacts get collision-free names and are removed once they are older than max_age
+    or when the store grows beyond max_bytes, oldest first. Artifacts of live sessions
+    (see touch_session) are never removed.
+
+    Parameters:
+    - root (str): Directory holding the artifacts.
+    - max_bytes (int): Size budget of the store in bytes.
+    - max_age (float): Seconds an artifact is kept.
+    """
+
+    def __init__(self, root=ARTIFACT_DIR, max_bytes=MAX_ARTIFACT_BYTES, max_age=MAX_ARTIFACT_AGE):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self._last_cleanup = 0.0
+        self._lock = threading.Lock()
+
+    def save(self, data, title, suffix=".png", content_type="image/png", session=None):
+        """
+        Writes data as a new artifact and returns its Artifact handle.
+
+        Parameters:
+        - data (bytes): Content of the artifact.
+        - title (str): Human readable name, also used in the file name.
+        - suffix (str): File extension.
+        - content_type (str): MIME type of data.
+        - session (str): Namespace of the artifact, the current artifact_session by default.
+        """
+        session = _slug(session) if session else current_session()
+        directory = os.path.join(self.root, session)
+        os.makedirs(directory, exist_ok=True)
+        artifact_id = uuid.uuid4().hex
+        path = os.path.join(directory, f"{_slug(title)}_{artifact_id[:12]}{suffix}")
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+        self.maybe_cleanup()
+        return Artifact(artifact_id, path, session, title, content_type, len(data), time.time(), data)
+
+    def copy(self, artifact, session=None):
+        """
+        Saves the content of artifact as a new artifact of session, e.g. a chart of a
+        cached answer that is replayed in another session.
+        """
+        data = artifact.data
+        if data is None:
+            with open(artifact.path, "rb") as f:
+                data = f.read()
+        suffix = os.path.splitext(artifact.path)[1]
+        return self.save(data, artifact.title, suffix, artifact.content_type, session)
+
+    def touch_session(self, session):
+        """
+        Marks session as live, e.g. on every web app rerun. Cleanup leaves its artifacts
+        alone until the session has been idle for SESSION_TIMEOUT seconds. The mark is a
+        file, so it is seen by the cleanup of every process sharing the store.
+        """
+        directory = os.path.join(self.root, _slug(session))
+        os.makedirs(directory, exist_ok=True)
+        marker = os.path.join(directory, LIVE_MARKER)
+        with open(marker, "a"):
+            pass
+        os.utime(marker)
+
+    def maybe_cleanup(self):
+        """
+        Runs cleanup if it has not run for CLEANUP_INTERVAL seconds.
+        """
+        with self._lock:
+            if time.time() - self._last_cleanup < CLEANUP_INTERVAL:
+                return
+            self._last_cleanup = time.time()
+        self.cleanup()
+
+    def cleanup(self):
+        """
+        Removes artifacts older than max_age, then the oldest ones until the store fits
+        in max_bytes. Live sessions are skipped. Returns the number of removed files.
+        """
+        if not os.path.isdir(self.root):
+            return 0
+        now = time.time()
+        entries = []
+        # Only the session directories are managed, files directly in root are left alone
+        for session in os.scandir(self.root):
+            if not session.is_dir():
+                continue
+            try:
+                if now - os.path.getmtime(os.path.join(session.path, LIVE_MARKER)) <= SESSION_TIMEOUT:
+                    continue
+            except FileNotFoundError:
+                pass
+            for entry in os.scandir(session.path):
+                if entry.name == LIVE_MARKER:
+                    continue
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        entries.sort()
+        total = sum(size for _, size, _ in entries)
+        removed = 0
+        for mtime, size, path in entries:
+            if now - mtime <= self.max_age and total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+                removed += 1
+            except FileNotFoundError:
+                pass
+            total -= size
+        return removed
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_artifact_store():
+    """
+    Returns the process-wide artifact store, creating it on first use.
+    """
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = ArtifactStore()
+        return _store
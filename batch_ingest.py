@@ -0,0 +1,412 @@
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from dataclasses import dataclass, field
+
+from llama_index.core import SimpleDirectoryReader, VectorStoreIndex
+
+from chart_data import TABLES_NAME, ChartDataStore
+from embedding_cache import install_embedding_cache, report_embedding_cache
+from index_store import IndexStore
+from inkscape_service import configure_conversion_service
+from chart_pages import detect_chart_pages
+from ingestion import (
+    chart_page_svg,
+    convert_pdf_to_svg,
+    file_sha256,
+    generate_chart_data_from_svg,
+    generate_pdf_from_svg,
+    load_chart_documents,
+    tag_documents,
+)
+from tracing import get_tracer
+
+SUPPORTED_EXTENSIONS = (".pdf", ".svg")
+JOURNAL_NAME = "ingest_journal.jsonl"
+STAGES = ("convert", "describe", "load", "index")
+
+
+def discover_documents(source):
+    """
+    Lists the documents to ingest from a directory (searched recursively) or a manifest.
+    A manifest is either a text file with one path per line or a JSON list of paths.
+    Relative manifest entries are resolved against the manifest's directory.
+
+    Parameters:
+    - source (str): Directory or manifest path.
+    """
+    if os.path.isdir(source):
+        found = []
+        for root, _, files in os.walk(source):
+            for name in sorted(files):
+                # Skip the intermediate outputs of earlier runs (e.g. report.pdf.page3.svg)
+                intermediate = any(f"{extension}." in name.lower() for extension in SUPPORTED_EXTENSIONS)
+                if name.lower().endswith(SUPPORTED_EXTENSIONS) and not intermediate:
+                    found.append(os.path.join(root, name))
+        return sorted(found)
+
+    with open(source, encoding="utf-8") as f:
+        content = f.read()
+    if source.lower().endswith(".json"):
+        entries = json.loads(content)
+    else:
+        entries = [line.strip() for line in content.splitlines() if line.strip() and not line.startswith("#")]
+    base = os.path.dirname(os.path.abspath(source))
+    return [entry if os.path.isabs(entry) else os.path.join(base, entry) for entry in entries]
+
+
+class ProgressJournal:
+    """
+    Append-only JSON lines journal of finished stages. A stage that finished for the
+    same file content in an earlier run is skipped when its outputs still exist.
+
+    Parameters:
+    - path (str): Location of the journal file.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.completed = {}
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        # A run killed mid-write leaves a partial last line
+                        continue
+                    if record.get("status") == "ok":
+                        self.completed[(record["sha256"], record["stage"])] = record
+
+    def lookup(self, sha256, stage):
+        record = self.completed.get((sha256, stage))
+        if record and all(os.path.exists(p) for p in _output_paths(record.get("outputs", {}))):
+            return record
+        return None
+
+    def record(self, source, sha256, stage, status, seconds, outputs=None, error=None):
+        record = {
+            "source": source, "sha256": sha256, "stage": stage, "status": status,
+            "seconds": round(seconds, 4), "outputs": outputs or {}, "error": error,
+            "time": time.time(),
+        }
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(record) + "\n")
+        if status == "ok":
+            self.completed[(sha256, stage)] = record
+
+
+@dataclass
+class StageTimings:
+    seconds: dict = field(default_factory=lambda: {stage: [] for stage in STAGES})
+
+    def add(self, stage, seconds, source=None):
+        self.seconds.setdefault(stage, []).append(seconds)
+        # Conversions are timed in the worker processes, so every stage is recorded after the fact
+        get_tracer().record(f"ingest.{stage}", "ingest", seconds, **({"source": source} if source else {}))
+
+    def summary(self):
+        lines = [f"{'stage':<10}{'count':>7}{'total s':>10}{'mean s':>10}{'max s':>10}"]
+        for stage, values in self.seconds.items():
+            if values:
+                lines.append(f"{stage:<10}{len(values):>7}{sum(values):>10.2f}"
+                             f"{sum(values) / len(values):>10.3f}{max(values):>10.3f}")
+        return "\n".join(lines)
+
+
+@dataclass
+class BatchResult:
+    text_index: object = None
+    chart_index: object = None
+    text_docs: list = field(default_factory=list)
+    chart_docs: list = field(default_factory=list)
+    timings: StageTimings = field(default_factory=StageTimings)
+    failures: dict = field(default_factory=dict)
+    skipped: int = 0
+
+
+def _output_paths(outputs):
+    # Outputs are paths or lists of [page, path] pairs
+    for value in outputs.values():
+        if isinstance(value, list):
+            yield from (path for _, path in value)
+        else:
+            yield value
+
+
+def _pages(outputs, key, legacy_key):
+    # Journals of earlier runs hold a single path per document
+    if key in outputs:
+        return outputs[key]
+    return [[None, outputs[legacy_key]]] if outputs.get(legacy_key) else []
+
+
+@dataclass
+class _Document:
+    source: str
+    sha256: str
+    pdf: str = None
+    svgs: list = field(default_factory=list)  # [[page or None, svg path], ...]
+    descriptions: list = field(default_factory=list)  # [[page or None, description path], ...]
+
+
+def _convert(path):
+    """
+    Converts one document in a worker process, the chart pages of a PDF to SVG with
+    Inkscape and an SVG to a searchable PDF, and returns the outputs together with the
+    time spent.
+    """
+    start = time.perf_counter()
+    if path.lower().endswith(".pdf"):
+        output = [[page, convert_pdf_to_svg(path, page, chart_page_svg(path, page))]
+                  for page in detect_chart_pages(path)]
+    else:
+        output = generate_pdf_from_svg(path)
+    return output, time.perf_counter() - start
+
+
+def _run_conversions(documents, journal, timings, failures, workers, retries):
+    pending = []
+    for document in documents:
+        record = journal.lookup(document.sha256, "convert")
+        if record:
+            document.pdf = record["outputs"].get("pdf", document.pdf)
+            document.svgs = _pages(record["outputs"], "svgs", "svg") or document.svgs
+        else:
+            pending.append(document)
+    if not pending:
+        return
+
+    # Each pool process keeps one persistent Inkscape worker for all of its conversions
+    with ProcessPoolExecutor(max_workers=workers, initializer=configure_conversion_service, initargs=(1,)) as pool:
+        attempts = {document.source: 0 for document in pending}
+        futures = {pool.submit(_convert, document.source): document for document in pending}
+        while futures:
+            done, _ = wait(futures, return_when=FIRST_COMPLETED)
+            for future in done:
+                document = futures.pop(future)
+                try:
+                    output, seconds = future.result()
+                except Exception as error:
+                    attempts[document.source] += 1
+                    if attempts[document.source] <= retries:
+                        print(f"Retrying conversion of {document.source} ({error})")
+                        futures[pool.submit(_convert, document.source)] = document
+                    else:
+                        failures[document.source] = f"convert: {error}"
+                        journal.record(document.source, document.sha256, "convert", "failed", 0.0, error=str(error))
+                    continue
+                if document.source.lower().endswith(".pdf"):
+                    document.svgs = output
+                else:
+                    document.pdf = output
+                timings.add("convert", seconds, document.source)
+                journal.record(document.source, document.sha256, "convert", "ok", seconds,
+                               outputs={"pdf": document.pdf, "svgs": document.svgs})
+
+
+async def _describe_chart(document, page, svg, semaphore, retries, client):
+    async with semaphore:
+        for attempt in range(retries + 1):
+            try:
+                return await asyncio.to_thread(generate_chart_data_from_svg, svg, client=client)
+            except Exception as error:
+                if attempt == retries:
+                    raise
+                print(f"Retrying description of {document.source} page {page} ({error})")
+                await asyncio.sleep(2 ** attempt)
+
+
+async def _describe(document, journal, timings, failures, semaphore, retries, client):
+    record = journal.lookup(document.sha256, "describe")
+    if record:
+        document.descriptions = _pages(record["outputs"], "descriptions", "description")
+        return
+    # The chart pages of a document are described concurrently, within the same limit
+    start = time.perf_counter()
+    try:
+        descriptions = await asyncio.gather(*(
+            _describe_chart(document, page, svg, semaphore, retries, client) for page, svg in document.svgs
+        ))
+    except Exception as error:
+        failures[document.source] = f"describe: {error}"
+        journal.record(document.source, document.sha256, "describe", "failed", 0.0, error=str(error))
+        return
+    document.descriptions = [[page, description] for (page, _), description in zip(document.svgs, descriptions)]
+    seconds = time.perf_counter() - start
+    timings.add("describe", seconds, document.source)
+    journal.record(document.source, document.sha256, "describe", "ok", seconds,
+                   outputs={"descriptions": document.descriptions})
+
+
+async def _run_descriptions(documents, journal, timings, failures, concurrency, retries, client):
+    semaphore = asyncio.Semaphore(concurrency)
+    await asyncio.gather(*(
+        _describe(document, journal, timings, failures, semaphore, retries, client)
+        for document in documents
+    ))
+
+
+def _load(document, timings):
+    start = time.perf_counter()
+    text_docs = SimpleDirectoryReader(input_files=[document.pdf]).load_data()
+    chart_docs = load_chart_documents(document.descriptions)
+    tag_documents(text_docs, document.source, document.sha256, "text")
+    tag_documents(chart_docs, document.source, document.sha256, "chart")
+    timings.add("load", time.perf_counter() - start, document.source)
+    return text_docs, chart_docs
+
+
+def _docs_by_source(docs, sources):
+    # Sources without documents of this kind are kept too, so that they are not seen as stale
+    by_source = {source: (sha256, []) for source, sha256 in sources.items()}
+    for doc in docs:
+        by_source[doc.metadata["source_document"]][1].append(doc)
+    return by_source
+
+
+def _merge_index(store, name, docs, sources):
+    """
+    Replaces the documents of the batch sources in the persisted index name, keeping
+    the sources indexed before, saves it and returns the StoredIndex.
+    """
+    stored = store.load_or_create(name)
+    stored.replace_sources(_docs_by_source(docs, sources))
+    store.save(stored)
+    return stored
+
+
+def _merge_chart_data(path, stored, docs, sources):
+    """
+    Replaces the charts of the batch sources in the persisted chart tables. Tables that
+    then do not match the chart index, e.g. written by an interrupted run, are rebuilt
+    from its chart descriptions.
+    """
+    indexed = {source: entry["sha256"] for source, entry in stored.sources.items()}
+    chart_data = ChartDataStore(path)
+    if os.path.exists(path):
+        try:
+            chart_data = ChartDataStore.load(path)
+        except (OSError, ValueError, KeyError) as error:
+            print(f"Rebuilding the chart tables: {error}")
+    for source, (sha256, chart_docs) in _docs_by_source(docs, sources).items():
+        chart_data.replace_from_documents(source, sha256, chart_docs)
+    if chart_data.sources != indexed:
+        chart_data = ChartDataStore.from_nodes(stored.index.docstore.docs.values(), path)
+        chart_data.sources = indexed
+    chart_data.save()
+    return chart_data
+
+
+def ingest_batch(sources, workers=4, llm_concurrency=8, retries=2, journal_path=None,
+                 persist_dir=None, build_index=True, client=None, embed_batch_size=None):
+    """
+    Ingests many PDF and SVG documents at once. Inkscape conversions run in a process
+    pool, chart descriptions run with bounded async concurrency, and the documents of
+    the batch are embedded together and merged into the persisted text and chart
+    indexes, replacing earlier versions of the same sources. Finished stages are
+    journaled so that an interrupted run can be resumed.
+
+    Parameters:
+    - sources (list of str): Paths of PDF or SVG documents.
+    - workers (int): Number of Inkscape worker processes.
+    - llm_concurrency (int): Maximum number of chart descriptions in flight.
+    - retries (int): Retries per document and stage before it is reported as failed.
+    - journal_path (str): Progress journal location, defaults to persist_dir/ingest_journal.jsonl.
+    - persist_dir (str): Directory of the textdata and chartdata indexes the batch is merged
+      into, or None to only build in-memory indexes of the batch.
+    - build_index (bool): Whether to build the indexes after loading the documents.
+    - client: OpenAI compatible client passed to the chart description step.
+    - embed_batch_size (int): Texts per embedding request while building the indexes.
+    """
+    result = BatchResult()
+    journal = ProgressJournal(journal_path or os.path.join(persist_dir or ".", JOURNAL_NAME))
+
+    documents = []
+    for source in sources:
+        if not source.lower().endswith(SUPPORTED_EXTENSIONS) or not os.path.isfile(source):
+            result.failures[source] = "unsupported or missing file"
+            continue
+        is_pdf = source.lower().endswith(".pdf")
+        documents.append(_Document(source, file_sha256(source),
+                                   pdf=source if is_pdf else None, svgs=[] if is_pdf else [[None, source]]))
+    result.skipped = sum(1 for d in documents if journal.lookup(d.sha256, "describe"))
+
+    _run_conversions(documents, journal, result.timings, result.failures, workers, retries)
+    documents = [d for d in documents if d.source not in result.failures]
+
+    asyncio.run(_run_descriptions(documents, journal, result.timings, result.failures,
+                                  llm_concurrency, retries, client))
+    documents = [d for d in documents if d.source not in result.failures]
+
+    loaded = {}
+    for document in documents:
+        try:
+            text_docs, chart_docs = _load(document, result.timings)
+        except Exception as error:
+            result.failures[document.source] = f"load: {error}"
+            continue
+        result.text_docs.extend(text_docs)
+        result.chart_docs.extend(chart_docs)
+        loaded[document.source] = document.sha256
+
+    if build_index and (result.text_docs or result.chart_docs):
+        start = time.perf_counter()
+        embed_model = install_embedding_cache(embed_batch_size=embed_batch_size)
+        store = IndexStore(persist_dir or ".")
+        if persist_dir:
+            result.text_index = _merge_index(store, "textdata", result.text_docs, loaded).index
+            chart_index = _merge_index(store, "chartdata", result.chart_docs, loaded)
+            result.chart_index = chart_index.index
+            _merge_chart_data(os.path.join(persist_dir, TABLES_NAME), chart_index, result.chart_docs, loaded)
+        else:
+            result.text_index = VectorStoreIndex.from_documents(result.text_docs,
+                                                                storage_context=store.new_storage_context())
+            result.chart_index = VectorStoreIndex.from_documents(result.chart_docs,
+                                                                 storage_context=store.new_storage_context())
+        report_embedding_cache(embed_model)
+        result.timings.add("index", time.perf_counter() - start)
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Ingest many PDF/SVG documents into the text and chart indexes.")
+    parser.add_argument("source", help="Directory of documents or manifest file (one path per line, or a JSON list)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 4, help="Inkscape worker processes")
+    parser.add_argument("--llm-concurrency", type=int, default=8, help="Chart descriptions in flight")
+    parser.add_argument("--retries", type=int, default=2, help="Retries per document and stage")
+    parser.add_argument("--persist-dir", default="./test_files", help="Where the textdata/chartdata indexes are written")
+    parser.add_argument("--journal", default=None, help="Progress journal, defaults to <persist-dir>/" + JOURNAL_NAME)
+    parser.add_argument("--embed-batch-size", type=int, default=None, help="Texts per embedding request")
+    parser.add_argument("--no-index", action="store_true", help="Only convert and describe, do not build indexes")
+    args = parser.parse_args(argv)
+
+    sources = discover_documents(args.source)
+    print(f"Ingesting {len(sources)} documents...")
+    result = ingest_batch(
+        sources,
+        workers=args.workers,
+        llm_concurrency=args.llm_concurrency,
+        retries=args.retries,
+        journal_path=args.journal,
+        persist_dir=args.persist_dir,
+        build_index=not args.no_index,
+        embed_batch_size=args.embed_batch_size,
+    )
+    print(result.timings.summary())
+    print(f"{len(sources) - len(result.failures)} ingested, {result.skipped} resumed from journal, "
+          f"{len(result.failures)} failed")
+    for source, error in result.failures.items():
+        print(f"  {source}: {error}")
+    return 1 if result.failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,83 @@
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ann_index import MIN_TRAIN_SIZE, IVFFlatIndex, create_ann_index, exact_search
+
+
+def clustered_vectors(count, dim, clusters, seed=0):
+    """
+    Returns unit-normalized vectors drawn around random centers, which resembles the
+    topical structure of text embeddings better than uniform noise.
+    """
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((clusters, dim)).astype(np.float32)
+    vectors = centers[rng.integers(0, clusters, count)] + 0.6 * rng.standard_normal((count, dim)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def measure(search, vectors, queries, truth, k):
+    found = 0
+    start = time.perf_counter()
+    for query, expected in zip(queries, truth):
+        rows, _ = search(vectors, query, k)
+        found += len(set(rows.tolist()) & expected)
+    seconds = (time.perf_counter() - start) / len(queries)
+    return found / (k * len(queries)), seconds * 1000
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Recall and latency of the ANN indexes against the exact scan.")
+    parser.add_argument("--vectors", type=int, default=50000)
+    parser.add_argument("--dim", type=int, default=1536, help="1536 is the size of OpenAI ada-002 embeddings")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=3, help="similarity_top_k of the query engines")
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[1, 2, 4, 8, 16, 32])
+    parser.add_argument("--ef-search", type=int, nargs="+", default=[16, 32, 64, 128])
+    args = parser.parse_args(argv)
+
+    vectors = clustered_vectors(args.vectors + args.queries, args.dim, clusters=max(8, args.vectors // 500))
+    vectors, queries = vectors[:args.vectors], vectors[args.vectors:]
+    truth = [set(exact_search(vectors, query, args.k)[0].tolist()) for query in queries]
+
+    print(f"{args.vectors} vectors, dim {args.dim}, {args.queries} queries, top {args.k}")
+    print(f"{'index':<28}{'build s':>10}{'recall':>10}{'ms/query':>12}")
+    recall, latency = measure(exact_search, vectors, queries, truth, args.k)
+    print(f"{'exact':<28}{0.0:>10.2f}{recall:>10.3f}{latency:>12.3f}")
+
+    if args.vectors < MIN_TRAIN_SIZE:
+        # The indexes are not trained below this size and every search would be the exact scan
+        print(f"ivf and hnsw skipped: they are only trained from {MIN_TRAIN_SIZE} vectors on")
+        return 0
+
+    ivf = IVFFlatIndex()
+    start = time.perf_counter()
+    ivf.sync(vectors)
+    build = time.perf_counter() - start
+    for nprobe in args.nprobe:
+        ivf.nprobe = nprobe
+        recall, latency = measure(ivf.search, vectors, queries, truth, args.k)
+        print(f"{f'ivf nlist={len(ivf.centroids)} nprobe={nprobe}':<28}{build:>10.2f}{recall:>10.3f}{latency:>12.3f}")
+
+    try:
+        hnsw = create_ann_index("hnsw")
+    except ImportError as error:
+        print(f"hnsw skipped: {error}")
+        return 0
+    start = time.perf_counter()
+    hnsw.sync(vectors)
+    build = time.perf_counter() - start
+    for ef_search in args.ef_search:
+        hnsw.ef_search = ef_search
+        recall, latency = measure(hnsw.search, vectors, queries, truth, args.k)
+        print(f"{f'hnsw ef_search={ef_search}':<28}{build:>10.2f}{recall:>10.3f}{latency:>12.3f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,52 @@
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from chart_render import MAX_LINE_POINTS, render_chart
+
+
+def random_walk(count, seed=0):
+    rng = np.random.default_rng(seed)
+    return np.cumsum(rng.standard_normal(count))
+
+
+def measure(render, repeat):
+    render()  # The first call creates the figure template of the thread
+    start = time.perf_counter()
+    for _ in range(repeat):
+        size = len(render())
+    return (time.perf_counter() - start) / repeat * 1000, size
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Rendering time of the chart tools across series sizes.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 100, 1000, 10000, 100000, 1000000])
+    parser.add_argument("--max-bar-size", type=int, default=100000)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--format", default="png", choices=["png", "svg"])
+    args = parser.parse_args(argv)
+
+    print(f"{'chart':<28}{'points':>10}{'ms':>12}{'bytes':>12}")
+    for size in args.sizes:
+        y = random_walk(size)
+        labelled = {"x": np.arange(2000, 2000 + size), "y": y}
+        cases = [
+            (f"line lttb {MAX_LINE_POINTS}", lambda: render_chart("line", y, format=args.format)),
+            ("line all points", lambda: render_chart("line", y, format=args.format, max_points=None)),
+            ("line x/y columns", lambda: render_chart("line", labelled, format=args.format)),
+        ]
+        if size <= args.max_bar_size:
+            cases.append(("bar", lambda: render_chart("bar", y, format=args.format)))
+        for name, render in cases:
+            milliseconds, size_bytes = measure(render, args.repeat)
+            print(f"{name:<28}{size:>10}{milliseconds:>12.1f}{size_bytes:>12}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,299 @@
+import ast
+import asyncio
+import hashlib
+import os
+import re
+import shutil
+import sys
+import time
+from types import SimpleNamespace
+
+import numpy as np
+from llama_index.core.base.embeddings.base import BaseEmbedding
+from llama_index.core.base.llms.types import (
+    ChatMessage,
+    ChatResponse,
+    CompletionResponse,
+    LLMMetadata,
+    MessageRole,
+)
+from llama_index.core.llms.callbacks import llm_chat_callback, llm_completion_callback
+from llama_index.core.llms.function_calling import FunctionCallingLLM
+from llama_index.core.llms.llm import ToolSelection
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from inkscape_service import ConversionError, ConversionResult
+
+FIXTURES = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "test_files")
+# Canned outputs of the fakes, taken from the outputs of real runs kept in test_files
+FIXTURE_SVG = os.path.join(FIXTURES, "final.pdf.svg")
+FIXTURE_DESCRIPTION = os.path.join(FIXTURES, "final.pdfchart_description.txt")
+
+_WORD_RE = re.compile(r"\w+")
+_TOKEN_RE = re.compile(r"\w{1,4}|[^\w\s]")
+
+
+def fake_tokenizer(text):
+    """
+    Offline stand-in for the tiktoken tokenizer, which downloads its vocabulary on first
+    use: words are cut into pieces of up to four characters, close to real token counts.
+    """
+    return _TOKEN_RE.findall(text)
+
+
+class FakeEmbedding(BaseEmbedding):
+    """
+    Offline embedding model hashing the words of a text into dim buckets, so that texts
+    sharing words are similar and retrieval results stay meaningful.
+
+    Parameters:
+    - dim (int): Size of the embeddings.
+    - latency (float): Seconds every embedding request sleeps, to model the API round trip.
+    """
+
+    dim: int = 256
+    latency: float = 0.0
+
+    def __init__(self, dim=256, latency=0.0, **kwargs):
+        super().__init__(model_name="fake-embedding", dim=dim, latency=latency, **kwargs)
+
+    @classmethod
+    def class_name(cls):
+        return "FakeEmbedding"
+
+    def _embed(self, text):
+        vector = np.zeros(self.dim, dtype=np.float32)
+        for word in _WORD_RE.findall(text.lower()):
+            digest = hashlib.blake2b(word.encode("utf-8"), digest_size=8).digest()
+            vector[int.from_bytes(digest[:4], "little") % self.dim] += 1.0 if digest[4] & 1 else -1.0
+        norm = np.linalg.norm(vector)
+        return (vector / norm if norm else vector).tolist()
+
+    def _get_text_embeddings(self, texts):
+        if self.latency:
+            time.sleep(self.latency)
+        return [self._embed(text) for text in texts]
+
+    def _get_text_embedding(self, text):
+        return self._get_text_embeddings([text])[0]
+
+    def _get_query_embedding(self, query):
+        return self._get_text_embeddings([query])[0]
+
+    async def _aget_query_embedding(self, query):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return self._embed(query)
+
+    async def _aget_text_embeddings(self, texts):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return [self._embed(text) for text in texts]
+
+
+class FakeLLM(FunctionCallingLLM):
+    """
+    Offline function calling LLM following a fixed script. The first turn after a user
+    message calls the textdata, chartdata and chart_table tools at once, a question
+    asking for a chart then calls a chart creator with the chart_table points, and the
+    last turn answers with a canned text. Without tools, e.g. in response synthesis, it
+    answers with the end of the prompt.
+
+    Parameters:
+    - latency (float): Seconds every call sleeps, to model the API round trip.
+    """
+
+    latency: float = 0.0
+    calls: int = 0
+
+    def __init__(self, latency=0.0, **kwargs):
+        super().__init__(latency=latency, **kwargs)
+
+    @classmethod
+    def class_name(cls):
+        return "FakeLLM"
+
+    @property
+    def metadata(self):
+        return LLMMetadata(context_window=128000, num_output=1024, is_chat_model=True,
+                           is_function_calling_model=True, model_name="fake-llm")
+
+    def _prepare_chat_with_tools(self, tools, user_msg=None, chat_history=None, verbose=False,
+                                 allow_parallel_tool_calls=False, **kwargs):
+        messages = list(chat_history or [])
+        if user_msg is not None:
+            messages.append(ChatMessage(role=MessageRole.USER, content=str(user_msg)) if isinstance(user_msg, str)
+                            else user_msg)
+        return {"messages": messages, "tools": [tool.metadata.name for tool in tools]}
+
+    def get_tool_calls_from_response(self, response, error_on_no_tool_call=True, **kwargs):
+        tool_calls = response.message.additional_kwargs.get("tool_calls", [])
+        if not tool_calls and error_on_no_tool_call:
+            raise ValueError("Expected at least one tool call")
+        return tool_calls
+
+    def _next_turn(self, messages, tools):
+        question = next((m.content for m in reversed(messages) if m.role == MessageRole.USER), "") or ""
+        turn = 0
+        for message in reversed(messages):
+            if message.role == MessageRole.USER:
+                break
+            if message.role == MessageRole.ASSISTANT:
+                turn += 1
+
+        calls = []
+        if turn == 0:
+            calls = [("textdata", {"input": question}), ("chartdata", {"input": question}),
+                     ("chart_table", {"operation": "points"})]
+        elif turn == 1 and re.search(r"\b(chart|plot|graph)\b", question, re.IGNORECASE):
+            points = self._last_points(messages)
+            if points:
+                creator = "line_chart_creator" if "line" in question.lower() else "bar_chart_creator"
+                calls = [(creator, {"data": points, "title": "Benchmark chart", "x_label": "Year", "y_label": "Value"})]
+        calls = [(name, kwargs) for name, kwargs in calls if name in tools]
+        if calls:
+            tool_calls = [ToolSelection(tool_id=f"call_{self.calls}_{i}", tool_name=name, tool_kwargs=kwargs)
+                          for i, (name, kwargs) in enumerate(calls)]
+            return ChatMessage(role=MessageRole.ASSISTANT, content="", additional_kwargs={"tool_calls": tool_calls})
+        tool_results = sum(1 for m in messages if m.role == MessageRole.TOOL)
+        return ChatMessage(role=MessageRole.ASSISTANT,
+                           content=f"Canned answer to '{question}' from {tool_results} tool results.")
+
+    @staticmethod
+    def _last_points(messages):
+        # chart_table returns a list of charts, each with its points under "data"
+        for message in reversed(messages):
+            if message.role == MessageRole.TOOL and message.additional_kwargs.get("name") == "chart_table":
+                try:
+                    charts = ast.literal_eval(message.content)
+                except (ValueError, SyntaxError):
+                    return None
+                series = [c["data"] for c in charts if isinstance(c, dict) and c.get("data")] \
+                    if isinstance(charts, list) else []
+                return max(series, key=len) if series else None
+        return None
+
+    def _respond(self, messages, tools):
+        self.calls += 1
+        if tools is not None:
+            message = self._next_turn(list(messages), tools)
+        else:
+            prompt = "\n".join(str(m.content) for m in messages)
+            message = ChatMessage(role=MessageRole.ASSISTANT, content=prompt[-300:])
+        # Token counts as the OpenAI client reports them, for the tracing spans
+        prompt_tokens = sum(len(fake_tokenizer(str(m.content or ""))) for m in messages)
+        completion_tokens = len(fake_tokenizer(message.content or ""))
+        return ChatResponse(message=message, additional_kwargs={
+            "prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens})
+
+    @llm_chat_callback()
+    def chat(self, messages, **kwargs):
+        if self.latency:
+            time.sleep(self.latency)
+        return self._respond(messages, kwargs.get("tools"))
+
+    @llm_chat_callback()
+    async def achat(self, messages, **kwargs):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return self._respond(messages, kwargs.get("tools"))
+
+    @llm_completion_callback()
+    def complete(self, prompt, formatted=False, **kwargs):
+        if self.latency:
+            time.sleep(self.latency)
+        response = self._respond([ChatMessage(role=MessageRole.USER, content=prompt)], None)
+        return CompletionResponse(text=response.message.content, additional_kwargs=response.additional_kwargs)
+
+    @llm_completion_callback()
+    async def acomplete(self, prompt, formatted=False, **kwargs):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        response = self._respond([ChatMessage(role=MessageRole.USER, content=prompt)], None)
+        return CompletionResponse(text=response.message.content, additional_kwargs=response.additional_kwargs)
+
+    def stream_chat(self, messages, **kwargs):
+        response = self.chat(messages, **kwargs)
+        yield ChatResponse(message=response.message, delta=response.message.content)
+
+    async def astream_chat(self, messages, **kwargs):
+        response = await self.achat(messages, **kwargs)
+
+        async def gen():
+            yield ChatResponse(message=response.message, delta=response.message.content)
+        return gen()
+
+    def stream_complete(self, prompt, formatted=False, **kwargs):
+        response = self.complete(prompt, formatted, **kwargs)
+        yield CompletionResponse(text=response.text, delta=response.text)
+
+    async def astream_complete(self, prompt, formatted=False, **kwargs):
+        response = self.complete(prompt, formatted, **kwargs)
+
+        async def gen():
+            yield CompletionResponse(text=response.text, delta=response.text)
+        return gen()
+
+
+class FakeOpenAIClient:
+    """
+    Stands in for the openai module in chart descriptions: chat.completions.create
+    returns a canned chart description.
+
+    Parameters:
+    - description (str): The text every request returns, the description fixture by default.
+    - latency (float): Seconds every request sleeps.
+    """
+
+    def __init__(self, description=None, latency=0.0):
+        if description is None:
+            with open(FIXTURE_DESCRIPTION, encoding="utf-8") as f:
+                description = f.read()
+        self.description = description
+        self.latency = latency
+        self.requests = 0
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create))
+
+    def _create(self, model, messages, **kwargs):
+        self.requests += 1
+        if self.latency:
+            time.sleep(self.latency)
+        message = SimpleNamespace(content=self.description)
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)])
+
+
+class StubConversionService:
+    """
+    Replaces the Inkscape conversion service: every PDF page "converts" to the SVG
+    fixture, and SVGs cannot be rendered, like on a container without Inkscape.
+
+    Parameters:
+    - svg_file (str): SVG written for every converted PDF page.
+    - latency (float): Seconds every conversion sleeps, to model the Inkscape call.
+    """
+
+    executable = None
+
+    def __init__(self, svg_file=FIXTURE_SVG, latency=0.0):
+        self.svg_file = svg_file
+        self.latency = latency
+
+    def convert(self, input_file, output, page=None):
+        start = time.perf_counter()
+        if not output.lower().endswith(".svg"):
+            raise ConversionError(f"The stub converter only converts PDF pages to SVG, not to {output}")
+        if self.latency:
+            time.sleep(self.latency)
+        shutil.copyfile(self.svg_file, output)
+        return ConversionResult(output, "", "", time.perf_counter() - start, "stub")
+
+    def pdf_to_svg(self, pdf_file, output=None, page=None):
+        return self.convert(pdf_file, output or pdf_file + ".svg", page)
+
+    def svg_to_pdf(self, svg_file, output=None):
+        return self.convert(svg_file, output or svg_file + ".pdf")
+
+    def close(self):
+        pass
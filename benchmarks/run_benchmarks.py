@@ -0,0 +1,402 @@
+import argparse
+import contextlib
+import cProfile
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from llama_index.core import Settings, VectorStoreIndex
+from llama_index.core.schema import TextNode
+
+import inkscape_service
+import ingestion
+from ann_index import MIN_TRAIN_SIZE
+from artifact_store import artifact_session, get_artifact_store
+from batch_ingest import STAGES, ingest_batch
+from chart_render import render_chart
+from embedding_cache import EmbeddingCache, install_embedding_cache
+from fakes import (
+    FIXTURE_DESCRIPTION,
+    FIXTURES,
+    FakeEmbedding,
+    FakeLLM,
+    FakeOpenAIClient,
+    StubConversionService,
+    fake_tokenizer,
+)
+from index_store import IndexStore
+from tracing import get_tracer
+
+SUITES = ("ingest", "index_load", "retrieval", "render", "agent")
+DEFAULT_FIXTURES = ("final.pdf", "Inflation2024_data_chart.pdf", "Inflation2024_report.pdf",
+                    "bar_chart.svg", "inflation-percentage-new.svg")
+DEFAULT_QUESTIONS = (
+    "What was the inflation rate in 2022?",
+    "Create a bar chart of the inflation data.",
+    "Summarize what the document says about prices.",
+)
+# A p50 more than TOLERANCE slower than the baseline is a regression, unless the
+# difference is below MIN_DELTA_MS, which is timer noise on the small metrics
+TOLERANCE = 0.2
+MIN_DELTA_MS = 1.0
+
+
+def summarize(seconds):
+    """
+    Returns the statistics of a list of timings in seconds, in milliseconds.
+    """
+    ms = np.asarray(seconds, dtype=np.float64) * 1000
+    return {
+        "n": int(ms.size),
+        "mean_ms": float(ms.mean()),
+        "p50_ms": float(np.percentile(ms, 50)),
+        "p95_ms": float(np.percentile(ms, 95)),
+        "min_ms": float(ms.min()),
+        "max_ms": float(ms.max()),
+    }
+
+
+def timed(fn, *args, **kwargs):
+    start = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+@contextlib.contextmanager
+def profiled(name, profiler, directory):
+    """
+    Profiles the block with cProfile or pyinstrument and writes the profile of name to
+    directory, as a .prof file for snakeviz/pstats or as an HTML page.
+    """
+    if profiler is None:
+        yield
+        return
+    os.makedirs(directory, exist_ok=True)
+    if profiler == "cprofile":
+        profile = cProfile.Profile()
+        profile.enable()
+        try:
+            yield
+        finally:
+            profile.disable()
+            path = os.path.join(directory, f"{name}.prof")
+            profile.dump_stats(path)
+            print(f"Profile of {name} written to {path}")
+    else:
+        from pyinstrument import Profiler
+        profile = Profiler()
+        profile.start()
+        try:
+            yield
+        finally:
+            profile.stop()
+            path = os.path.join(directory, f"{name}.html")
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(profile.output_html())
+            print(f"Profile of {name} written to {path}")
+
+
+class Bench:
+    """
+    Runs the suites against the offline fakes inside workdir and collects the metrics.
+    Nothing outside workdir is written: the description and embedding caches, the
+    artifact store and the indexes all live below it.
+
+    Parameters:
+    - workdir (str): Scratch directory of the run.
+    - args (Namespace): The command line options.
+    """
+
+    def __init__(self, workdir, args):
+        self.workdir = workdir
+        self.args = args
+        self.metrics = {}
+        self.info = {}
+        self._index = None
+
+        # The tokenizers and all remote services are replaced before anything uses them
+        Settings.tokenizer = fake_tokenizer
+        Settings.embed_model = FakeEmbedding(latency=args.latency)
+        install_embedding_cache(EmbeddingCache(self.path("cache", "embeddings")))
+        Settings.llm = FakeLLM(latency=args.latency)
+        self.client = FakeOpenAIClient(latency=args.latency)
+        ingestion.description_cache.cache_dir = self.path("cache", "descriptions")
+        # Set before the conversion pool forks, so that every worker process builds a stub too
+        inkscape_service._service_factory = lambda workers: StubConversionService(latency=args.latency)
+        inkscape_service.configure_conversion_service(inkscape_service.DEFAULT_WORKERS)
+        get_artifact_store().root = self.path("artifacts")
+
+    def path(self, *parts):
+        return os.path.join(self.workdir, *parts)
+
+    def record(self, name, seconds):
+        self.metrics[name] = summarize(seconds)
+
+    def clear_caches(self):
+        shutil.rmtree(self.path("cache"), ignore_errors=True)
+
+    def ingest(self, run):
+        """
+        Ingests fresh copies of the fixtures into their own directory and returns the
+        BatchResult, the copied sources and the index directory.
+        """
+        documents = self.path(f"ingest-{run}", "documents")
+        os.makedirs(documents, exist_ok=True)
+        sources = []
+        for name in self.args.fixtures:
+            sources.append(os.path.join(documents, name))
+            shutil.copyfile(os.path.join(FIXTURES, name), sources[-1])
+        persist_dir = self.path(f"ingest-{run}", "index")
+        result = ingest_batch(sources, workers=self.args.workers, persist_dir=persist_dir, client=self.client)
+        for source, error in result.failures.items():
+            print(f"Ingestion of {source} failed: {error}")
+        return result, sources, persist_dir
+
+    def index(self):
+        # The index the index_load and agent suites read, ingested once if the ingest suite did not run
+        if self._index is None:
+            _, sources, persist_dir = self.ingest("setup")
+            self._index = sources, persist_dir
+        return self._index
+
+    def app_context(self):
+        from CQP_MVP import AppContext
+        sources, persist_dir = self.index()
+        return AppContext(persist_dir, sources, llm=Settings.llm)
+
+    def run_ingest(self):
+        """
+        Cold ingestion of the fixtures, the caches are emptied before every run.
+        """
+        stages = {stage: [] for stage in STAGES}
+        totals = []
+        for run in range(self.args.repeat):
+            self.clear_caches()
+            (result, sources, persist_dir), seconds = timed(self.ingest, run)
+            totals.append(seconds)
+            for stage, values in result.timings.seconds.items():
+                stages.setdefault(stage, []).append(sum(values))
+            self.info["ingest.failures"] = len(result.failures)
+            self.info["ingest.text_docs"] = len(result.text_docs)
+            self.info["ingest.chart_docs"] = len(result.chart_docs)
+            self._index = sources, persist_dir
+        self.info["ingest.description_requests"] = self.client.requests
+        for stage, values in stages.items():
+            self.record(f"ingest.{stage}", values)
+        self.record("ingest.total", totals)
+
+    def run_index_load(self):
+        """
+        Startup of a fresh application context over the ingested index, part by part.
+        """
+        parts = ("embed_model", "indexes", "chart_data", "query_engine_tools", "obj_index")
+        samples = {part: [] for part in parts}
+        for _ in range(self.args.repeat):
+            context = self.app_context()
+            # Touching the parts in dependency order keeps every timing exclusive
+            context.embed_model, context.stored_indexes, context.chart_data
+            context.query_engine_tools, context.obj_index
+            for part in parts:
+                samples[part].append(context.timings[part])
+        for part, values in samples.items():
+            self.record(f"index_load.{part}", values)
+        self.record("index_load.total", [sum(values) for values in zip(*samples.values())])
+
+    def corpus(self, size, seed=0):
+        """
+        Returns size nodes of random sentences over the vocabulary of the chart
+        description fixture, embedded with the fake model.
+        """
+        with open(FIXTURE_DESCRIPTION, encoding="utf-8") as f:
+            vocabulary = sorted(set(f.read().split()))
+        rng = np.random.default_rng(seed)
+        texts = [" ".join(rng.choice(vocabulary, 40)) for _ in range(size)]
+        embed_model = FakeEmbedding()
+        return [TextNode(id_=f"node-{i}", text=text, embedding=embed_model._embed(text))
+                for i, text in enumerate(texts)], vocabulary
+
+    def run_retrieval(self):
+        """
+        Query latency of the vector store at growing corpus sizes, for every ANN kind.
+        """
+        for size in self.args.corpus_sizes:
+            nodes, vocabulary = self.corpus(size)
+            rng = np.random.default_rng(size)
+            queries = [" ".join(rng.choice(vocabulary, 12)) for _ in range(self.args.queries)]
+            for ann in self.args.ann:
+                # Smaller corpora are searched exactly whatever the ANN kind, their rows say so
+                label = ann if ann == "exact" or size >= MIN_TRAIN_SIZE else f"{ann}-untrained"
+                store = IndexStore(self.path("retrieval", f"{ann}-{size}"), ann=ann)
+                index, seconds = timed(VectorStoreIndex, nodes, storage_context=store.new_storage_context())
+                self.record(f"retrieval.build.{label}.{size}", [seconds])
+                retriever = index.as_retriever(similarity_top_k=3)
+                retriever.retrieve(queries[0])  # Trains the ANN index, if any
+                self.record(f"retrieval.query.{label}.{size}",
+                            [timed(retriever.retrieve, query)[1] for query in queries])
+
+    def run_render(self):
+        """
+        Rendering time of the chart tools across series sizes.
+        """
+        rng = np.random.default_rng(0)
+        for size in self.args.render_sizes:
+            values = np.cumsum(rng.standard_normal(size))
+            for kind in ("bar", "line"):
+                render_chart(kind, values)  # The first call creates the figure template of the thread
+                self.record(f"render.{kind}.{size}",
+                            [timed(render_chart, kind, values)[1] for _ in range(self.args.repeat)])
+
+    def run_agent(self):
+        """
+        Full agent.chat turns over the fixture index, each repeat with a new conversation.
+        The spans traced during the turns give the time per tool, LLM call and retrieval.
+        """
+        context = self.app_context()
+        context.agent  # The startup is measured by index_load
+        turns, first = [], []
+        calls = Settings.llm.calls
+        since = time.time()
+        for _ in range(self.args.repeat):
+            agent = context.new_agent()
+            for i, question in enumerate(self.args.questions):
+                with artifact_session("benchmark"):
+                    _, seconds = timed(agent.chat, question)
+                turns.append(seconds)
+                if i == 0:
+                    first.append(seconds)
+        self.info["agent.llm_calls_per_turn"] = (Settings.llm.calls - calls) / len(turns)
+        self.record("agent.turn", turns)
+        self.record("agent.first_turn", first)
+
+        spans = {}
+        for span in list(get_tracer().spans):
+            if span.start >= since and span.kind in ("tool", "llm", "retrieval"):
+                spans.setdefault(f"agent.{span.kind}.{span.name}", []).append(span)
+        for name, group in sorted(spans.items()):
+            self.record(name, [span.duration for span in group])
+        prompt_tokens = sum(span.attributes.get("prompt_tokens", 0) for span in spans.get("agent.llm.chat", []))
+        self.info["agent.prompt_tokens_per_turn"] = prompt_tokens / len(turns)
+
+    def run(self, suite):
+        with profiled(suite, self.args.profile, self.args.profile_dir):
+            getattr(self, f"run_{suite}")()
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(metrics, baseline, tolerance=TOLERANCE, min_delta_ms=MIN_DELTA_MS):
+    """
+    Returns (name, baseline p50, current p50) for every metric whose p50 is more than
+    tolerance slower than in the baseline results.
+    """
+    regressions = []
+    for name, stats in metrics.items():
+        base = baseline.get("metrics", {}).get(name)
+        if base is None:
+            continue
+        if stats["p50_ms"] > base["p50_ms"] * (1 + tolerance) and stats["p50_ms"] - base["p50_ms"] > min_delta_ms:
+            regressions.append((name, base["p50_ms"], stats["p50_ms"]))
+    return regressions
+
+
+def report(metrics, baseline=None):
+    lines = [f"{'metric':<36}{'n':>5}{'p50 ms':>12}{'p95 ms':>12}{'baseline':>12}{'change':>9}"]
+    for name, stats in metrics.items():
+        line = f"{name:<36}{stats['n']:>5}{stats['p50_ms']:>12.2f}{stats['p95_ms']:>12.2f}"
+        base = (baseline or {}).get("metrics", {}).get(name)
+        if base:
+            change = (stats["p50_ms"] / base["p50_ms"] - 1) * 100 if base["p50_ms"] else 0.0
+            line += f"{base['p50_ms']:>12.2f}{change:>+8.0f}%"
+        lines.append(line)
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Offline end-to-end benchmarks with fake OpenAI and Inkscape services.")
+    parser.add_argument("--suites", nargs="+", choices=SUITES, default=list(SUITES))
+    parser.add_argument("--repeat", type=int, default=3, help="Runs of every measurement")
+    parser.add_argument("--fixtures", nargs="+", default=list(DEFAULT_FIXTURES), help="Files of test_files to ingest")
+    parser.add_argument("--workers", type=int, default=2, help="Conversion worker processes")
+    parser.add_argument("--corpus-sizes", type=int, nargs="+", default=[2000, 10000],
+                        help=f"Nodes per corpus, ANN indexes are only trained from {MIN_TRAIN_SIZE} on")
+    parser.add_argument("--ann", nargs="+", default=["exact", "ivf"], help="ANN indexes measured by retrieval")
+    parser.add_argument("--queries", type=int, default=50, help="Queries per corpus size")
+    parser.add_argument("--render-sizes", type=int, nargs="+", default=[100, 10000, 100000])
+    parser.add_argument("--questions", nargs="+", default=list(DEFAULT_QUESTIONS))
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds every fake API call sleeps")
+    parser.add_argument("--output", help="Write the results as JSON to this file")
+    parser.add_argument("--baseline", help="Results JSON of an earlier run to compare against")
+    parser.add_argument("--tolerance", type=float, default=TOLERANCE, help="Allowed p50 slowdown, 0.2 is 20%%")
+    parser.add_argument("--profile", choices=("cprofile", "pyinstrument"), help="Profile every suite")
+    parser.add_argument("--profile-dir", default="./profiles")
+    parser.add_argument("--workdir", help="Scratch directory, a temporary one that is removed by default")
+    args = parser.parse_args(argv)
+
+    if args.profile == "pyinstrument":
+        try:
+            import pyinstrument  # noqa: F401
+        except ImportError:
+            parser.error("pyinstrument is not installed, pip install pyinstrument or use --profile cprofile")
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix="cqp-bench-")
+    bench = Bench(workdir, args)
+    started = time.time()
+    try:
+        for suite in args.suites:
+            print(f"Running {suite}")
+            bench.run(suite)
+    finally:
+        if not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    results = {
+        "meta": {
+            "started": started,
+            "seconds": time.time() - started,
+            "commit": git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "options": {key: value for key, value in vars(args).items()
+                        if key not in ("output", "baseline", "workdir")},
+        },
+        "info": bench.info,
+        "metrics": bench.metrics,
+    }
+    print(report(bench.metrics, baseline))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        print(f"Results written to {args.output}")
+
+    if baseline is not None:
+        regressions = compare(bench.metrics, baseline, args.tolerance)
+        for name, before, after in regressions:
+            print(f"Regression: {name} p50 {before:.2f} ms -> {after:.2f} ms")
+        if regressions:
+            return 1
+        print(f"No regression beyond {args.tolerance:.0%} against {args.baseline}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
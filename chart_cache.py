@@ -0,0 +1,157 @@
+import hashlib
+import os
+import re
+import threading
+
+# Default location and size budget of the on-disk chart description cache
+CACHE_DIR = "./cache/chart_descriptions"
+MAX_CACHE_BYTES = 64 * 1024 * 1024
+# Eviction frees the cache down to this fraction of max_bytes, so that the directory is
+# scanned again only after that much has been written, not on every write
+EVICT_TARGET = 0.9
+
+_COMMENT_RE = re.compile(r"<!--.*?-->", re.DOTALL)
+_BETWEEN_TAGS_RE = re.compile(r">\s+<")
+_WHITESPACE_RE = re.compile(r"\s+")
+
+
+def normalize_svg(svg_text):
+    """
+    Normalizes SVG markup so that cosmetic differences (comments, indentation,
+    line endings) do not change the cache key of an otherwise identical chart.
+
+    Parameters:
+    - svg_text (str): The raw SVG markup.
+    """
+    svg_text = _COMMENT_RE.sub("", svg_text)
+    svg_text = _BETWEEN_TAGS_RE.sub("><", svg_text)
+    svg_text = _WHITESPACE_RE.sub(" ", svg_text)
+    return svg_text.strip()
+
+
+def cache_key(svg_text, prompt, model):
+    """
+    Builds the content address of a chart description from the normalized SVG,
+    the prompt text and the model name.
+
+    Parameters:
+    - svg_text (str): The raw SVG markup.
+    - prompt (str): The system prompt sent with the SVG.
+    - model (str): The name of the model that produces the description.
+    """
+    digest = hashlib.sha256()
+    for part in (normalize_svg(svg_text), prompt, model):
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+class DescriptionCache:
+    """
+    Persistent cache of chart descriptions stored as one text file per key.
+    Entries are evicted least-recently-used first once the total size of the
+    cache directory exceeds max_bytes. The cache can be shared by threads, e.g. the
+    pages of a PDF described in parallel.
+
+    Parameters:
+    - cache_dir (str): Directory holding the cached descriptions.
+    - max_bytes (int): Size budget of the cache directory in bytes.
+    """
+
+    suffix = ".txt"
+
+    def __init__(self, cache_dir=CACHE_DIR, max_bytes=MAX_CACHE_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        # Size of the cache directory as of the last scan plus the entries written since
+        self._bytes = None
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key + self.suffix)
+
+    def _count(self, hit, stats=None):
+        key = "hits" if hit else "misses"
+        with self._lock:
+            setattr(self, key, getattr(self, key) + 1)
+            if stats is not None:
+                stats[key] = stats.get(key, 0) + 1
+
+    def get(self, key, stats=None):
+        """
+        Returns the cached description for key, or None on a miss.
+
+        Parameters:
+        - key (str): The cache key, see cache_key.
+        - stats (dict): Hit and miss counters of the caller, counted in besides the totals.
+        """
+        path = self._path(key)
+        try:
+            with open(path, encoding="utf-8") as f:
+                description = f.read()
+        except FileNotFoundError:
+            self._count(False, stats)
+            return None
+        # Refresh the access time used for LRU eviction
+        os.utime(path)
+        self._count(True, stats)
+        return description
+
+    def put(self, key, description):
+        """
+        Stores description under key and evicts old entries if needed.
+        """
+        os.makedirs(self.cache_dir, exist_ok=True)
+        path = self._path(key)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        data = description.encode("utf-8")
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+        self._written(len(data))
+        self.evict()
+
+    def _written(self, size):
+        with self._lock:
+            if self._bytes is not None:
+                self._bytes += size
+
+    def evict(self):
+        """
+        Removes the least recently used entries once the cache exceeds max_bytes, down to
+        EVICT_TARGET of it. The directory is only scanned on the first call and when the
+        size tracked since the last scan exceeds max_bytes. Entries written by other
+        processes count from the next scan on.
+        """
+        if self._bytes is not None and self._bytes <= self.max_bytes:
+            return
+        if not os.path.isdir(self.cache_dir):
+            self._bytes = 0
+            return
+        entries = []
+        total = 0
+        for entry in os.scandir(self.cache_dir):
+            if entry.is_file() and entry.name.endswith(self.suffix):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+                total += stat.st_size
+        entries.sort()
+        target = self.max_bytes * EVICT_TARGET if total > self.max_bytes else self.max_bytes
+        for _, size, path in entries:
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+        self._bytes = total
+
+    def stats(self):
+        """
+        Returns the hit and miss counters since the cache was created as a dictionary.
+        """
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses}
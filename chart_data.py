@@ -0,0 +1,380 @@
+import json
+import os
+import re
+from dataclasses import dataclass, field
+
+import numpy as np
+
+# Location of the persisted chart tables below the index store root
+TABLES_NAME = "chart_tables.npz"
+OPERATIONS = ("lookup", "range", "points", "min", "max", "mean", "sum", "count", "change", "charts")
+
+_TITLE_RE = re.compile(r'Title(?: of the chart is|:)\s*"(.+?)"')
+_X_LABEL_RE = re.compile(r'X-axis is labell?ed "(.+?)"')
+_Y_LABEL_RE = re.compile(r'Y-axis is labell?ed "(.+?)"')
+_UNITS_RE = re.compile(r"\(([^()]*)\)\s*$")
+_BULLET_RE = re.compile(r"^\s*[•*-]\s*(.+?)\s*$")
+_VERB_RE = re.compile(r"^(.+?)\s+(?:was|is|has|scores?|sits|ends|drops|falls|rises|reaches|stands|shoots)\s+(.*)$")
+_VALUE_RE = re.compile(r"(\$)?\s*(-?\d[\d,]*\.?\d*|-?\.\d+)\s*(%)?")
+# x labels are short, longer left-hand sides are sentences about the chart
+MAX_X_WORDS = 4
+# Bullets describing the chart rather than a data point
+_NOT_POINTS = ("chart ", "the chart", "x-axis", "y-axis", "data points", "the line", "each ", "there ", "the labels")
+
+
+@dataclass
+class ChartTable:
+    """
+    The data points of one chart as NumPy columns.
+
+    Parameters:
+    - title (str): Title of the chart.
+    - x_label (str): Label of the x-axis.
+    - y_label (str): Label of the y-axis.
+    - units (str): Unit of the values, e.g. "%" or "$".
+    - series (np.ndarray of str): Series name of every point.
+    - x (np.ndarray of str): x label of every point.
+    - y (np.ndarray of float): Value of every point.
+    """
+    title: str = None
+    x_label: str = None
+    y_label: str = None
+    units: str = None
+    series: np.ndarray = field(default_factory=lambda: np.zeros(0, dtype=str))
+    x: np.ndarray = field(default_factory=lambda: np.zeros(0, dtype=str))
+    y: np.ndarray = field(default_factory=lambda: np.zeros(0, dtype=np.float64))
+
+
+def _number(text):
+    match = _VALUE_RE.search(text)
+    if not match:
+        return None, None
+    try:
+        value = float(match.group(2).replace(",", ""))
+    except ValueError:
+        return None, None
+    return value, "%" if match.group(3) else "$" if match.group(1) else None
+
+
+def parse_description(text):
+    """
+    Reads the data points back out of a chart description in the bullet style written
+    by the SVG extractor and requested from the LLM, e.g. "• Year 2015 was 1.5." or
+    "• Year 2015: Inflation rate approx. 2%.". Returns a ChartTable, empty if the text
+    has no data points.
+
+    Parameters:
+    - text (str): The chart description.
+    """
+    title = _TITLE_RE.search(text)
+    x_label = _X_LABEL_RE.search(text)
+    y_label = _Y_LABEL_RE.search(text)
+    table = ChartTable(
+        title=title and title.group(1),
+        x_label=x_label and x_label.group(1),
+        y_label=y_label and y_label.group(1),
+    )
+    x_prefix = (table.x_label or "Year").lower() + " "
+
+    series, xs, ys, units = [], [], [], []
+    for line in text.splitlines():
+        bullet = _BULLET_RE.match(line)
+        if not bullet or bullet.group(1).lower().startswith(_NOT_POINTS):
+            continue
+        body = bullet.group(1).rstrip(".")
+        verb = _VERB_RE.match(body)
+        if verb:
+            left, right = verb.groups()
+        elif ":" in body:
+            left, right = body.split(":", 1)
+        else:
+            continue
+        name = ""
+        if ": " in left:
+            # Multi-series points are written as "series: x was y"
+            name, left = left.split(": ", 1)
+        x = left.strip()
+        if x.lower().startswith(x_prefix):
+            x = x[len(x_prefix):]
+        value, unit = _number(right)
+        if value is None or not x or len(x.split()) > MAX_X_WORDS:
+            continue
+        series.append(name.strip())
+        xs.append(x)
+        ys.append(value)
+        units.append(unit)
+
+    label_units = table.y_label and _UNITS_RE.search(table.y_label)
+    table.units = (label_units and label_units.group(1)) or next((u for u in units if u), None)
+    table.series = np.array(series, dtype=str)
+    table.x = np.array(xs, dtype=str)
+    table.y = np.array(ys, dtype=np.float64)
+    return table
+
+
+def _x_numbers(x):
+    numbers = np.full(len(x), np.nan)
+    for i, label in enumerate(x):
+        try:
+            numbers[i] = float(str(label).replace(",", ""))
+        except ValueError:
+            pass
+    return numbers
+
+
+@dataclass
+class _ChunkedDocument:
+    # A chart description document rebuilt from its chunks
+    id_: str
+    metadata: dict
+    text: str
+
+
+class ChartDataStore:
+    """
+    Columnar store of the data points of all indexed charts. Every point is one row of
+    the chart, series, x, x_num and y arrays, and charts holds the title, axis labels,
+    units and source document of every chart. Lookups, ranges and aggregations run as
+    NumPy masks over the columns, so numeric questions are answered without retrieval
+    or an LLM call.
+
+    Parameters:
+    - path (str): Where the store is persisted, or None to keep it in memory.
+    """
+
+    def __init__(self, path=None):
+        self.path = path
+        self.charts = []
+        self.sources = {}
+        self.chart = np.zeros(0, dtype=np.int32)
+        self.series = np.zeros(0, dtype=str)
+        self.x = np.zeros(0, dtype=str)
+        self.x_num = np.zeros(0, dtype=np.float64)
+        self.y = np.zeros(0, dtype=np.float64)
+
+    def __len__(self):
+        return len(self.y)
+
+    # ------------------------------------------------------------------ #
+    # Updates
+
+    def _remove_charts(self, keep_chart):
+        keep_chart = np.asarray(keep_chart, dtype=bool)
+        renumber = np.cumsum(keep_chart) - 1
+        rows = keep_chart[self.chart] if len(self.chart) else np.zeros(0, dtype=bool)
+        self.charts = [chart for chart, keep in zip(self.charts, keep_chart) if keep]
+        self.chart = renumber[self.chart[rows]].astype(np.int32)
+        self.series, self.x, self.x_num, self.y = self.series[rows], self.x[rows], self.x_num[rows], self.y[rows]
+
+    def add_table(self, table, source=None, sha256=None):
+        """
+        Appends the points of a ChartTable and returns the number of the new chart.
+        """
+        number = len(self.charts)
+        self.charts.append({
+            "title": table.title, "x_label": table.x_label, "y_label": table.y_label,
+            "units": table.units, "source": source, "sha256": sha256,
+        })
+        self.chart = np.concatenate([self.chart, np.full(len(table.y), number, dtype=np.int32)])
+        self.series = np.concatenate([self.series, table.series.astype(str)])
+        self.x = np.concatenate([self.x, table.x.astype(str)])
+        self.x_num = np.concatenate([self.x_num, _x_numbers(table.x)])
+        self.y = np.concatenate([self.y, table.y.astype(np.float64)])
+        return number
+
+    def replace_source(self, source, sha256, tables):
+        """
+        Replaces the charts of source by tables.
+
+        Parameters:
+        - source (str): Path of the source document.
+        - sha256 (str): Hash of the source document.
+        - tables (list of ChartTable): The charts of the source document.
+        """
+        source = os.path.normpath(source)
+        self._remove_charts([chart["source"] != source for chart in self.charts])
+        for table in tables:
+            if len(table.y):
+                self.add_table(table, source, sha256)
+        self.sources[source] = sha256
+
+    def replace_from_documents(self, source, sha256, docs):
+        """
+        Replaces the charts of source by the data points in its chart description documents.
+        """
+        self.replace_source(source, sha256, [parse_description(doc.text) for doc in docs])
+
+    @classmethod
+    def from_documents(cls, docs, path=None):
+        """
+        Builds the store from whole chart description documents. Every document becomes
+        its own chart, e.g. one per chart page of a PDF, and the charts are grouped by
+        source document.
+
+        Parameters:
+        - docs (list of Document): Chart description documents, e.g. the chart documents of a batch.
+        - path (str): Where the store is persisted.
+        """
+        store = cls(path)
+        by_source = {}
+        for doc in docs:
+            source = doc.metadata.get("source_document") or doc.metadata.get("file_path") or doc.id_
+            by_source.setdefault(source, (doc.metadata.get("source_sha256"), []))[1].append(doc.text)
+        for source, (sha256, texts) in by_source.items():
+            store.replace_source(source, sha256, [parse_description(text) for text in texts])
+        return store
+
+    @classmethod
+    def from_nodes(cls, nodes, path=None):
+        """
+        Builds the store from the chunks of a chart index. Chunks overlap, so the text of
+        every chart description document is put back together from the chunk offsets
+        before it is parsed, like the documents replace_from_documents gets.
+        """
+        chunks_by_doc = {}
+        for node in nodes:
+            chunks_by_doc.setdefault(node.ref_doc_id or node.node_id, []).append(node)
+        docs = []
+        for doc_id, chunks in chunks_by_doc.items():
+            chunks.sort(key=lambda n: n.start_char_idx or 0)
+            text, end = "", 0
+            for chunk in chunks:
+                start = chunk.start_char_idx
+                if start is None or chunk.end_char_idx is None:
+                    # Without offsets the overlap is unknown
+                    text += ("\n" if text else "") + chunk.text
+                elif chunk.end_char_idx > end:
+                    text += chunk.text[max(0, end - start):]
+                    end = chunk.end_char_idx
+            docs.append(_ChunkedDocument(doc_id, chunks[0].metadata, text))
+        return cls.from_documents(docs, path)
+
+    # ------------------------------------------------------------------ #
+    # Persistence
+
+    def save(self, path=None):
+        path = path or self.path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            np.savez(f, chart=self.chart, series=self.series, x=self.x, x_num=self.x_num, y=self.y,
+                     meta=np.array(json.dumps({"charts": self.charts, "sources": self.sources})))
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        store = cls(path)
+        with np.load(path) as data:
+            meta = json.loads(str(data["meta"]))
+            store.chart, store.series, store.x = data["chart"], data["series"], data["x"]
+            store.x_num, store.y = data["x_num"], data["y"]
+        store.charts, store.sources = meta["charts"], meta["sources"]
+        return store
+
+    # ------------------------------------------------------------------ #
+    # Queries
+
+    def _mask(self, chart=None, series=None, x_from=None, x_to=None):
+        mask = np.ones(len(self.y), dtype=bool)
+        if chart:
+            needle = str(chart).lower()
+            matches = [needle in f"{c['title'] or ''} {c['source'] or ''}".lower() for c in self.charts]
+            mask &= np.asarray(matches, dtype=bool)[self.chart] if matches else mask
+        if series:
+            mask &= np.char.find(np.char.lower(self.series), str(series).lower()) >= 0
+        if x_from is not None or x_to is not None:
+            mask &= self._x_range(x_from, x_to)
+        return mask
+
+    def _x_range(self, x_from, x_to):
+        low, high = _x_numbers([x_from])[0] if x_from is not None else -np.inf, \
+            _x_numbers([x_to])[0] if x_to is not None else np.inf
+        if not np.isnan(low) and not np.isnan(high):
+            return (self.x_num >= low) & (self.x_num <= high)
+        # Category labels are compared by their position within each chart
+        mask = np.zeros(len(self.y), dtype=bool)
+        for number in np.unique(self.chart):
+            rows = np.flatnonzero(self.chart == number)
+            labels = [label.lower() for label in self.x[rows]]
+            bounds = [str(bound).strip().lower() for bound in (x_from, x_to) if bound is not None]
+            if not all(bound in labels for bound in bounds):
+                continue
+            start = labels.index(str(x_from).strip().lower()) if x_from is not None else 0
+            end = labels.index(str(x_to).strip().lower()) if x_to is not None else len(rows) - 1
+            mask[rows[start:end + 1]] = True
+        return mask
+
+    def _match_x(self, x):
+        number = _x_numbers([x])[0]
+        if not np.isnan(number):
+            return self.x_num == number
+        return np.char.lower(self.x) == str(x).strip().lower()
+
+    def _describe_chart(self, number):
+        chart = self.charts[number]
+        return {"chart": chart["title"], "units": chart["units"], "source": chart["source"]}
+
+    def _groups(self, mask):
+        # One result per chart and series
+        keys = sorted(set(zip(self.chart[mask].tolist(), self.series[mask].tolist())))
+        for number, name in keys:
+            rows = np.flatnonzero(mask & (self.chart == number) & (self.series == name))
+            yield number, name, rows
+
+    def query(self, operation, x=None, x_from=None, x_to=None, series=None, chart=None):
+        """
+        Answers a question about chart data straight from the extracted chart tables.
+
+        Parameters:
+        - operation (str): "lookup" (value at x), "range" or "points" (all points, optionally between
+          x_from and x_to), "min", "max", "mean", "sum", "count", "change" (last minus first value)
+          or "charts" (list the available charts).
+        - x (str): x label for "lookup", e.g. "2019" or "Category 2".
+        - x_from (str): First x label of the range, inclusive.
+        - x_to (str): Last x label of the range, inclusive.
+        - series (str): Part of the series name to restrict to.
+        - chart (str): Part of the chart title or source document to restrict to.
+
+        Returns a list with one result per matching chart and series. Results of "range"
+        and "points" contain a {x: value} dictionary that can be passed to the chart tools.
+        """
+        if operation not in OPERATIONS:
+            raise ValueError(f"Unknown operation {operation}, expected one of {OPERATIONS}")
+        if operation == "charts":
+            return [dict(self._describe_chart(i), x_label=c["x_label"], y_label=c["y_label"],
+                         points=int(np.sum(self.chart == i))) for i, c in enumerate(self.charts)]
+
+        mask = self._mask(chart, series, x_from, x_to)
+        if operation == "lookup":
+            if x is None:
+                raise ValueError("lookup needs x")
+            mask &= self._match_x(x)
+
+        results = []
+        for number, name, rows in self._groups(mask):
+            result = self._describe_chart(number)
+            if name:
+                result["series"] = name
+            values = self.y[rows]
+            if operation == "lookup":
+                # A label can repeat within a series, e.g. a year with two readings
+                results.extend(dict(result, x=str(self.x[row]), value=float(self.y[row])) for row in rows)
+                continue
+            elif operation in ("range", "points"):
+                result["data"] = {str(label): float(value) for label, value in zip(self.x[rows], values)}
+            elif operation in ("min", "max"):
+                best = int(np.argmin(values) if operation == "min" else np.argmax(values))
+                result.update(x=str(self.x[rows[best]]), value=float(values[best]))
+            elif operation == "mean":
+                result["value"] = round(float(np.mean(values)), 10)
+            elif operation == "sum":
+                result["value"] = round(float(np.sum(values)), 10)
+            elif operation == "count":
+                result["value"] = int(len(values))
+            elif operation == "change":
+                result.update(x_from=str(self.x[rows[0]]), x_to=str(self.x[rows[-1]]),
+                              value=round(float(values[-1] - values[0]), 10))
+            results.append(result)
+        return results
@@ -0,0 +1,89 @@
+import re
+import time
+from dataclasses import dataclass
+
+from pypdf import PdfReader
+
+# A page is taken for a chart page when its vector drawing and its numeric labels both
+# reach these counts. Body text draws no paths, and table rules rarely come with enough numbers.
+MIN_PATH_OPERATORS = 30
+MIN_AXIS_LABELS = 3
+# Nesting depth of form XObjects that is still scanned
+MAX_FORM_DEPTH = 4
+
+_PATH_OPERATOR_RE = re.compile(rb"(?<![^\s\]\)>])(?:re|m|l|c|v|y)(?=\s)")
+_NUMBER_RE = re.compile(r"^[-+−]?[$€£]?\d[\d,]*(?:\.\d+)?%?$")
+
+
+@dataclass
+class PageScan:
+    page: int
+    path_operators: int = 0
+    images: int = 0
+    axis_labels: int = 0
+
+    @property
+    def is_chart(self):
+        return self.path_operators >= MIN_PATH_OPERATORS and self.axis_labels >= MIN_AXIS_LABELS
+
+
+def _drawing(resources, depth, seen):
+    """
+    Returns the content of the form XObjects below resources and the number of images.
+    """
+    content, images = b"", 0
+    if resources is None or depth > MAX_FORM_DEPTH:
+        return content, images
+    xobjects = resources.get_object().get("/XObject")
+    if xobjects is None:
+        return content, images
+    for reference in xobjects.get_object().values():
+        key = getattr(reference, "idnum", None)
+        if key is not None:
+            if key in seen:
+                continue
+            seen.add(key)
+        xobject = reference.get_object()
+        if xobject.get("/Subtype") == "/Image":
+            images += 1
+        elif xobject.get("/Subtype") == "/Form":
+            nested, nested_images = _drawing(xobject.get("/Resources"), depth + 1, seen)
+            content += xobject.get_data() + b"\n" + nested
+            images += nested_images
+    return content, images
+
+
+def scan_page(page, number):
+    """
+    Counts the path operators and images of a PDF page, including those of its form
+    XObjects, and the numeric words of its text when the page draws enough paths.
+
+    Parameters:
+    - page (PageObject): The page to scan.
+    - number (int): 1-based page number, kept in the result.
+    """
+    contents = page.get_contents()
+    content = contents.get_data() if contents is not None else b""
+    nested, images = _drawing(page.get("/Resources"), 0, set())
+    scan = PageScan(number, len(_PATH_OPERATOR_RE.findall(content + b"\n" + nested)), images)
+    # Text extraction costs more than the operator count, so it only runs on candidates
+    if scan.path_operators >= MIN_PATH_OPERATORS:
+        scan.axis_labels = sum(1 for word in page.extract_text().split() if _NUMBER_RE.match(word))
+    return scan
+
+
+def detect_chart_pages(pdf_file):
+    """
+    Scans every page of a PDF and returns the 1-based numbers of the pages that look like
+    they contain a vector chart: many path operators and several numeric labels.
+
+    Parameters:
+    - pdf_file (str): Path of the PDF.
+    """
+    start = time.perf_counter()
+    reader = PdfReader(pdf_file)
+    scans = [scan_page(page, number) for number, page in enumerate(reader.pages, start=1)]
+    pages = [scan.page for scan in scans if scan.is_chart]
+    print(f"Chart pages of {pdf_file}: {pages or 'none'} of {len(scans)} "
+          f"({time.perf_counter() - start:.2f}s)")
+    return pages
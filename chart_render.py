@@ -0,0 +1,238 @@
+import io
+import math
+import os
+import threading
+from dataclasses import dataclass
+
+import numpy as np
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+from matplotlib.ticker import MaxNLocator
+
+# Output formats of the chart tools and their MIME types
+CHART_FORMATS = {"png": "image/png", "svg": "image/svg+xml"}
+CHART_FORMAT = os.getenv("CHART_FORMAT", "png")
+CHART_KINDS = ("bar", "line")
+# Line series longer than this are downsampled with LTTB before plotting, bar series
+# with min/max decimation
+MAX_LINE_POINTS = int(os.getenv("CHART_MAX_LINE_POINTS", "2000"))
+# Bar charts with more bars are drawn as a single filled step outline
+MAX_BARS = 500
+# Categorical x axes show at most this many tick labels
+MAX_TICK_LABELS = 20
+
+
+@dataclass(frozen=True)
+class ChartStyle:
+    width: float = 6.4
+    height: float = 4.8
+    dpi: int = 100
+    label_rotation: int = 45
+    marker: str = "o"
+
+
+STYLES = {
+    "default": ChartStyle(),
+    "wide": ChartStyle(width=9.6),
+    "small": ChartStyle(width=4.8, height=3.6),
+}
+
+# Every thread keeps its own figures, a Figure must not be drawn by two threads at once
+_templates = threading.local()
+
+
+def _column(values):
+    """
+    Returns values as a 1-D array, without a copy for arrays and pandas objects.
+    """
+    if hasattr(values, "to_numpy"):
+        values = values.to_numpy()
+    array = np.asarray(values)
+    if array.ndim != 1:
+        raise ValueError(f"Chart data columns must be one-dimensional, got shape {array.shape}")
+    return array
+
+
+def _numeric(values):
+    try:
+        return np.asarray(values, dtype=np.float64)
+    except (TypeError, ValueError):
+        raise ValueError("Chart y values must be numeric.") from None
+
+
+def normalize_chart_data(data):
+    """
+    Returns the x and y columns of chart data as arrays, keeping the order and any
+    duplicate x values. x is None when the data has no x values.
+
+    Parameters:
+    - data: The data to plot.
+      - If a dictionary, expects {x_label: y_value}, or the columns {"x": [...], "y": [...]}.
+      - If a list of tuples or pairs, expects [(x_label, y_value), ...].
+      - If a list of values, a 1-D NumPy array or a pandas Series, the values are the y column.
+        A Series contributes its index as x.
+      - If a NumPy array of shape (n, 2), the columns are x and y.
+    """
+    if hasattr(data, "index") and hasattr(data, "to_numpy") and getattr(data, "ndim", 0) == 1:
+        # pandas Series, only its default RangeIndex carries no x values
+        index = data.index
+        x = None if type(index).__name__ == "RangeIndex" else _column(index)
+        return x, _numeric(_column(data))
+    if isinstance(data, np.ndarray):
+        if data.ndim == 2 and data.shape[1] == 2:
+            return data[:, 0], _numeric(data[:, 1])
+        return None, _numeric(_column(data))
+    if isinstance(data, dict):
+        if set(data) == {"x", "y"}:
+            x, y = _column(data["x"]), _numeric(_column(data["y"]))
+            if len(x) != len(y):
+                raise ValueError(f"Chart data columns differ in length: {len(x)} x and {len(y)} y values")
+            return x, y
+        return _column(list(data.keys())), _numeric(list(data.values()))
+    if isinstance(data, (list, tuple)):
+        if all(isinstance(item, (int, float)) for item in data):
+            return None, _numeric(data)
+        if all(isinstance(item, (list, tuple)) and len(item) == 2 for item in data):
+            # Pairs are split into columns, so repeated x values are all kept
+            x, y = zip(*data) if data else ((), ())
+            return _column(list(x)), _numeric(y)
+    raise ValueError("Data must be a dictionary, a list of tuples, a list of numeric values, "
+                     "a NumPy array or a pandas Series.")
+
+
+def _is_numeric(x):
+    return x is not None and x.dtype.kind in "iufM"
+
+
+def lttb(x, y, threshold):
+    """
+    Largest-Triangle-Three-Buckets downsampling: returns the indices of threshold points
+    of the series (x, y) that keep its visual shape. The first and last point are always
+    kept, every bucket in between contributes the point forming the largest triangle with
+    the previously kept point and the average of the next bucket.
+
+    Parameters:
+    - x (np.ndarray): Numeric x values in plotting order.
+    - y (np.ndarray): The y values.
+    - threshold (int): Number of points to keep.
+    """
+    n = len(y)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+    if x.dtype.kind == "M":
+        x = x.astype("datetime64[ns]").astype(np.int64)
+    x = np.asarray(x, dtype=np.float64)
+    # threshold - 2 buckets between the first and the last point
+    edges = np.linspace(1, n - 1, threshold - 1).astype(np.intp)
+    selected = np.empty(threshold, dtype=np.intp)
+    selected[0], selected[-1] = 0, n - 1
+    previous = 0
+    for bucket in range(threshold - 2):
+        start, end = edges[bucket], edges[bucket + 1]
+        next_start, next_end = (end, edges[bucket + 2]) if bucket + 2 < len(edges) else (n - 1, n)
+        average_x = x[next_start:next_end].mean()
+        average_y = y[next_start:next_end].mean()
+        area = np.abs((x[previous] - average_x) * (y[start:end] - y[previous])
+                      - (x[previous] - x[start:end]) * (average_y - y[previous]))
+        # NaN areas (missing values) lose against every real point
+        previous = start + int(np.argmax(np.fmax(area, -1.0)))
+        selected[bucket + 1] = previous
+    return selected
+
+
+def _bar_edges(positions):
+    """
+    Returns the edges between bars centered on positions, which may be dates.
+    """
+    midpoints = positions[:-1] + (positions[1:] - positions[:-1]) / 2
+    return np.concatenate([[positions[0] - (midpoints[0] - positions[0])], midpoints,
+                           [positions[-1] + (positions[-1] - midpoints[-1])]])
+
+
+def _template(style):
+    """
+    Returns the figure and axes of the calling thread for style. Creating a Figure with
+    its canvas and axes costs more than drawing a small chart, so they are reused and
+    only cleared between charts.
+    """
+    figures = getattr(_templates, "figures", None)
+    if figures is None:
+        figures = _templates.figures = {}
+    template = figures.get(style)
+    if template is None:
+        fig = Figure(figsize=(style.width, style.height), dpi=style.dpi)
+        FigureCanvasAgg(fig)
+        template = figures[style] = (fig, fig.add_subplot())
+    fig, ax = template
+    ax.clear()
+    return fig, ax
+
+
+def render_chart(kind, data, title="", x_label="X-axis", y_label="Y-axis", color="skyblue",
+                 format=CHART_FORMAT, style="default", max_points=MAX_LINE_POINTS):
+    """
+    Draws a bar or line chart with the object-oriented Figure API, without pyplot and its
+    global state, and returns the encoded image as bytes. Safe to call from several
+    threads at once.
+
+    Parameters:
+    - kind (str): "bar" or "line".
+    - data: The data to plot, see normalize_chart_data.
+    - title (str): The title of the chart.
+    - x_label (str): The label for the x-axis.
+    - y_label (str): The label for the y-axis.
+    - color (str): The color of the bars or the line.
+    - format (str): "png" or "svg".
+    - style (str or ChartStyle): Figure size and layout, a name from STYLES or a ChartStyle.
+    - max_points (int): Series are downsampled to this many points, None to plot every point.
+    """
+    if kind not in CHART_KINDS:
+        raise ValueError(f"Unknown chart kind {kind!r}, expected one of {CHART_KINDS}")
+    if format not in CHART_FORMATS:
+        raise ValueError(f"Unknown chart format {format!r}, expected one of {tuple(CHART_FORMATS)}")
+    style = STYLES[style] if isinstance(style, str) else style
+    x, y = normalize_chart_data(data)
+    # Labels are drawn at their positions instead of as matplotlib categories, which
+    # would merge repeated labels
+    labels = None if _is_numeric(x) else x
+    positions = x if labels is None and x is not None else np.arange(len(y))
+    rows = np.arange(len(y))
+    if kind == "line" and max_points and len(y) > max_points:
+        rows = lttb(positions, y, max_points)
+
+    fig, ax = _template(style)
+    if kind == "bar" and len(y) > MAX_BARS:
+        # One artist instead of one rectangle per bar, the bars are too narrow to tell apart
+        edges = _bar_edges(positions)
+        if max_points and len(y) > max_points:
+            # Min/max decimation keeps the filled extent of every group of bars
+            starts = np.linspace(0, len(y), max_points, endpoint=False).astype(np.intp)
+            edges = np.append(edges[starts], edges[-1])
+            ax.stairs(np.maximum.reduceat(np.fmax(y, 0), starts), edges, fill=True, color=color)
+            ax.stairs(np.minimum.reduceat(np.fmin(y, 0), starts), edges, fill=True, color=color)
+        else:
+            ax.stairs(y, edges, fill=True, color=color)
+    elif kind == "bar":
+        ax.bar(positions, y, color=color)
+    else:
+        # Markers only help to read short series
+        marker = style.marker if len(rows) <= MAX_TICK_LABELS else None
+        ax.plot(positions[rows], y[rows], color=color, marker=marker)
+    if labels is not None or (x is None and len(y) <= MAX_TICK_LABELS):
+        # Numeric and date x values keep the default locator over their real values, long
+        # series without x values the numeric ticks of their positions
+        step = max(1, math.ceil(len(y) / MAX_TICK_LABELS))
+        ticks = np.arange(0, len(y), step)
+        ax.set_xticks(ticks, [str(labels[i]) if labels is not None else f"Item {i + 1}" for i in ticks])
+    elif x is not None and x.dtype.kind in "iu":
+        # Integer x values such as years get no ticks between them
+        ax.xaxis.set_major_locator(MaxNLocator(integer=True))
+    ax.set_title(title)
+    ax.set_xlabel(x_label)
+    ax.set_ylabel(y_label)
+    ax.tick_params(axis="x", labelrotation=style.label_rotation)
+    fig.tight_layout()
+
+    buffer = io.BytesIO()
+    fig.savefig(buffer, format=format)
+    return buffer.getvalue()
@@ -0,0 +1,172 @@
+import hashlib
+import os
+
+import numpy as np
+from llama_index.core import Settings
+from llama_index.core.base.embeddings.base import BaseEmbedding
+from llama_index.core.bridge.pydantic import PrivateAttr
+
+from chart_cache import DescriptionCache
+
+# Default location and size budget of the on-disk embedding cache
+CACHE_DIR = "./cache/embeddings"
+MAX_CACHE_BYTES = 512 * 1024 * 1024
+# Texts sent per embedding request
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "100"))
+
+
+def embedding_key(text, model, kind="text"):
+    """
+    Builds the content address of an embedding from the model name and the text.
+
+    Parameters:
+    - text (str): The embedded text.
+    - model (str): The name of the embedding model.
+    - kind (str): "text" or "query", as some models embed queries differently.
+    """
+    digest = hashlib.sha256()
+    for part in (kind, model, text):
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+class EmbeddingCache(DescriptionCache):
+    """
+    Persistent cache of embeddings stored as one float32 file per key, with the same
+    LRU eviction as the chart description cache.
+
+    Parameters:
+    - cache_dir (str): Directory holding the cached embeddings.
+    - max_bytes (int): Size budget of the cache directory in bytes.
+    """
+
+    suffix = ".f32"
+
+    def __init__(self, cache_dir=CACHE_DIR, max_bytes=MAX_CACHE_BYTES):
+        super().__init__(cache_dir, max_bytes)
+
+    def get(self, key, stats=None):
+        """
+        Returns the cached embedding for key as a list of floats, or None on a miss.
+        """
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                embedding = np.frombuffer(f.read(), dtype=np.float32)
+        except FileNotFoundError:
+            self._count(False, stats)
+            return None
+        os.utime(path)
+        self._count(True, stats)
+        return embedding.tolist()
+
+    def put(self, key, embedding, evict=True):
+        """
+        Stores embedding under key. Pass evict=False when storing many embeddings and
+        call evict once afterwards.
+        """
+        os.makedirs(self.cache_dir, exist_ok=True)
+        path = self._path(key)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        data = np.asarray(embedding, dtype=np.float32).tobytes()
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+        self._written(len(data))
+        if evict:
+            self.evict()
+
+
+class CachedEmbedding(BaseEmbedding):
+    """
+    Embedding model wrapper that serves embeddings from an EmbeddingCache and only sends
+    the texts it has not seen to the wrapped model. Within every batch of embed_batch_size
+    texts the misses go out as a single request.
+
+    Parameters:
+    - embed_model (BaseEmbedding): The model computing the embeddings.
+    - cache (EmbeddingCache): Where embeddings are stored.
+    - embed_batch_size (int): Texts per embedding request.
+    """
+
+    _embed_model: BaseEmbedding = PrivateAttr()
+    _cache: EmbeddingCache = PrivateAttr()
+
+    def __init__(self, embed_model, cache=None, embed_batch_size=EMBED_BATCH_SIZE, **kwargs):
+        model_name = getattr(embed_model, "model_name", None) or type(embed_model).__name__
+        super().__init__(model_name=model_name, embed_batch_size=embed_batch_size, **kwargs)
+        self._embed_model = embed_model
+        self._cache = cache or EmbeddingCache()
+
+    @classmethod
+    def class_name(cls):
+        return "CachedEmbedding"
+
+    @property
+    def cache(self):
+        return self._cache
+
+    def _lookup(self, texts, kind):
+        keys = [embedding_key(text, self.model_name, kind) for text in texts]
+        embeddings = [self._cache.get(key) for key in keys]
+        misses = [i for i, embedding in enumerate(embeddings) if embedding is None]
+        return keys, embeddings, misses
+
+    def _store(self, keys, embeddings, misses, computed):
+        for i, embedding in zip(misses, computed):
+            embeddings[i] = embedding
+            self._cache.put(keys[i], embedding, evict=False)
+        if misses:
+            self._cache.evict()
+        return embeddings
+
+    def _get_text_embeddings(self, texts):
+        keys, embeddings, misses = self._lookup(texts, "text")
+        computed = self._embed_model._get_text_embeddings([texts[i] for i in misses]) if misses else []
+        return self._store(keys, embeddings, misses, computed)
+
+    async def _aget_text_embeddings(self, texts):
+        keys, embeddings, misses = self._lookup(texts, "text")
+        computed = await self._embed_model._aget_text_embeddings([texts[i] for i in misses]) if misses else []
+        return self._store(keys, embeddings, misses, computed)
+
+    def _get_text_embedding(self, text):
+        return self._get_text_embeddings([text])[0]
+
+    async def _aget_text_embedding(self, text):
+        return (await self._aget_text_embeddings([text]))[0]
+
+    def _get_query_embedding(self, query):
+        keys, embeddings, misses = self._lookup([query], "query")
+        computed = [self._embed_model._get_query_embedding(query)] if misses else []
+        return self._store(keys, embeddings, misses, computed)[0]
+
+    async def _aget_query_embedding(self, query):
+        keys, embeddings, misses = self._lookup([query], "query")
+        computed = [await self._embed_model._aget_query_embedding(query)] if misses else []
+        return self._store(keys, embeddings, misses, computed)[0]
+
+
+def install_embedding_cache(cache=None, embed_batch_size=None):
+    """
+    Wraps Settings.embed_model in a CachedEmbedding, so that every index, the tool
+    ObjectIndex and the retrievers share the cache, and returns the wrapper. Calling it
+    again returns the installed wrapper.
+
+    Parameters:
+    - cache (EmbeddingCache): Cache to use, the default cache directory if None.
+    - embed_batch_size (int): Texts per embedding request, EMBED_BATCH_SIZE if None.
+    """
+    if not isinstance(Settings.embed_model, CachedEmbedding):
+        Settings.embed_model = CachedEmbedding(Settings.embed_model, cache, embed_batch_size or EMBED_BATCH_SIZE)
+    elif embed_batch_size:
+        Settings.embed_model.embed_batch_size = embed_batch_size
+    return Settings.embed_model
+
+
+def report_embedding_cache(embed_model=None):
+    embed_model = embed_model or Settings.embed_model
+    if isinstance(embed_model, CachedEmbedding):
+        stats = embed_model.cache.stats()
+        print(f"Embedding cache: {stats['hits']} hits, {stats['misses']} misses")
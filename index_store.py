@@ -0,0 +1,325 @@
+import json
+import os
+import shutil
+import time
+from dataclasses import dataclass, field
+
+from llama_index.core import Settings, StorageContext, VectorStoreIndex, load_index_from_storage
+from llama_index.core.ingestion import run_transformations
+from llama_index.core.vector_stores.simple import SimpleVectorStore
+
+from ingestion import file_sha256
+from mmap_vector_store import MmapVectorStore
+
+# Bump when the layout of the persisted indexes or of the manifest changes
+SCHEMA_VERSION = 1
+MANIFEST_NAME = "manifest.json"
+# Holds the name of the directory of the current version of an index
+POINTER_SUFFIX = ".current"
+INDEX_ROOT = "./test_files"
+# "mmap" keeps embeddings in a memory-mapped NumPy matrix, "simple" in llama_index's JSON store
+VECTOR_STORE = os.getenv("INDEX_VECTOR_STORE", "mmap")
+VECTOR_STORE_FILE = "default__vector_store.json"
+# Approximate nearest-neighbour index of the mmap vector store: "exact", "ivf" or "hnsw"
+ANN_INDEX = os.getenv("INDEX_ANN", "exact")
+
+
+class IndexStoreError(RuntimeError):
+    pass
+
+
+def vector_store_kind(vector_store):
+    if isinstance(vector_store, MmapVectorStore):
+        return f"mmap-{vector_store.dtype}"
+    return "simple"
+
+
+def embed_model_name(embed_model=None):
+    """
+    Returns a name identifying the embedding model, so that indexes embedded with a
+    different model are not loaded.
+    """
+    embed_model = embed_model or Settings.embed_model
+    return getattr(embed_model, "model_name", None) or type(embed_model).__name__
+
+
+def file_stat(path):
+    """
+    Returns the modification time and size of path, which tell that a file is unchanged
+    since it was hashed without hashing it again.
+    """
+    stat = os.stat(path)
+    return {"mtime_ns": stat.st_mtime_ns, "size": stat.st_size}
+
+
+@dataclass
+class StoredIndex:
+    """
+    A VectorStoreIndex together with its manifest. The manifest maps every indexed source
+    file to the hash it was indexed at and the ids of the documents it produced.
+
+    Parameters:
+    - name (str): Name of the index, also its directory below the store root.
+    - index (VectorStoreIndex): The loaded index.
+    - manifest (dict): The manifest describing the index.
+    """
+    name: str
+    index: object
+    manifest: dict
+    dirty: bool = field(default=False)
+
+    @property
+    def sources(self):
+        return self.manifest["sources"]
+
+    def contains(self, sha256):
+        return any(entry["sha256"] == sha256 for entry in self.sources.values())
+
+    def stale_sources(self, sources=(), hashes=None):
+        """
+        Returns {source: sha256} for the given and the already indexed sources whose
+        current content is not what was indexed. Sources that no longer exist are kept
+        as they are. Sources with the modification time and size recorded in the manifest
+        are not hashed.
+
+        Parameters:
+        - sources (list of str): Sources that should be in the index.
+        - hashes (dict): {source: sha256} of sources hashed before, e.g. for another index.
+          Sources hashed here are added to it.
+        """
+        hashes = {} if hashes is None else hashes
+        stale = {}
+        for source in list(self.sources) + [os.path.normpath(s) for s in sources]:
+            if source in stale or not os.path.isfile(source):
+                continue
+            entry = self.sources.get(source)
+            stat = file_stat(source)
+            if entry is not None and all(entry.get(key) == value for key, value in stat.items()):
+                continue
+            if source not in hashes:
+                hashes[source] = file_sha256(source)
+            if entry is None or entry["sha256"] != hashes[source]:
+                stale[source] = hashes[source]
+            else:
+                # Touched but unchanged, the new stat spares the hash next time
+                entry.update(stat)
+                self.dirty = True
+        return stale
+
+    def replace_source(self, source, sha256, docs):
+        """
+        Removes the documents previously indexed for source and inserts docs instead.
+
+        Parameters:
+        - source (str): Path of the source file.
+        - sha256 (str): Hash of the current content of the source file.
+        - docs (list of Document): Documents loaded from the source file.
+        """
+        self.replace_sources({source: (sha256, docs)})
+
+    def replace_sources(self, sources):
+        """
+        Replaces the documents of several sources at once, see replace_source.
+
+        Parameters:
+        - sources (dict): {source: (sha256, docs)}, sources without documents are recorded too.
+        """
+        all_docs = []
+        for source, (_, docs) in sources.items():
+            for doc_id in self.sources.get(os.path.normpath(source), {}).get("doc_ids", []):
+                self.index.delete_ref_doc(doc_id, delete_from_docstore=True)
+            all_docs.extend(docs)
+        # All chunks are embedded together, in batches of the model's embed_batch_size
+        nodes = run_transformations(all_docs, Settings.transformations)
+        self.index.insert_nodes(nodes)
+        for doc in all_docs:
+            self.index.docstore.set_document_hash(doc.id_, doc.hash)
+        for source, (sha256, docs) in sources.items():
+            self.record_source(source, sha256, [doc.id_ for doc in docs])
+
+    def record_source(self, source, sha256, doc_ids):
+        source = os.path.normpath(source)
+        entry = {"sha256": sha256, "doc_ids": list(doc_ids)}
+        if os.path.isfile(source):
+            entry.update(file_stat(source))
+        self.sources[source] = entry
+        self.dirty = True
+
+
+class IndexStore:
+    """
+    Persists indexes in one directory per index below root, each with a manifest that
+    records the schema version, the embedding model, the indexed source files and the
+    sizes of the persisted files. Loading validates the manifest. Every save writes a new
+    version directory and then atomically replaces the pointer file naming the current
+    version, so that readers and crashes never see a half-written or missing index.
+
+    Indexes persisted with another vector store backend are converted on load without
+    re-embedding.
+
+    Parameters:
+    - root (str): Directory holding the index directories.
+    - embed_model: Embedding model the indexes are built with, Settings.embed_model by default.
+    - vector_store (str): "mmap" or "simple".
+    - vector_dtype (str): "float32" or "float16", the precision of the mmap vector store.
+    - ann (str): ANN index of the mmap vector store, "exact", "ivf" or "hnsw".
+    - ann_params (dict): Recall/speed parameters of the ANN index, e.g. {"nprobe": 16}.
+    """
+
+    def __init__(self, root=INDEX_ROOT, embed_model=None, vector_store=VECTOR_STORE, vector_dtype="float32",
+                 ann=ANN_INDEX, ann_params=None):
+        if vector_store not in ("mmap", "simple"):
+            raise ValueError(f"Unknown vector store {vector_store}")
+        self.root = root
+        self.embed_model = embed_model
+        self.vector_store = vector_store
+        self.vector_dtype = vector_dtype
+        self.ann = ann
+        self.ann_params = ann_params or {}
+
+    @property
+    def vector_store_kind(self):
+        return f"mmap-{self.vector_dtype}" if self.vector_store == "mmap" else "simple"
+
+    def new_vector_store(self):
+        if self.vector_store == "mmap":
+            return MmapVectorStore(dtype=self.vector_dtype, ann=self.ann, ann_params=self.ann_params)
+        return SimpleVectorStore()
+
+    def new_storage_context(self):
+        return StorageContext.from_defaults(vector_store=self.new_vector_store())
+
+    def _pointer(self, name):
+        return os.path.join(self.root, name + POINTER_SUFFIX)
+
+    def path(self, name):
+        """
+        Returns the directory of the current version of the index name. Indexes saved
+        before versions were introduced live directly in root/name.
+        """
+        try:
+            with open(self._pointer(name), encoding="utf-8") as f:
+                version = f.read().strip()
+        except FileNotFoundError:
+            version = name
+        return os.path.join(self.root, version)
+
+    def new_manifest(self, name):
+        return {
+            "schema_version": SCHEMA_VERSION,
+            "name": name,
+            "embed_model": embed_model_name(self.embed_model),
+            "vector_store": self.vector_store_kind,
+            "sources": {},
+            "files": {},
+        }
+
+    def read_manifest(self, name):
+        """
+        Returns the manifest of the index name, or None if it has none.
+        """
+        try:
+            with open(os.path.join(self.path(name), MANIFEST_NAME), encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+        except json.JSONDecodeError as error:
+            raise IndexStoreError(f"manifest of {name} is corrupt ({error})") from error
+
+    def validate(self, name, manifest):
+        """
+        Raises IndexStoreError if the persisted index name cannot be used as it is.
+        """
+        if manifest is None:
+            raise IndexStoreError(f"{self.path(name)} has no {MANIFEST_NAME}")
+        if manifest.get("schema_version") != SCHEMA_VERSION:
+            raise IndexStoreError(f"{name} has schema version {manifest.get('schema_version')}, "
+                                  f"expected {SCHEMA_VERSION}")
+        model = embed_model_name(self.embed_model)
+        if manifest.get("embed_model") != model:
+            raise IndexStoreError(f"{name} was embedded with {manifest.get('embed_model')}, not {model}")
+        for filename, size in manifest.get("files", {}).items():
+            path = os.path.join(self.path(name), filename)
+            if not os.path.isfile(path) or os.path.getsize(path) != size:
+                raise IndexStoreError(f"{path} is missing or does not match the manifest")
+
+    def load(self, name):
+        """
+        Loads and validates the index name.
+
+        Raises IndexStoreError if the index is missing, invalid or cannot be loaded.
+        """
+        manifest = self.read_manifest(name)
+        self.validate(name, manifest)
+        path = self.path(name)
+        persisted_kind = manifest.get("vector_store", "simple")
+        try:
+            if persisted_kind.startswith("mmap"):
+                vector_store = MmapVectorStore.from_persist_path(os.path.join(path, VECTOR_STORE_FILE))
+            else:
+                vector_store = SimpleVectorStore.from_persist_path(os.path.join(path, VECTOR_STORE_FILE))
+            converted = persisted_kind != self.vector_store_kind
+            if converted:
+                print(f"Converting the {name} vector store from {persisted_kind} to {self.vector_store_kind}")
+                if isinstance(vector_store, MmapVectorStore):
+                    vector_store = vector_store.to_simple()
+                if self.vector_store == "mmap":
+                    vector_store = MmapVectorStore.from_simple(vector_store, self.vector_dtype,
+                                                               self.ann, self.ann_params)
+            elif isinstance(vector_store, MmapVectorStore) and (vector_store.ann, vector_store.ann_params) != (
+                    self.ann, self.ann_params):
+                vector_store.set_ann(self.ann, self.ann_params)
+                converted = True
+            storage_context = StorageContext.from_defaults(persist_dir=path, vector_store=vector_store)
+            index = load_index_from_storage(storage_context, embed_model=self.embed_model)
+        except (OSError, ValueError, KeyError) as error:
+            raise IndexStoreError(f"{name} could not be loaded ({error})") from error
+        if converted:
+            manifest["vector_store"] = self.vector_store_kind
+        return StoredIndex(name, index, manifest, dirty=converted)
+
+    def create(self, name):
+        """
+        Returns a new, empty index name. It is only written by save.
+        """
+        index = VectorStoreIndex(nodes=[], storage_context=self.new_storage_context(),
+                                 embed_model=self.embed_model)
+        return StoredIndex(name, index, self.new_manifest(name), dirty=True)
+
+    def load_or_create(self, name):
+        try:
+            return self.load(name)
+        except IndexStoreError as error:
+            print(f"Rebuilding the {name} index: {error}")
+            return self.create(name)
+
+    def save(self, stored):
+        """
+        Persists stored and its manifest atomically.
+        """
+        os.makedirs(self.root, exist_ok=True)
+        previous = os.path.basename(self.path(stored.name))
+        version = f"{stored.name}.v{time.time_ns()}-{os.getpid()}"
+        target = os.path.join(self.root, version)
+        stored.index.storage_context.persist(persist_dir=target)
+        stored.manifest["vector_store"] = vector_store_kind(stored.index.vector_store)
+
+        stored.manifest["files"] = {
+            filename: os.path.getsize(os.path.join(target, filename))
+            for filename in sorted(os.listdir(target))
+        }
+        stored.manifest["updated"] = time.time()
+        with open(os.path.join(target, MANIFEST_NAME), "w", encoding="utf-8") as f:
+            json.dump(stored.manifest, f, indent=2)
+
+        # Replacing a file is atomic, unlike moving the old directory aside and the new one in
+        pointer = self._pointer(stored.name)
+        with open(f"{pointer}.tmp-{os.getpid()}", "w", encoding="utf-8") as f:
+            f.write(version)
+        os.replace(f"{pointer}.tmp-{os.getpid()}", pointer)
+        stored.dirty = False
+
+        # The previous version is kept for readers that resolved the pointer just before
+        for entry in os.listdir(self.root):
+            if entry.startswith(f"{stored.name}.v") and entry not in (version, previous):
+                shutil.rmtree(os.path.join(self.root, entry), ignore_errors=True)
@@ -0,0 +1,262 @@
+import contextvars
+import hashlib
+import io
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import openai
+from dotenv import load_dotenv
+
+from llama_index.core import SimpleDirectoryReader
+
+from chart_cache import DescriptionCache, cache_key
+from chart_pages import detect_chart_pages
+from inkscape_service import get_conversion_service
+from searchable_pdf import make_searchable_pdf
+from svg_extract import CONFIDENCE_THRESHOLD, extract_chart
+from svg_minify import DEFAULT_TOKEN_BUDGET, minify_svg
+from tracing import get_tracer
+
+
+# Chart pages of one PDF converted and described at once
+CHART_PAGE_WORKERS = int(os.getenv("CHART_PAGE_WORKERS", "4"))
+
+def chart_page_svg(pdf_file, page):
+    return f"{pdf_file}.page{page}.svg"
+
+def convert_pdf_to_svg(pdf_file, page=None, output=None):
+    # Conversions go through long-lived Inkscape workers instead of one process per file
+    with get_tracer().span("convert_page", "ingest", source=pdf_file, page=page or 0) as span:
+        result = get_conversion_service().pdf_to_svg(pdf_file, output, page=page)
+        span.attributes["backend"] = result.backend
+    print(result.stdout)
+    print(result.stderr)
+
+    print(f"Converted {pdf_file} page {page or 1} to SVG with {result.backend} in {result.seconds:.2f}s")
+
+    return result.output
+
+def describe_pdf_page(pdf_file, page, client=None, stats=None):
+    return generate_chart_data_from_svg(convert_pdf_to_svg(pdf_file, page, chart_page_svg(pdf_file, page)),
+                                        client=client, stats=stats)
+
+def generate_chart_data_from_pdf(pdf_file, pages=None, workers=CHART_PAGE_WORKERS, client=None, stats=None):
+    """
+    Describes the charts of a PDF page by page. Only the pages that look like they hold
+    a vector chart are converted and described, several at a time. Returns a list of
+    (page number, description file) pairs.
+
+    Parameters:
+    - pdf_file (str): Path to the PDF file.
+    - pages (list of int): 1-based pages to describe, detected with detect_chart_pages if None.
+    - workers (int): Pages converted and described at once.
+    - client: OpenAI compatible client, see generate_chart_data_from_svg.
+    - stats (dict): Description cache hit and miss counters of the caller, see generate_chart_data_from_svg.
+    """
+    pages = detect_chart_pages(pdf_file) if pages is None else pages
+    if not pages:
+        return []
+    # Each page runs in a copy of the caller's context, so its spans stay below the caller's span
+    contexts = {page: contextvars.copy_context() for page in pages}
+    with ThreadPoolExecutor(max_workers=max(1, min(workers, len(pages)))) as executor:
+        return list(zip(pages, executor.map(
+            lambda page: contexts[page].run(describe_pdf_page, pdf_file, page, client, stats), pages)))
+
+def generate_pdf_from_svg(svg_file):
+    # The text of the chart is written into the PDF directly, external tools are only
+    # needed for SVGs that draw their text as paths
+    result = make_searchable_pdf(svg_file)
+    print(result.report())
+
+    return result.output
+    
+# Prompt and model used to describe charts found in SVG files
+CHART_DESCRIPTION_MODEL = "gpt-4-turbo"
+CHART_DESCRIPTION_PROMPT = '''Generate a .txt file that describes the chart within the following SVG file. Label every data point. For example: 
+            Title of the chart is "Apple Stock Price Over the Last 10 Years".
+            • Chart type is a bar chart.
+            • Chart created using matplotlib.
+            • X-axis is labeled "Year".
+            • Y-axis is labeled "Stock Price ($)".
+            • Data points are colored in skyblue.
+            • The chart measures stock price rates from 2015 to 2024.
+            • Year 2015 was $27.06.
+            • Year 2016 was $24.06.
+            • Year 2017 was $35.29.'''
+
+# Chart descriptions are cached by SVG content, prompt and model
+description_cache = DescriptionCache()
+
+def generate_chart_data_from_svg(svg_file, client=None, cache=description_cache, min_confidence=CONFIDENCE_THRESHOLD,
+                                 token_budget=DEFAULT_TOKEN_BUDGET, stats=None):
+    """
+    Describes the chart in an SVG file and writes the description next to it.
+    Charts the SVG parser can read with enough confidence are described without
+    the LLM, and descriptions of previously seen charts are served from the cache.
+    Otherwise the SVG is reduced to its semantic parts before it is sent to the LLM.
+
+    Parameters:
+    - svg_file (str): Path to the SVG file.
+    - client: OpenAI compatible client, defaults to the openai module. A local fake can be passed in tests.
+    - cache (DescriptionCache): Description cache, or None to always call the LLM.
+    - min_confidence (float): Parser confidence needed to skip the LLM.
+    - token_budget (int): Maximum estimated tokens of the SVG sent to the LLM.
+    - stats (dict): Counts the description cache hits and misses of this call, e.g. for one document.
+    """
+    with open(svg_file, encoding="utf-8") as f:
+        svg_text = f.read()
+
+    with get_tracer().span("describe_chart", "ingest", source=svg_file) as span:
+        response = None
+        extraction = extract_chart(svg_text)
+        if extraction.confidence >= min_confidence:
+            print(f"Chart in {svg_file} extracted without the LLM (confidence {extraction.confidence:.2f})")
+            response = extraction.to_description()
+            span.attributes["via"] = "parser"
+        else:
+            reduced_svg, report = minify_svg(io.StringIO(svg_text), token_budget=token_budget, model=CHART_DESCRIPTION_MODEL)
+            print(report)
+            if cache is not None:
+                key = cache_key(reduced_svg, CHART_DESCRIPTION_PROMPT, CHART_DESCRIPTION_MODEL)
+                response = cache.get(key, stats)
+                if response is not None:
+                    print(f"Chart description cache hit for {svg_file}")
+                    span.attributes["via"] = "cache"
+
+        if response is None:
+            print(f"Describing chart in {svg_file} with {CHART_DESCRIPTION_MODEL}")
+            if client is None:
+                # Use the OpenAI API for Query and Response
+                load_dotenv()
+                openai.api_key = os.getenv("OPENAI_API_KEY")
+                client = openai
+            response = client.chat.completions.create(
+                model=CHART_DESCRIPTION_MODEL,
+                messages=[
+                        {"role": "system", "content": CHART_DESCRIPTION_PROMPT},
+                        {"role": "user", "content": reduced_svg}
+                ]
+            )
+            span.attributes["via"] = "llm"
+            usage = getattr(response, "usage", None)
+            for name in ("prompt_tokens", "completion_tokens"):
+                if isinstance(getattr(usage, name, None), int):
+                    span.attributes[name] = getattr(usage, name)
+
+            # Extracting text response from the OpenAI response object
+            response = response.choices[0].message.content
+            if cache is not None:
+                cache.put(key, response)
+
+    print(response)
+
+    output_text = svg_file + "chart_description.txt"
+    with open(output_text, "w", encoding="utf-8") as f:
+        f.write(response)
+    return output_text
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def tag_documents(docs, source, sha256, kind):
+    """
+    Gives documents loaded from source stable ids derived from the file hash, so that
+    re-ingesting the same file can be detected and replaced in an index.
+
+    Parameters:
+    - docs (list of Document): Documents loaded from one file.
+    - source (str): Path of the ingested file.
+    - sha256 (str): Hash of the ingested file.
+    - kind (str): "text" or "chart".
+    """
+    for i, doc in enumerate(docs):
+        doc.id_ = f"{sha256}-{kind}-{i}"
+        doc.metadata["source_document"] = source
+        doc.metadata["source_sha256"] = sha256
+        # Bookkeeping only, a file hash in the chunk text would change every embedding of a re-saved file
+        for excluded in (doc.excluded_embed_metadata_keys, doc.excluded_llm_metadata_keys):
+            excluded.extend(key for key in ("source_document", "source_sha256") if key not in excluded)
+    return docs
+
+def load_chart_documents(descriptions):
+    """
+    Loads chart description files, keeping the page they describe as "page_label"
+    metadata like the PDF reader does for text pages.
+
+    Parameters:
+    - descriptions (list): (page number or None, description file) pairs.
+    """
+    chart_docs = []
+    for page, output_text in descriptions:
+        docs = SimpleDirectoryReader(
+            input_files=[output_text]
+        ).load_data()
+        if page is not None:
+            for doc in docs:
+                doc.metadata["page_label"] = str(page)
+        chart_docs.extend(docs)
+    return chart_docs
+
+def report_description_cache(stats=None):
+    # The totals of the process unless the counters of one document are given
+    stats = description_cache.stats() if stats is None else stats
+    print(f"Chart description cache: {stats['hits']} hits, {stats['misses']} misses")
+    return stats
+
+def pdf_processing(pdf_file):
+    stats = {"hits": 0, "misses": 0}
+    tracer = get_tracer()
+    with tracer.span("ingest.load", "ingest", source=pdf_file):
+        text_docs = SimpleDirectoryReader(
+            input_files=[pdf_file]
+        ).load_data()
+
+    with tracer.span("ingest.describe", "ingest", source=pdf_file):
+        descriptions = generate_chart_data_from_pdf(pdf_file, stats=stats)
+    chart_docs = load_chart_documents(descriptions)
+
+    report_description_cache(stats)
+    return text_docs, chart_docs
+
+def svg_processing(svg_file):
+    stats = {"hits": 0, "misses": 0}
+    tracer = get_tracer()
+    with tracer.span("ingest.convert", "ingest", source=svg_file):
+        pdf_file = generate_pdf_from_svg(svg_file)
+    with tracer.span("ingest.load", "ingest", source=svg_file):
+        text_docs = SimpleDirectoryReader(
+            input_files=[pdf_file]
+        ).load_data()
+
+    with tracer.span("ingest.describe", "ingest", source=svg_file):
+        output_text = generate_chart_data_from_svg(svg_file, stats=stats)
+
+    chart_docs = SimpleDirectoryReader(
+        input_files=[output_text]
+    ).load_data()
+
+    report_description_cache(stats)
+    return text_docs, chart_docs
+
+def process_document(path, sha256=None):
+    """
+    Loads the text and chart documents of a PDF or SVG file, tagged with the file hash.
+
+    Parameters:
+    - path (str): Path of the PDF or SVG document.
+    - sha256 (str): Hash of the file, computed if not given.
+    """
+    sha256 = sha256 or file_sha256(path)
+    with get_tracer().span("process_document", "ingest", source=path):
+        if path.lower().endswith(".svg"):
+            text_docs, chart_docs = svg_processing(path)
+        else:
+            text_docs, chart_docs = pdf_processing(path)
+    tag_documents(text_docs, path, sha256, "text")
+    tag_documents(chart_docs, path, sha256, "chart")
+    return text_docs, chart_docs
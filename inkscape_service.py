@@ -0,0 +1,281 @@
+import atexit
+import os
+import queue
+import shutil
+import subprocess
+import threading
+import time
+from dataclasses import dataclass
+
+# Defaults of the process-wide conversion service
+DEFAULT_WORKERS = int(os.getenv("INKSCAPE_WORKERS", "2"))
+DEFAULT_TIMEOUT = 120.0
+# Workers are restarted after this many conversions to bound Inkscape's memory growth
+MAX_JOBS_PER_WORKER = 200
+
+_PROMPT = b"> "
+
+
+@dataclass
+class ConversionResult:
+    output: str
+    stdout: str
+    stderr: str
+    seconds: float
+    backend: str
+
+
+class ConversionError(RuntimeError):
+    pass
+
+
+class InkscapeWorker:
+    """
+    A long-lived `inkscape --shell` process. Conversions are sent as action lines and a
+    conversion is finished when Inkscape prints its prompt again.
+
+    Parameters:
+    - executable (str): Path of the Inkscape executable.
+    - timeout (float): Seconds to wait for a single conversion.
+    """
+
+    def __init__(self, executable, timeout=DEFAULT_TIMEOUT):
+        self.executable = executable
+        self.timeout = timeout
+        self.jobs = 0
+        self._process = None
+        self._stdout = bytearray()
+        self._stderr = bytearray()
+        self._lock = threading.Lock()
+        self._ready = threading.Condition(self._lock)
+
+    def start(self):
+        self._process = subprocess.Popen(
+            [self.executable, "--shell"],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+        )
+        self._stdout.clear()
+        self._stderr.clear()
+        threading.Thread(target=self._pump, args=(self._process.stdout, self._stdout), daemon=True).start()
+        threading.Thread(target=self._pump, args=(self._process.stderr, self._stderr), daemon=True).start()
+        # Wait for the banner and first prompt so that startup is not billed to the first job
+        self._wait_for_prompt(self.timeout)
+        self.jobs = 0
+
+    def _pump(self, stream, buffer):
+        # The prompt is not newline terminated, so the stream is read in raw chunks
+        while True:
+            chunk = stream.read1(4096) if hasattr(stream, "read1") else stream.read(1)
+            if not chunk:
+                break
+            with self._ready:
+                buffer.extend(chunk)
+                self._ready.notify_all()
+        with self._ready:
+            self._ready.notify_all()
+
+    def _wait_for_prompt(self, timeout):
+        deadline = time.monotonic() + timeout
+        with self._ready:
+            while not self._stdout.endswith(_PROMPT):
+                if self._process.poll() is not None:
+                    raise ConversionError(f"Inkscape exited with code {self._process.returncode}")
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise TimeoutError(f"Inkscape did not answer within {timeout} seconds")
+                self._ready.wait(remaining)
+            stdout = bytes(self._stdout[:-len(_PROMPT)]).decode("utf-8", errors="replace")
+            stderr = bytes(self._stderr).decode("utf-8", errors="replace")
+            self._stdout.clear()
+            self._stderr.clear()
+        return stdout, stderr
+
+    @property
+    def alive(self):
+        return self._process is not None and self._process.poll() is None
+
+    def run(self, actions):
+        """
+        Runs one line of Inkscape actions and returns the captured stdout and stderr.
+        """
+        if not self.alive:
+            self.start()
+        self._process.stdin.write((actions + "\n").encode("utf-8"))
+        self._process.stdin.flush()
+        self.jobs += 1
+        return self._wait_for_prompt(self.timeout)
+
+    def close(self):
+        if self._process is None:
+            return
+        try:
+            if self._process.poll() is None:
+                self._process.stdin.write(b"quit\n")
+                self._process.stdin.flush()
+                self._process.wait(timeout=5)
+        except (OSError, subprocess.TimeoutExpired):
+            self._process.kill()
+            self._process.wait()
+        self._process = None
+
+
+def _pdf_page_to_svg(pdf_file, output, page):
+    # PyMuPDF is optional and only used when Inkscape is not installed
+    try:
+        import fitz
+    except ImportError:
+        raise ConversionError("Neither Inkscape nor PyMuPDF is available to convert PDF files") from None
+    with fitz.open(pdf_file) as document:
+        svg = document[page - 1].get_svg_image(text_as_path=False)
+    with open(output, "w", encoding="utf-8") as f:
+        f.write(svg)
+
+
+def _svg_to_pdf(svg_file, output):
+    try:
+        import cairosvg
+    except ImportError:
+        raise ConversionError("Neither Inkscape nor CairoSVG is available to convert SVG files") from None
+    cairosvg.svg2pdf(url=svg_file, write_to=output)
+
+
+class ConversionService:
+    """
+    Converts files through a pool of persistent Inkscape shell workers. Workers are
+    started on demand, recycled after max_jobs conversions and replaced when they time
+    out or crash. Without Inkscape, PDF pages are converted with PyMuPDF and SVGs with
+    CairoSVG when those are installed.
+
+    Parameters:
+    - workers (int): Maximum number of Inkscape processes.
+    - timeout (float): Seconds allowed per conversion.
+    - max_jobs (int): Conversions after which a worker is restarted.
+    - executable (str): Inkscape executable, looked up on PATH by default.
+    """
+
+    def __init__(self, workers=DEFAULT_WORKERS, timeout=DEFAULT_TIMEOUT, max_jobs=MAX_JOBS_PER_WORKER, executable=None):
+        self.executable = executable or shutil.which("inkscape")
+        self.timeout = timeout
+        self.max_jobs = max_jobs
+        self._idle = queue.Queue()
+        self._slots = threading.Semaphore(max(1, workers))
+        self._workers = []
+        self._lock = threading.Lock()
+
+    def _acquire(self):
+        self._slots.acquire()
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            worker = InkscapeWorker(self.executable, self.timeout)
+            with self._lock:
+                self._workers.append(worker)
+            return worker
+
+    def _release(self, worker, healthy):
+        if not healthy or worker.jobs >= self.max_jobs:
+            worker.close()
+        self._idle.put(worker)
+        self._slots.release()
+
+    def _run_inkscape(self, input_file, output, page=None):
+        if ";" in input_file or ";" in output:
+            # Action arguments cannot contain the separator, use a one-off process instead
+            command = [self.executable, "--export-filename=" + output, input_file]
+            if page:
+                command.insert(1, f"--pdf-page={page}")
+            completed = subprocess.run(command, capture_output=True, text=True, timeout=self.timeout)
+            return completed.stdout, completed.stderr
+
+        actions = []
+        if page:
+            actions.append(f"open-page:{page}")
+        actions += [f"file-open:{os.path.abspath(input_file)}", f"export-filename:{os.path.abspath(output)}",
+                    "export-do", "file-close"]
+        worker = self._acquire()
+        healthy = False
+        try:
+            stdout, stderr = worker.run("; ".join(actions))
+            healthy = True
+        finally:
+            self._release(worker, healthy)
+        return stdout, stderr
+
+    def convert(self, input_file, output, page=None):
+        """
+        Converts input_file to output, the format follows the output extension.
+
+        Parameters:
+        - input_file (str): PDF or SVG file to convert.
+        - output (str): Destination file.
+        - page (int): 1-based page to import when input_file is a PDF.
+        """
+        start = time.perf_counter()
+        if os.path.exists(output):
+            os.remove(output)
+        if self.executable:
+            stdout, stderr = self._run_inkscape(input_file, output, page)
+            backend = "inkscape"
+        else:
+            stdout = stderr = ""
+            if output.lower().endswith(".svg"):
+                _pdf_page_to_svg(input_file, output, page or 1)
+                backend = "pymupdf"
+            else:
+                _svg_to_pdf(input_file, output)
+                backend = "cairosvg"
+        if not os.path.exists(output):
+            raise ConversionError(f"Conversion of {input_file} did not produce {output}:\n{stderr}")
+        return ConversionResult(output, stdout, stderr, time.perf_counter() - start, backend)
+
+    def pdf_to_svg(self, pdf_file, output=None, page=None):
+        return self.convert(pdf_file, output or pdf_file + ".svg", page)
+
+    def svg_to_pdf(self, svg_file, output=None):
+        return self.convert(svg_file, output or svg_file + ".pdf")
+
+    def close(self):
+        with self._lock:
+            workers, self._workers = self._workers, []
+        for worker in workers:
+            worker.close()
+
+
+_service = None
+_service_pid = None
+_service_lock = threading.Lock()
+_service_workers = DEFAULT_WORKERS
+# Builds the process-wide service from the number of workers, replaced e.g. by benchmark stubs
+_service_factory = ConversionService
+
+
+def configure_conversion_service(workers):
+    """
+    Sets the size of the process-wide service, e.g. from a process pool initializer so
+    that every pool process keeps a single worker. A service inherited from a forked
+    parent is dropped without closing it, its Inkscape workers belong to the parent.
+    """
+    global _service, _service_pid, _service_lock, _service_workers
+    if _service is not None:
+        atexit.unregister(_service.close)
+        if _service_pid == os.getpid():
+            _service.close()
+    # The lock may have been held by another thread of the parent at fork time
+    _service_lock = threading.Lock()
+    _service = _service_pid = None
+    _service_workers = workers
+
+
+def get_conversion_service():
+    """
+    Returns the process-wide conversion service, creating it on first use.
+    """
+    global _service, _service_pid
+    with _service_lock:
+        if _service is None:
+            _service = _service_factory(workers=_service_workers)
+            _service_pid = os.getpid()
+            atexit.register(_service.close)
+        return _service
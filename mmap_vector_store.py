@@ -0,0 +1,310 @@
+import json
+import os
+import threading
+from typing import Any
+
+import numpy as np
+from llama_index.core.bridge.pydantic import PrivateAttr
+from llama_index.core.indices.query.embedding_utils import get_top_k_mmr_embeddings
+from llama_index.core.vector_stores.simple import (
+    SimpleVectorStore,
+    SimpleVectorStoreData,
+    _build_metadata_filter_fn,
+)
+from llama_index.core.vector_stores.types import (
+    BasePydanticVectorStore,
+    VectorStoreQueryMode,
+    VectorStoreQueryResult,
+)
+from llama_index.core.vector_stores.utils import node_to_metadata_dict
+
+from ann_index import create_ann_index, exact_search
+
+FORMAT = "mmap-v1"
+DTYPES = ("float32", "float16")
+
+
+def vectors_path(persist_path):
+    """
+    Returns the location of the embedding matrix that belongs to the table at persist_path.
+    """
+    base = persist_path[:-len(".json")] if persist_path.endswith(".json") else persist_path
+    return base + ".npy"
+
+
+def _normalize(vectors):
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.where(norms == 0, 1, norms)
+
+
+class MmapVectorStore(BasePydanticVectorStore):
+    """
+    Vector store keeping the embeddings in one contiguous NumPy matrix. It is persisted as
+    an .npy file, which is memory-mapped read-only on load so that processes serving the
+    same index share its pages, next to a JSON table of node ids, document ids and
+    metadata. Embeddings are stored unit-normalized, so a query is a single matrix-vector
+    product followed by an argpartition top-k and ranks like SimpleVectorStore's cosine
+    similarity. Optionally an approximate nearest-neighbour index (see ann_index) answers
+    unfiltered queries once the store is large enough.
+
+    Parameters:
+    - dtype (str): "float32", or "float16" to halve the file size at a small precision cost.
+    - ann (str): "exact", "ivf" or "hnsw".
+    - ann_params (dict): Parameters of the ANN index, e.g. {"nprobe": 16}.
+    """
+
+    stores_text: bool = False
+    dtype: str = "float32"
+    ann: str = "exact"
+    ann_params: dict = {}
+
+    _ann: Any = PrivateAttr(default=None)
+    _vectors: Any = PrivateAttr(default=None)
+    _pending: list = PrivateAttr(default_factory=list)
+    _ids: list = PrivateAttr(default_factory=list)
+    _ref_doc_ids: list = PrivateAttr(default_factory=list)
+    _metadata: list = PrivateAttr(default_factory=list)
+    # Guards the rows against concurrent adds, deletes and the merge of pending rows
+    _lock: Any = PrivateAttr(default_factory=threading.RLock)
+
+    def __init__(self, dtype="float32", ann="exact", ann_params=None, **kwargs):
+        if dtype not in DTYPES:
+            raise ValueError(f"dtype must be one of {DTYPES}, not {dtype}")
+        super().__init__(dtype=dtype, ann=ann, ann_params=ann_params or {}, **kwargs)
+        self._ann = create_ann_index(ann, **self.ann_params)
+
+    def set_ann(self, ann, ann_params=None):
+        """
+        Replaces the ANN index, the new one is built on the next query.
+        """
+        self._ann = create_ann_index(ann, **(ann_params or {}))
+        self.ann = ann
+        self.ann_params = ann_params or {}
+
+    @classmethod
+    def class_name(cls):
+        return "MmapVectorStore"
+
+    @property
+    def client(self):
+        return None
+
+    @property
+    def count(self):
+        # Not __len__, llama_index tests vector stores for truthiness
+        return len(self._ids)
+
+    @property
+    def vectors(self):
+        """
+        The embedding matrix, one unit-normalized row per node.
+        """
+        with self._lock:
+            if self._pending:
+                # Rows added since the last access are appended in one copy
+                rows = np.vstack(self._pending).astype(self.dtype)
+                self._vectors = rows if self._vectors is None or not len(self._vectors) \
+                    else np.vstack([self._vectors, rows])
+                self._pending = []
+            if self._vectors is None:
+                return np.zeros((0, 0), dtype=self.dtype)
+            return self._vectors
+
+    def get(self, text_id):
+        return self.vectors[self._ids.index(text_id)].astype(np.float32).tolist()
+
+    def add(self, nodes, **add_kwargs):
+        if not nodes:
+            return []
+        rows = _normalize(np.asarray([node.get_embedding() for node in nodes], dtype=np.float32))
+        metadata = []
+        for node in nodes:
+            entry = node_to_metadata_dict(node, remove_text=True, flat_metadata=False)
+            entry.pop("_node_content", None)
+            metadata.append(entry)
+        with self._lock:
+            self._pending.append(rows)
+            self._ids.extend(node.node_id for node in nodes)
+            self._ref_doc_ids.extend(node.ref_doc_id or "None" for node in nodes)
+            self._metadata.extend(metadata)
+        return [node.node_id for node in nodes]
+
+    def _keep(self, keep):
+        rows = np.flatnonzero(keep)
+        with self._lock:
+            # Fancy indexing copies the kept rows out of the memory map
+            self._vectors = self.vectors[rows]
+            if self._ann is not None:
+                self._ann.keep(rows)
+            self._ids = [self._ids[i] for i in rows]
+            self._ref_doc_ids = [self._ref_doc_ids[i] for i in rows]
+            self._metadata = [self._metadata[i] for i in rows]
+
+    def delete(self, ref_doc_id, **delete_kwargs):
+        keep = np.array([ref != ref_doc_id for ref in self._ref_doc_ids], dtype=bool)
+        if not keep.all():
+            self._keep(keep)
+
+    def delete_nodes(self, node_ids=None, filters=None, **delete_kwargs):
+        positions = {node_id: i for i, node_id in enumerate(self._ids)}
+        filter_fn = _build_metadata_filter_fn(lambda node_id: self._metadata[positions[node_id]], filters)
+        node_id_set = set(node_ids) if node_ids is not None else None
+        keep = np.array([
+            not ((node_id_set is None or node_id in node_id_set) and filter_fn(node_id))
+            for node_id in self._ids
+        ], dtype=bool)
+        if not keep.all():
+            self._keep(keep)
+
+    def clear(self):
+        with self._lock:
+            self._vectors = None
+            self._pending = []
+            self._ids = []
+            self._ref_doc_ids = []
+            self._metadata = []
+            if self._ann is not None:
+                self._ann.keep(np.zeros(0, dtype=np.int64))
+
+    def _candidates(self, query):
+        if query.filters is None and query.node_ids is None:
+            return None
+        positions = {node_id: i for i, node_id in enumerate(self._ids)}
+        filter_fn = _build_metadata_filter_fn(lambda node_id: self._metadata[positions[node_id]], query.filters)
+        node_id_set = set(query.node_ids) if query.node_ids is not None else None
+        return np.array([
+            i for i, node_id in enumerate(self._ids)
+            if (node_id_set is None or node_id in node_id_set) and filter_fn(node_id)
+        ], dtype=np.int64)
+
+    def query(self, query, **kwargs):
+        vectors = self.vectors
+        rows = self._candidates(query)
+        if rows is not None:
+            vectors = vectors[rows]
+        if not len(self._ids) or not len(vectors):
+            return VectorStoreQueryResult(similarities=[], ids=[])
+        ids = self._ids if rows is None else [self._ids[i] for i in rows]
+
+        if query.mode == VectorStoreQueryMode.MMR:
+            similarities, top_ids = get_top_k_mmr_embeddings(
+                query.query_embedding,
+                vectors.astype(np.float32),
+                similarity_top_k=query.similarity_top_k,
+                embedding_ids=ids,
+                mmr_threshold=kwargs.get("mmr_threshold", None),
+            )
+            return VectorStoreQueryResult(similarities=similarities, ids=top_ids)
+        if query.mode != VectorStoreQueryMode.DEFAULT:
+            raise ValueError(f"Invalid query mode: {query.mode}")
+
+        query_vector = _normalize(np.asarray(query.query_embedding, dtype=np.float32))
+        k = min(query.similarity_top_k or len(vectors), len(vectors))
+        if rows is None and self._ann is not None:
+            self._ann.sync(vectors)
+        if rows is None and self._ann is not None and self._ann.ready:
+            top, scores = self._ann.search(vectors, query_vector, k)
+        else:
+            top, scores = exact_search(vectors, query_vector, k)
+        return VectorStoreQueryResult(
+            similarities=[float(score) for score in scores],
+            ids=[ids[i] for i in top],
+        )
+
+    def persist(self, persist_path, fs=None):
+        """
+        Writes the embedding matrix and the id/metadata table. Both are written to
+        temporary files and renamed, so memory maps of the previous files stay valid.
+        """
+        directory = os.path.dirname(persist_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        matrix_path = vectors_path(persist_path)
+        vectors = self.vectors
+        tmp_path = f"{matrix_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            np.save(f, np.ascontiguousarray(vectors, dtype=self.dtype))
+        os.replace(tmp_path, matrix_path)
+
+        ann_file = None
+        if self._ann is not None:
+            self._ann.sync(vectors)
+            if self._ann.ready:
+                ann_file = os.path.basename(matrix_path)[:-len(".npy")] + ".ann"
+                self._ann.save(os.path.join(os.path.dirname(matrix_path), ann_file))
+
+        table = {
+            "format": FORMAT,
+            "dtype": self.dtype,
+            "count": len(self._ids),
+            "dim": int(vectors.shape[1]) if len(self._ids) else 0,
+            "vectors": os.path.basename(matrix_path),
+            "ann": self.ann,
+            "ann_params": self.ann_params,
+            "ann_file": ann_file,
+            "ids": self._ids,
+            "ref_doc_ids": self._ref_doc_ids,
+            "metadata": self._metadata,
+        }
+        tmp_path = f"{persist_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(table, f)
+        os.replace(tmp_path, persist_path)
+
+    @classmethod
+    def from_persist_path(cls, persist_path, fs=None, mmap=True):
+        """
+        Loads a store written by persist. The embedding matrix is memory-mapped unless
+        mmap is False.
+        """
+        with open(persist_path, encoding="utf-8") as f:
+            table = json.load(f)
+        if table.get("format") != FORMAT:
+            raise ValueError(f"{persist_path} is not a {FORMAT} vector store table")
+        try:
+            store = cls(dtype=table["dtype"], ann=table.get("ann", "exact"), ann_params=table.get("ann_params"))
+        except ImportError as error:
+            print(f"Using an exact scan for {persist_path}: {error}")
+            store = cls(dtype=table["dtype"])
+        if table["count"]:
+            matrix_path = os.path.join(os.path.dirname(persist_path), table["vectors"])
+            vectors = np.load(matrix_path, mmap_mode="r" if mmap else None)
+            if vectors.shape != (table["count"], table["dim"]):
+                raise ValueError(f"{matrix_path} has shape {vectors.shape}, "
+                                 f"expected {(table['count'], table['dim'])}")
+            store._vectors = vectors
+        store._ids = table["ids"]
+        store._ref_doc_ids = table["ref_doc_ids"]
+        store._metadata = table["metadata"]
+        if store._ann is not None and table.get("ann_file"):
+            try:
+                store._ann.load(os.path.join(os.path.dirname(persist_path), table["ann_file"]), store.vectors)
+            except (OSError, ValueError) as error:
+                # The ANN index is derived data and is rebuilt on the next query
+                print(f"Rebuilding the ANN index of {persist_path}: {error}")
+        return store
+
+    @classmethod
+    def from_simple(cls, simple, dtype="float32", ann="exact", ann_params=None):
+        """
+        Converts a SimpleVectorStore, e.g. one persisted as JSON, without re-embedding.
+        """
+        store = cls(dtype=dtype, ann=ann, ann_params=ann_params)
+        data = simple.data
+        store._ids = list(data.embedding_dict)
+        if store._ids:
+            store._vectors = _normalize(np.asarray(list(data.embedding_dict.values()), dtype=np.float32)).astype(dtype)
+        store._ref_doc_ids = [data.text_id_to_ref_doc_id.get(i, "None") for i in store._ids]
+        store._metadata = [(data.metadata_dict or {}).get(i, {}) for i in store._ids]
+        return store
+
+    def to_simple(self):
+        """
+        Returns the content of the store as a SimpleVectorStore.
+        """
+        vectors = self.vectors.astype(np.float32)
+        return SimpleVectorStore(data=SimpleVectorStoreData(
+            embedding_dict={node_id: vectors[i].tolist() for i, node_id in enumerate(self._ids)},
+            text_id_to_ref_doc_id=dict(zip(self._ids, self._ref_doc_ids)),
+            metadata_dict=dict(zip(self._ids, self._metadata)),
+        ))
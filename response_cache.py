@@ -0,0 +1,208 @@
+import hashlib
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+
+import numpy as np
+
+# Defaults of the agent response cache
+RESPONSE_TTL = 24 * 60 * 60
+MAX_RESPONSES = 512
+# Cosine similarity above which a differently worded question counts as the same question.
+# None only reuses answers to the same question, embeddings cannot tell "inflation in 2019"
+# from "inflation in 2020" apart.
+SIMILARITY_THRESHOLD = None
+
+_PUNCTUATION_RE = re.compile(r"[\s?!.,;:]+$")
+_WHITESPACE_RE = re.compile(r"\s+")
+_NUMBER_RE = re.compile(r"\d+(?:[.,]\d+)*")
+
+
+def normalize_question(question):
+    """
+    Normalizes a question so that case, whitespace and trailing punctuation do not
+    change its cache key.
+    """
+    question = _WHITESPACE_RE.sub(" ", question.strip().lower())
+    return _PUNCTUATION_RE.sub("", question)
+
+
+def question_numbers(question):
+    """
+    Returns the numbers in a question, e.g. years. Questions that differ in a number are
+    never near duplicates, however similar their embeddings are.
+    """
+    return tuple(number.replace(",", "") for number in _NUMBER_RE.findall(question))
+
+
+def history_key(messages):
+    """
+    Identifies a conversation by the role and content of its messages, so that a response
+    is only reused after the same conversation.
+
+    Parameters:
+    - messages (list of ChatMessage): The chat history before the question.
+    """
+    return cache_scope(*[(str(message.role), message.content) for message in messages or ()])
+
+
+def cache_scope(*parts):
+    """
+    Builds the scope of cached responses from anything that changes the answers, e.g.
+    the index version and the tool set. Responses are only reused within their scope.
+    """
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(str(part).encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+@dataclass
+class CachedResponse:
+    question: str
+    response: str
+    image_path: str
+    scope: str
+    created: float
+    embedding: np.ndarray = None
+    artifacts: list = field(default_factory=list)
+    history: str = None
+    numbers: tuple = ()
+
+
+class ResponseCache:
+    """
+    In-process cache of agent responses keyed by the normalized question, a scope (see
+    cache_scope) and the chat history before the question (see history_key), so that a
+    follow-up question is not answered with the response given in another conversation.
+    With an embedding function and a similarity_threshold, a question whose embedding is
+    at least that similar to a cached question with the same scope, history and numbers
+    is a hit as well. Entries expire after ttl seconds and the least recently used
+    entries are evicted beyond max_entries.
+
+    Parameters:
+    - ttl (float): Seconds a response stays valid.
+    - max_entries (int): Maximum number of cached responses.
+    - embed (callable): Maps a question to its embedding.
+    - similarity_threshold (float): Cosine similarity needed for a near-duplicate hit, None
+      to only match the same question.
+    """
+
+    def __init__(self, ttl=RESPONSE_TTL, max_entries=MAX_RESPONSES, embed=None,
+                 similarity_threshold=SIMILARITY_THRESHOLD):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.embed = embed
+        self.similarity_threshold = similarity_threshold
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _key(self, question, scope, history):
+        return cache_scope(scope, history, normalize_question(question))
+
+    def _embedding(self, question):
+        if self.embed is None or self.similarity_threshold is None:
+            return None
+        embedding = np.asarray(self.embed(normalize_question(question)), dtype=np.float32)
+        norm = np.linalg.norm(embedding)
+        return embedding / norm if norm else embedding
+
+    def _valid(self, entry, now):
+        if now - entry.created > self.ttl:
+            return False
+        # A response pointing to a chart that was deleted cannot be replayed, unless the chart is held in memory
+        if not entry.artifacts:
+            return entry.image_path is None or os.path.exists(entry.image_path)
+        return all(artifact.data is not None or os.path.exists(artifact.path) for artifact in entry.artifacts)
+
+    def _purge(self, now):
+        for key in [key for key, entry in self._entries.items() if not self._valid(entry, now)]:
+            del self._entries[key]
+
+    def get(self, question, scope, history=()):
+        """
+        Returns the CachedResponse for question within scope after the chat history, or
+        None on a miss.
+        """
+        now = time.time()
+        history = history_key(history)
+        key = self._key(question, scope, history)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and not self._valid(entry, now):
+                del self._entries[key]
+                entry = None
+            if entry is not None:
+                return self._hit(key, entry)
+            if not any(self._candidate(e, scope, history, question) for e in self._entries.values()):
+                self.misses += 1
+                return None
+
+        # The question is embedded outside the lock, it may call the embedding API
+        embedding = self._embedding(question)
+        with self._lock:
+            key, entry = self._nearest(embedding, scope, history, question, now)
+            if entry is None:
+                self.misses += 1
+                return None
+            return self._hit(key, entry)
+
+    def _hit(self, key, entry):
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry
+
+    @staticmethod
+    def _candidate(entry, scope, history, question):
+        return (entry.embedding is not None and entry.scope == scope and entry.history == history
+                and entry.numbers == question_numbers(question))
+
+    def _nearest(self, embedding, scope, history, question, now):
+        candidates = [(key, entry) for key, entry in self._entries.items()
+                      if self._candidate(entry, scope, history, question) and self._valid(entry, now)]
+        if embedding is None or not candidates:
+            return None, None
+        similarities = np.stack([entry.embedding for _, entry in candidates]) @ embedding
+        best = int(np.argmax(similarities))
+        if similarities[best] < self.similarity_threshold:
+            return None, None
+        return candidates[best]
+
+    def put(self, question, scope, response, image_path=None, artifacts=(), history=()):
+        """
+        Caches the response to question within scope after the chat history, together
+        with the path of the chart image and the other artifacts it created, if any.
+        """
+        now = time.time()
+        history = history_key(history)
+        entry = CachedResponse(question, str(response), image_path, scope, now, self._embedding(question),
+                               list(artifacts), history, question_numbers(question))
+        key = self._key(question, scope, history)
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            self._purge(now)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return entry
+
+    def invalidate(self, scope=None):
+        """
+        Drops every cached response, or only those outside scope. Called when the
+        indexes change.
+        """
+        with self._lock:
+            if scope is None:
+                self._entries.clear()
+            else:
+                for key in [key for key, entry in self._entries.items() if entry.scope != scope]:
+                    del self._entries[key]
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses, "entries": len(self._entries)}
@@ -0,0 +1,340 @@
+import argparse
+import io
+import math
+import os
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import xml.etree.ElementTree as ET
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+
+from pypdf import PdfReader, PdfWriter, Transformation
+from pypdf.generic import DictionaryObject, NameObject, StreamObject
+
+from inkscape_service import ConversionError, get_conversion_service
+from svg_extract import (
+    IDENTITY,
+    apply_matrix,
+    clean_text,
+    collect_scene,
+    local_name,
+    matrix_scale,
+    multiply_matrix,
+    parse_length,
+    parse_svg,
+    parse_transform,
+)
+
+RASTER_SUFFIXES = (".png", ".jpg", ".jpeg", ".tif", ".tiff", ".bmp")
+DEFAULT_WORKERS = 4
+OCR_LANGUAGE = "eng"
+OCR_TIMEOUT = 120.0
+
+# Characters the cp1252 text layer lacks, replaced by their ASCII look-alikes so that
+# e.g. the minus sign of matplotlib's negative tick labels stays searchable
+_ASCII_GLYPHS = str.maketrans({
+    "\u2212": "-", "\u2010": "-", "\u2011": "-", "\u2012": "-", "\u2043": "-",
+    "\u2007": " ", "\u2009": " ", "\u200a": " ", "\u202f": " ", "\u2044": "/", "\u2215": "/",
+})
+
+
+class SearchablePdfError(RuntimeError):
+    pass
+
+
+@dataclass
+class TextItem:
+    text: str
+    x: float
+    y: float
+    size: float
+    angle: float = 0.0
+
+
+@dataclass
+class SearchablePdf:
+    source: str
+    data: bytes
+    output: str = None
+    backend: str = "svg-text"
+    words: int = 0
+    timings: dict = field(default_factory=dict)
+
+    def report(self):
+        steps = ", ".join(f"{step} {seconds * 1000:.0f} ms" for step, seconds in self.timings.items())
+        return f"{self.source}: {self.words} words via {self.backend} ({steps})"
+
+
+def _length_points(text):
+    # SVG user units are CSS pixels, 0.75 points each
+    length = parse_length(text, None)
+    return length * 0.75 if length is not None else None
+
+
+def _page_geometry(root):
+    """
+    Returns the page size in points and the mapping of SVG user units onto it as
+    (width, height, (min_x, min_y, scale_x, scale_y)).
+    """
+    view_box = [float(v) for v in re.split(r"[\s,]+", (root.get("viewBox") or "").strip()) if v]
+    width, height = _length_points(root.get("width")), _length_points(root.get("height"))
+    if len(view_box) != 4:
+        view_box = [0.0, 0.0, (width or 600.0) / 0.75, (height or 400.0) / 0.75]
+    min_x, min_y, box_width, box_height = view_box
+    width = width or box_width * 0.75
+    height = height or box_height * 0.75
+    return width, height, (min_x, min_y, width / box_width, height / box_height)
+
+
+def _comment_words(root):
+    """
+    Returns the text of matplotlib SVGs, which draws glyphs as paths and keeps the text
+    only in a comment of every text_* group.
+    """
+    items = []
+
+    def walk(elem, matrix):
+        tag = local_name(elem.tag)
+        if tag is None or tag in ("defs", "clipPath", "mask", "metadata", "style"):
+            return
+        matrix = multiply_matrix(matrix, parse_transform(elem.get("transform")))
+        if tag == "g" and elem.get("id", "").startswith("text_") and len(elem) and elem[0].tag is ET.Comment \
+                and not any(local_name(e.tag) == "text" for e in elem.iter()):
+            text = clean_text(elem[0].text)
+            # The glyphs are drawn by a child group translated to the baseline and scaled
+            # from font units, 100 font units per point of font size
+            glyphs = next((e for e in elem.iter() if e is not elem and e.get("transform")), None)
+            glyph_matrix = multiply_matrix(matrix, parse_transform(glyphs.get("transform"))) if glyphs is not None else matrix
+            if text:
+                x, y = apply_matrix(glyph_matrix, 0, 0)
+                angle = math.degrees(math.atan2(glyph_matrix[1], glyph_matrix[0]))
+                size = matrix_scale(glyph_matrix) * 100 if glyphs is not None else 10.0
+                items.append(TextItem(text, x, y, size, angle))
+            return
+        for child in elem:
+            walk(child, matrix)
+
+    walk(root, IDENTITY)
+    return items
+
+
+def svg_text_items(svg_text):
+    """
+    Reads the text of an SVG with the position, size and angle of every word in SVG
+    user units, from text elements and from matplotlib's text comments.
+
+    Parameters:
+    - svg_text (str): The raw SVG markup.
+    """
+    root = parse_svg(svg_text)
+    words, _ = collect_scene(root)
+    items = [TextItem(word.text, word.x, word.y, word.size, word.angle) for word in words]
+    return root, items + _comment_words(root)
+
+
+def _pdf_string(text):
+    data = text.translate(_ASCII_GLYPHS).encode("cp1252", errors="replace")
+    return b"(" + data.replace(b"\\", b"\\\\").replace(b"(", b"\\(").replace(b")", b"\\)") + b")"
+
+
+def text_layer(width, height, items, mapping):
+    """
+    Returns a one-page PDF writer whose page holds items as invisible text (render mode
+    3), which PDF readers and text extraction find but which does not cover the drawing.
+
+    Parameters:
+    - width, height (float): Page size in points.
+    - items (list of TextItem): Words in SVG user units.
+    - mapping (tuple): (min_x, min_y, scale_x, scale_y) from user units to points.
+    """
+    min_x, min_y, scale_x, scale_y = mapping
+    content = [b"BT", b"3 Tr"]
+    for item in items:
+        # SVG y grows downwards and its angles turn clockwise, PDF is the other way round
+        x = (item.x - min_x) * scale_x
+        y = height - (item.y - min_y) * scale_y
+        angle = math.radians(-item.angle)
+        cos, sin = math.cos(angle), math.sin(angle)
+        size = max(item.size * scale_y, 1.0)
+        content.append(f"/F1 {size:.2f} Tf {cos:.4f} {sin:.4f} {-sin:.4f} {cos:.4f} {x:.2f} {y:.2f} Tm".encode())
+        # The trailing space keeps words apart in text extraction, the glyph widths of the
+        # layer do not match the drawing
+        content.append(_pdf_string(item.text + " ") + b" Tj")
+    content.append(b"ET")
+
+    writer = PdfWriter()
+    page = writer.add_blank_page(width, height)
+    font = DictionaryObject({
+        NameObject("/Type"): NameObject("/Font"),
+        NameObject("/Subtype"): NameObject("/Type1"),
+        NameObject("/BaseFont"): NameObject("/Helvetica"),
+        NameObject("/Encoding"): NameObject("/WinAnsiEncoding"),
+    })
+    # Only public pypdf API: the font is a direct object, which PDF allows in resources, and
+    # replace_contents adds the content stream to the writer as the indirect object it must be
+    page[NameObject("/Resources")] = DictionaryObject({
+        NameObject("/Font"): DictionaryObject({NameObject("/F1"): font}),
+    })
+    stream = StreamObject()
+    stream.set_data(b"\n".join(content))
+    page.replace_contents(stream)
+    return writer
+
+
+def _vector_pdf(svg_file, directory):
+    # The drawing itself still needs an SVG renderer, Inkscape or CairoSVG
+    output = os.path.join(directory, "vector.pdf")
+    get_conversion_service().svg_to_pdf(svg_file, output)
+    return PdfReader(output)
+
+
+def _ocr_pdf(image_file, language=OCR_LANGUAGE):
+    """
+    Returns the PDF tesseract writes to stdout for image_file, the image with its text.
+    """
+    executable = shutil.which("tesseract")
+    if executable is None:
+        raise SearchablePdfError(f"tesseract is needed to read the text of {image_file}")
+    completed = subprocess.run([executable, image_file, "stdout", "-l", language, "pdf"],
+                               capture_output=True, timeout=OCR_TIMEOUT)
+    if completed.returncode != 0 or not completed.stdout.startswith(b"%PDF"):
+        raise SearchablePdfError(f"tesseract failed on {image_file}: {completed.stderr.decode(errors='replace')}")
+    return completed.stdout
+
+
+def _svg_searchable_pdf(svg_file, render, timings, directory):
+    start = time.perf_counter()
+    with open(svg_file, encoding="utf-8") as f:
+        svg_text = f.read()
+    try:
+        root, items = svg_text_items(svg_text)
+        width, height, mapping = _page_geometry(root)
+    except (ET.ParseError, ValueError) as error:
+        raise SearchablePdfError(f"{svg_file} is not a valid SVG: {error}") from None
+    timings["read text"] = time.perf_counter() - start
+
+    if not items:
+        # Text drawn as plain paths can only be recovered from a raster image
+        if not get_conversion_service().executable:
+            raise SearchablePdfError(f"{svg_file} has no text elements and Inkscape is not available to rasterize it")
+        start = time.perf_counter()
+        image_file = os.path.join(directory, "raster.png")
+        get_conversion_service().convert(svg_file, image_file)
+        timings["rasterize"] = time.perf_counter() - start
+        return _raster_searchable_pdf(image_file, timings), "tesseract", 0
+
+    start = time.perf_counter()
+    writer = text_layer(width, height, items, mapping)
+    timings["text layer"] = time.perf_counter() - start
+    backend = "svg-text"
+    if render:
+        start = time.perf_counter()
+        try:
+            vector = _vector_pdf(svg_file, directory)
+        except ConversionError as error:
+            print(f"Writing {svg_file} without its drawing: {error}")
+        else:
+            page = vector.pages[0]
+            box = page.mediabox
+            page.merge_transformed_page(writer.pages[0], Transformation().scale(
+                float(box.width) / width, float(box.height) / height).translate(float(box.left), float(box.bottom)))
+            writer = PdfWriter()
+            writer.add_page(page)
+            backend = "svg-text+vector"
+        timings["render"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    buffer = io.BytesIO()
+    writer.write(buffer)
+    timings["write"] = time.perf_counter() - start
+    return buffer.getvalue(), backend, len(items)
+
+
+def _raster_searchable_pdf(image_file, timings):
+    start = time.perf_counter()
+    data = _ocr_pdf(image_file)
+    timings["ocr"] = time.perf_counter() - start
+    return data
+
+
+def make_searchable_pdf(path, output=None, render=False):
+    """
+    Builds a text-searchable PDF of a chart in memory. The words of an SVG are read from
+    its text elements and written as an invisible text layer, which needs no OCR and no
+    external tool. Raster images, and SVGs whose text is drawn as paths, are read with
+    tesseract instead. Intermediate files live in a private temporary directory, so
+    parallel runs do not interfere.
+
+    Parameters:
+    - path (str): SVG or raster image file.
+    - output (str): Where to write the PDF, path + ".pdf" by default, or "" to only return it.
+    - render (bool): Put the text layer over the drawing of the SVG, rendered with
+      Inkscape or CairoSVG. Without it the PDF only holds the text, which is all the
+      indexes read.
+    """
+    timings = {}
+    with tempfile.TemporaryDirectory(prefix="searchable-pdf-") as directory:
+        if path.lower().endswith(RASTER_SUFFIXES):
+            data, backend, words = _raster_searchable_pdf(path, timings), "tesseract", 0
+        else:
+            data, backend, words = _svg_searchable_pdf(path, render, timings, directory)
+
+    output = path + ".pdf" if output is None else output
+    if output:
+        start = time.perf_counter()
+        tmp_path = f"{output}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, output)
+        timings["save"] = time.perf_counter() - start
+    return SearchablePdf(path, data, output or None, backend, words, timings)
+
+
+def make_searchable_pdfs(paths, output_dir=None, render=False, workers=DEFAULT_WORKERS):
+    """
+    Runs make_searchable_pdf on several files in parallel threads and returns the
+    results in the order of paths. Failures are printed and skipped.
+
+    Parameters:
+    - paths (list of str): SVG or raster image files.
+    - output_dir (str): Directory of the PDFs, next to every input by default.
+    - render (bool): See make_searchable_pdf.
+    - workers (int): Files converted at once.
+    """
+    if output_dir:
+        os.makedirs(output_dir, exist_ok=True)
+
+    def convert(path):
+        output = os.path.join(output_dir, os.path.basename(path) + ".pdf") if output_dir else None
+        try:
+            return make_searchable_pdf(path, output, render)
+        except (OSError, SearchablePdfError, ConversionError, subprocess.TimeoutExpired) as error:
+            print(f"Failed to make {path} searchable: {error}")
+            return None
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        return [result for result in executor.map(convert, paths) if result is not None]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Make chart SVGs and images text-searchable PDFs.")
+    parser.add_argument("paths", nargs="+", help="SVG or raster image files")
+    parser.add_argument("--output-dir", default=None, help="directory of the PDFs, next to the inputs by default")
+    parser.add_argument("--render", action="store_true", help="include the drawing of SVGs (needs Inkscape or CairoSVG)")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS)
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    results = make_searchable_pdfs(args.paths, args.output_dir, args.render, args.workers)
+    for result in results:
+        print(result.report())
+    print(f"{len(results)} of {len(args.paths)} files in {time.perf_counter() - start:.2f}s")
+    return 0 if len(results) == len(args.paths) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
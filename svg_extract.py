@@ -0,0 +1,945 @@
+import math
+import re
+import unicodedata
+import xml.etree.ElementTree as ET
+from dataclasses import dataclass, field
+
+# Extractions scoring below this are handed to the LLM instead
+CONFIDENCE_THRESHOLD = 0.7
+
+# SVG transforms are (a, b, c, d, e, f) tuples, see multiply_matrix
+IDENTITY = (1.0, 0.0, 0.0, 1.0, 0.0, 0.0)
+_TRANSFORM_RE = re.compile(r"(matrix|translate|scale|rotate|skewX|skewY)\s*\(([^)]*)\)")
+NUMBER_RE = re.compile(r"[-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?")
+_LENGTH_RE = re.compile(r"^\s*([-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?)\s*([a-z]*)\s*$")
+# User units (CSS pixels) per unit of the absolute SVG length units
+_UNIT_PIXELS = {"": 1.0, "px": 1.0, "pt": 4 / 3, "pc": 16.0, "mm": 96 / 25.4, "cm": 96 / 2.54, "in": 96.0}
+# Path data grammar, shared with svg_minify so that both read paths the same way
+PATH_TOKEN_RE = re.compile(r"[MmLlHhVvCcSsQqTtAaZz]|[-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?")
+PATH_ARITY = {"M": 2, "L": 2, "H": 1, "V": 1, "C": 6, "S": 4, "Q": 4, "T": 2, "A": 7, "Z": 0}
+_HIGHCHARTS_POINT_RE = re.compile(r"^(.*?),\s*(-?[\d,]*\.?\d+)\.\s*(.*?)\.?$")
+_HIGHCHARTS_TYPES = {
+    "line": "line", "spline": "line", "area": "area", "areaspline": "area",
+    "column": "bar", "bar": "horizontal bar", "scatter": "scatter", "pie": "pie",
+}
+
+
+@dataclass
+class ChartSeries:
+    name: str = None
+    color: str = None
+    points: list = field(default_factory=list)  # [(x label, numeric value), ...]
+
+
+@dataclass
+class ChartExtraction:
+    title: str = None
+    chart_type: str = None
+    generator: str = None
+    x_label: str = None
+    y_label: str = None
+    series: list = field(default_factory=list)
+    confidence: float = 0.0
+
+    def to_description(self):
+        """
+        Renders the extraction in the same bullet style the LLM is prompted to produce.
+        """
+        lines = []
+        if self.title:
+            lines.append(f'Title of the chart is "{self.title}".')
+        if self.chart_type:
+            lines.append(f"• Chart type is a {self.chart_type} chart.")
+        if self.generator:
+            lines.append(f"• Chart created using {self.generator}.")
+        if self.x_label:
+            lines.append(f'• X-axis is labeled "{self.x_label}".')
+        if self.y_label:
+            lines.append(f'• Y-axis is labeled "{self.y_label}".')
+        colors = [s.color for s in self.series if s.color]
+        if colors:
+            lines.append(f"• Data points are colored in {', '.join(dict.fromkeys(colors))}.")
+
+        x_name = self.x_label or (_looks_like_years(self.series) and "Year") or ""
+        for series in self.series:
+            if not series.points:
+                continue
+            first, last = series.points[0][0], series.points[-1][0]
+            prefix = f"{series.name}: " if series.name and len(self.series) > 1 else ""
+            subject = series.name or self.y_label or "values"
+            lines.append(f"• The chart shows {subject} from {first} to {last}.")
+            for x, y in series.points:
+                lines.append(f"• {prefix}{x_name + ' ' if x_name else ''}{x} was {_format_number(y)}.")
+        return "\n".join(lines)
+
+
+def _looks_like_years(series):
+    labels = [x for s in series for x, _ in s.points]
+    return bool(labels) and all(re.fullmatch(r"(19|20)\d\d", str(x)) for x in labels)
+
+
+def _format_number(value):
+    return f"{value:.6g}"
+
+
+# ---------------------------------------------------------------------------- #
+# Geometry helpers
+
+def multiply_matrix(m, n):
+    """
+    Returns the transform applying n first and then m, like nested SVG transform attributes.
+    """
+    a, b, c, d, e, f = m
+    a2, b2, c2, d2, e2, f2 = n
+    return (
+        a * a2 + c * b2, b * a2 + d * b2,
+        a * c2 + c * d2, b * c2 + d * d2,
+        a * e2 + c * f2 + e, b * e2 + d * f2 + f,
+    )
+
+
+def parse_transform(text):
+    """
+    Returns the matrix of an SVG transform attribute, IDENTITY if text is empty.
+    """
+    matrix = IDENTITY
+    for name, args in _TRANSFORM_RE.findall(text or ""):
+        values = [float(v) for v in NUMBER_RE.findall(args)]
+        if name == "matrix" and len(values) == 6:
+            step = tuple(values)
+        elif name == "translate" and values:
+            step = (1, 0, 0, 1, values[0], values[1] if len(values) > 1 else 0)
+        elif name == "scale" and values:
+            step = (values[0], 0, 0, values[1] if len(values) > 1 else values[0], 0, 0)
+        elif name == "rotate" and values:
+            angle = math.radians(values[0])
+            step = (math.cos(angle), math.sin(angle), -math.sin(angle), math.cos(angle), 0, 0)
+            if len(values) == 3:
+                cx, cy = values[1], values[2]
+                step = multiply_matrix(multiply_matrix((1, 0, 0, 1, cx, cy), step), (1, 0, 0, 1, -cx, -cy))
+        elif name == "skewX" and values:
+            step = (1, 0, math.tan(math.radians(values[0])), 1, 0, 0)
+        elif name == "skewY" and values:
+            step = (1, math.tan(math.radians(values[0])), 0, 1, 0, 0)
+        else:
+            continue
+        matrix = multiply_matrix(matrix, step)
+    return matrix
+
+
+def apply_matrix(m, x, y):
+    """
+    Returns the point (x, y) transformed by m.
+    """
+    a, b, c, d, e, f = m
+    return a * x + c * y + e, b * x + d * y + f
+
+
+def matrix_scale(m):
+    """
+    Returns the average scale factor of m, e.g. to transform font sizes.
+    """
+    return math.sqrt(abs(m[0] * m[3] - m[1] * m[2])) or 1.0
+
+
+def path_vertices(d):
+    """
+    Returns the absolute end points of every segment of an SVG path and whether it is closed.
+    Curves are reduced to their end points, which is enough to locate data values.
+    """
+    tokens = PATH_TOKEN_RE.findall(d or "")
+    points = []
+    closed = False
+    x = y = start_x = start_y = 0.0
+    command = None
+    i = 0
+    while i < len(tokens):
+        token = tokens[i]
+        if token.isalpha():
+            command = token
+            i += 1
+            if command in "Zz":
+                closed = True
+                x, y = start_x, start_y
+                points.append((x, y))
+                continue
+        if command is None:
+            break
+        upper = command.upper()
+        arity = PATH_ARITY[upper]
+        args = tokens[i:i + arity]
+        if len(args) < arity or any(a.isalpha() for a in args):
+            break
+        values = [float(a) for a in args]
+        i += arity
+        relative = command.islower()
+        if upper == "H":
+            x = values[0] + (x if relative else 0)
+        elif upper == "V":
+            y = values[0] + (y if relative else 0)
+        else:
+            nx, ny = values[-2], values[-1]
+            x, y = (x + nx, y + ny) if relative else (nx, ny)
+        if upper == "M":
+            start_x, start_y = x, y
+            # Further coordinate pairs after a move are implicit line-tos
+            command = "l" if relative else "L"
+        points.append((x, y))
+    return points, closed
+
+
+def _style_value(elem, name, inherited=None):
+    style = elem.get("style", "")
+    match = re.search(r"(?:^|;)\s*" + re.escape(name) + r"\s*:\s*([^;]+)", style)
+    if match:
+        return match.group(1).strip()
+    return elem.get(name, inherited)
+
+
+def local_name(tag):
+    """
+    Returns an element tag without its namespace, None for comments.
+    """
+    return tag.rsplit("}", 1)[-1] if isinstance(tag, str) else None
+
+
+def parse_length(text, default=0.0):
+    """
+    Returns an SVG length in user units, default when it is missing. Percentages,
+    font-relative units and values that are not numbers give None.
+    """
+    if text is None:
+        return default
+    match = _LENGTH_RE.match(text)
+    if not match or match.group(2) not in _UNIT_PIXELS:
+        return None
+    return float(match.group(1)) * _UNIT_PIXELS[match.group(2)]
+
+
+def _classes(elem):
+    return elem.get("class", "").split()
+
+
+def _parse_number(text):
+    cleaned = unicodedata.normalize("NFKC", text).replace("−", "-").strip()
+    cleaned = cleaned.replace(",", "").replace("$", "").replace("%", "").strip()
+    try:
+        return float(cleaned)
+    except ValueError:
+        return None
+
+
+def clean_text(text):
+    """
+    Normalizes Unicode forms and whitespace of SVG text.
+    """
+    return re.sub(r"\s+", " ", unicodedata.normalize("NFKC", text or "")).strip()
+
+
+def _element_text(elem):
+    return clean_text("".join(elem.itertext()))
+
+
+# ---------------------------------------------------------------------------- #
+# Scene collection for the generic extractor
+
+@dataclass
+class _Word:
+    text: str
+    x: float
+    y: float
+    size: float
+    angle: float = 0.0
+    run: int = 0
+
+    @property
+    def center(self):
+        return self.x + 0.275 * self.size * len(self.text)
+
+
+@dataclass
+class _Shape:
+    points: list
+    closed: bool
+    fill: str
+    stroke: str
+
+    @property
+    def bbox(self):
+        xs = [p[0] for p in self.points]
+        ys = [p[1] for p in self.points]
+        return min(xs), min(ys), max(xs), max(ys)
+
+
+def _split_glyph_run(text, xs, size):
+    """
+    Splits a tspan with per-glyph x positions into words. PDF exports often drop the
+    space characters and only leave a wider gap between glyphs.
+    """
+    words = []
+    current = ""
+    start = None
+    for i, char in enumerate(text):
+        x = xs[i] if i < len(xs) else (xs[-1] if xs else 0.0)
+        if char.isspace():
+            if current:
+                words.append((current, start))
+            current, start = "", None
+            continue
+        if current and i < len(xs) and i > 0:
+            previous = text[i - 1]
+            expected = 1.0 if previous in "mwMW%@" else 0.35 if previous in "ijlft.,:;!|'" else 0.7
+            if xs[i] - xs[i - 1] > (expected + 0.2) * size:
+                words.append((current, start))
+                current, start = "", None
+        if start is None:
+            start = x
+        current += char
+    if current:
+        words.append((current, start))
+    return words
+
+
+def collect_scene(root):
+    """
+    Returns the words and shapes drawn by an SVG in page coordinates, with every
+    transform applied. Words have text, x, y (baseline), size and angle.
+    """
+    words = []
+    shapes = []
+
+    def walk(elem, matrix, size, fill, stroke, anchor):
+        tag = local_name(elem.tag)
+        if tag is None or tag in ("defs", "clipPath", "mask", "metadata", "style", "title", "desc"):
+            return
+        matrix = multiply_matrix(matrix, parse_transform(elem.get("transform")))
+        size_text = _style_value(elem, "font-size")
+        if size_text:
+            parsed = _parse_number(size_text.replace("px", ""))
+            size = parsed or size
+        fill = _style_value(elem, "fill", fill)
+        stroke = _style_value(elem, "stroke", stroke)
+        anchor = _style_value(elem, "text-anchor", anchor)
+
+        if tag == "text":
+            _collect_text(elem, matrix, size, anchor, words)
+            return
+        if tag == "path":
+            points, closed = path_vertices(elem.get("d"))
+            if points:
+                shapes.append(_Shape([apply_matrix(matrix, *p) for p in points], closed, fill, stroke))
+        elif tag == "rect":
+            x, y, w, h = (parse_length(elem.get(k)) for k in ("x", "y", "width", "height"))
+            if None not in (x, y, w, h):
+                corners = [(x, y), (x + w, y), (x + w, y + h), (x, y + h)]
+                shapes.append(_Shape([apply_matrix(matrix, *p) for p in corners], True, fill, stroke))
+        elif tag in ("polyline", "polygon", "line"):
+            if tag == "line":
+                values = [parse_length(elem.get(k)) for k in ("x1", "y1", "x2", "y2")]
+                if None in values:
+                    values = []
+            else:
+                values = [float(v) for v in NUMBER_RE.findall(elem.get("points", ""))]
+            points = list(zip(values[0::2], values[1::2]))
+            if points:
+                shapes.append(_Shape([apply_matrix(matrix, *p) for p in points], tag == "polygon", fill, stroke))
+        for child in elem:
+            walk(child, matrix, size, fill, stroke, anchor)
+
+    walk(root, IDENTITY, 12.0, "black", "none", "start")
+    return words, shapes
+
+
+def _collect_text(elem, matrix, size, anchor, words):
+    angle = math.degrees(math.atan2(matrix[1], matrix[0]))
+    parts = [(elem, elem.text)] + [(child, child.text) for child in elem if local_name(child.tag) == "tspan"]
+    base_x = [float(v) for v in NUMBER_RE.findall(elem.get("x", "0"))] or [0.0]
+    base_y = _parse_number(elem.get("y", "0") or "0") or 0.0
+    for part, text in parts:
+        if not text or not text.strip():
+            continue
+        part_size = size
+        size_text = _style_value(part, "font-size") if part is not elem else None
+        if size_text:
+            part_size = _parse_number(size_text.replace("px", "")) or size
+        text = unicodedata.normalize("NFKC", text)
+        xs = [float(v) for v in NUMBER_RE.findall(part.get("x", ""))] or base_x
+        if len(xs) == 1 and anchor in ("middle", "end"):
+            # Estimate where an anchored run starts, glyph widths are not known here
+            width = 0.55 * part_size * len(text.strip())
+            xs = [xs[0] - (width / 2 if anchor == "middle" else width)]
+        y = _parse_number(part.get("y", "") or "") if part.get("y") else base_y
+        dy = part.get("dy", "")
+        if dy and not dy.endswith("em"):
+            y += _parse_number(dy) or 0.0
+        scale = matrix_scale(matrix)
+        run = len(words) + 1
+        for word, x in _split_glyph_run(text, xs, part_size):
+            px, py = apply_matrix(matrix, x, y)
+            words.append(_Word(word, px, py, part_size * scale, angle, run))
+
+
+# ---------------------------------------------------------------------------- #
+# Layout specific extractors
+
+def _extract_highcharts(root):
+    extraction = ChartExtraction(generator="Highcharts")
+    for elem in root.iter():
+        classes = _classes(elem)
+        if "highcharts-title" in classes:
+            extraction.title = _element_text(elem) or None
+        elif "highcharts-axis" in classes:
+            for title in elem.iter():
+                if "highcharts-axis-title" in _classes(title):
+                    if "highcharts-xaxis" in classes:
+                        extraction.x_label = _element_text(title) or None
+                    elif "highcharts-yaxis" in classes:
+                        extraction.y_label = _element_text(title) or None
+
+    series_by_name = {}
+    for elem in root.iter():
+        classes = _classes(elem)
+        if not extraction.chart_type:
+            for cls in classes:
+                if cls.startswith("highcharts-") and cls.endswith("-series") and cls != "highcharts-series":
+                    kind = cls[len("highcharts-"):-len("-series")]
+                    extraction.chart_type = _HIGHCHARTS_TYPES.get(kind, kind)
+        if "highcharts-point" not in classes or not elem.get("aria-label"):
+            continue
+        match = _HIGHCHARTS_POINT_RE.match(elem.get("aria-label").strip())
+        if not match:
+            continue
+        x, y, name = match.group(1), _parse_number(match.group(2)), match.group(3)
+        if y is None:
+            continue
+        series = series_by_name.setdefault(name, ChartSeries(name=name, color=elem.get("fill")))
+        series.points.append((x, y))
+
+    extraction.series = list(series_by_name.values())
+    if extraction.series:
+        extraction.confidence = 0.95 if extraction.title else 0.85
+    return extraction
+
+
+def _comment_text(group):
+    for child in group:
+        if child.tag is ET.Comment:
+            return clean_text(child.text)
+    for child in group:
+        if local_name(child.tag) == "text":
+            return _element_text(child)
+    return None
+
+
+def _find_by_id(parent, prefix):
+    return [child for child in parent if local_name(child.tag) == "g" and child.get("id", "").startswith(prefix)]
+
+
+def _tick_positions(axis, prefix, coordinate):
+    ticks = []
+    for tick in _find_by_id(axis, prefix):
+        label = None
+        position = None
+        for child in tick:
+            if child.get("id", "").startswith("text_"):
+                label = _comment_text(child)
+        for use in tick.iter():
+            if local_name(use.tag) == "use" and use.get(coordinate) is not None:
+                position = parse_length(use.get(coordinate))
+                break
+        if label is not None and position is not None:
+            ticks.append((label, position))
+    return ticks
+
+
+def _axis_label(axis):
+    for child in axis:
+        if child.get("id", "").startswith("text_"):
+            return _comment_text(child)
+    return None
+
+
+def _linear_map(ticks):
+    """
+    Fits value = a * pixel + b through numeric tick labels. Returns (a, b, r2) or None.
+    """
+    pairs = [(pixel, _parse_number(label)) for label, pixel in ticks]
+    pairs = [(p, v) for p, v in pairs if v is not None]
+    if len(pairs) < 2:
+        return None
+    n = len(pairs)
+    mean_p = sum(p for p, _ in pairs) / n
+    mean_v = sum(v for _, v in pairs) / n
+    spp = sum((p - mean_p) ** 2 for p, _ in pairs)
+    if spp == 0:
+        return None
+    a = sum((p - mean_p) * (v - mean_v) for p, v in pairs) / spp
+    b = mean_v - a * mean_p
+    svv = sum((v - mean_v) ** 2 for _, v in pairs)
+    residual = sum((v - (a * p + b)) ** 2 for p, v in pairs)
+    r2 = 1.0 - residual / svv if svv else 0.0
+    return a, b, r2
+
+
+def _precision(ticks, extra):
+    """
+    Number of decimals to report values with: the precision of the tick labels plus extra.
+    Values recovered from pixel positions are not more precise than that.
+    """
+    decimals = 0
+    for label, _ in ticks:
+        cleaned = label.replace("−", "-").rstrip("%").strip()
+        if "." in cleaned:
+            decimals = max(decimals, len(cleaned.split(".", 1)[1]))
+    return decimals + extra
+
+
+def _nearest_label(ticks, position, spacing):
+    best = min(ticks, key=lambda t: abs(t[1] - position))
+    if spacing and abs(best[1] - position) > spacing / 2:
+        return None
+    return best[0]
+
+
+def _spacing(ticks):
+    positions = sorted(p for _, p in ticks)
+    gaps = [b - a for a, b in zip(positions, positions[1:]) if b - a > 0]
+    return min(gaps) if gaps else None
+
+
+def _legend_entries(axes):
+    """
+    Returns the (color, label) entries of a matplotlib legend. Every entry is a sample
+    line or patch followed by its text.
+    """
+    entries = []
+    for legend in _find_by_id(axes, "legend_"):
+        color = None
+        for child in legend:
+            ident = child.get("id", "")
+            if ident.startswith("line2d_") or ident.startswith("patch_"):
+                for path in child.iter():
+                    if local_name(path.tag) == "path":
+                        color = _style_value(path, "stroke" if ident.startswith("line2d_") else "fill")
+                        break
+            elif ident.startswith("text_") and color:
+                entries.append((color.lower(), _comment_text(child)))
+                color = None
+    return entries
+
+
+def _limit_confidence(extraction, charts=1):
+    """
+    The description covers a single chart whose series can be told apart. Several charts
+    in one SVG, or several series without names, are left to the LLM.
+    """
+    unnamed = len(extraction.series) > 1 and any(not s.name for s in extraction.series)
+    if charts > 1 or unnamed:
+        extraction.confidence = min(extraction.confidence, CONFIDENCE_THRESHOLD - 0.1)
+    return extraction
+
+
+def _extract_matplotlib(root):
+    extraction = ChartExtraction(generator="matplotlib")
+    all_axes = [elem for elem in root.iter() if local_name(elem.tag) == "g" and elem.get("id", "").startswith("axes_")]
+    if not all_axes:
+        return extraction
+    axes = all_axes[0]
+
+    x_axis = y_axis = None
+    for child in axes:
+        ident = child.get("id", "")
+        if ident.startswith("matplotlib.axis_"):
+            if _find_by_id(child, "xtick_"):
+                x_axis = child
+            elif _find_by_id(child, "ytick_"):
+                y_axis = child
+        elif ident.startswith("text_"):
+            extraction.title = _comment_text(child)
+    if x_axis is None or y_axis is None:
+        return extraction
+
+    extraction.x_label = _axis_label(x_axis)
+    extraction.y_label = _axis_label(y_axis)
+    x_ticks = _tick_positions(x_axis, "xtick_", "x")
+    y_ticks = _tick_positions(y_axis, "ytick_", "y")
+    y_map = _linear_map(y_ticks)
+    x_map = _linear_map(x_ticks)
+    if not x_ticks or not y_ticks:
+        return extraction
+
+    bars = []
+    lines = []
+    for child in axes:
+        ident = child.get("id", "")
+        if not (ident.startswith("patch_") or ident.startswith("line2d_")):
+            continue
+        for path in child.iter():
+            if local_name(path.tag) != "path" or not path.get("clip-path"):
+                continue
+            points, closed = path_vertices(path.get("d"))
+            color = _style_value(path, "fill") if ident.startswith("patch_") else _style_value(path, "stroke")
+            if ident.startswith("patch_") and closed:
+                bars.append((_Shape(points, closed, color, None)))
+            elif ident.startswith("line2d_") and len(points) >= 1:
+                lines.append((points, color))
+
+    series = []
+    digits = _precision(y_ticks, 2)
+    if bars and y_map:
+        a, b, _ = y_map
+        x_spacing = _spacing(x_ticks)
+        zero = -b / a if a else None
+        points = []
+        for bar in bars:
+            x0, y0, x1, y1 = bar.bbox
+            label = _nearest_label(x_ticks, (x0 + x1) / 2, x_spacing)
+            if label is None:
+                continue
+            # Bars grow from the zero line, so the end further from it carries the value
+            top = y0 if zero is None or abs(y0 - zero) >= abs(y1 - zero) else y1
+            points.append((label, round(a * top + b, digits)))
+        if points:
+            extraction.chart_type = "bar"
+            series.append(ChartSeries(color=bars[0].fill, points=points))
+    elif lines and y_map:
+        a, b, _ = y_map
+        x_spacing = _spacing(x_ticks)
+        for vertices, color in lines:
+            points = []
+            for x, y in vertices:
+                label = _nearest_label(x_ticks, x, x_spacing) if x_map is None else x_map[0] * x + x_map[1]
+                if label is None:
+                    continue
+                label = label if isinstance(label, str) else _format_number(round(label, _precision(x_ticks, 2)))
+                points.append((label, round(a * y + b, digits)))
+            if points:
+                series.append(ChartSeries(color=color, points=points))
+        if series:
+            extraction.chart_type = "line"
+
+    legend = _legend_entries(axes)
+    names = dict(legend)
+    for entry in series:
+        entry.name = names.get((entry.color or "").lower())
+
+    extraction.series = series
+    if series:
+        fit = y_map[2] if y_map else 0.0
+        extraction.confidence = min(1.0, 0.6 + 0.2 * (fit > 0.999) + 0.1 * bool(extraction.title)
+                                    + 0.1 * bool(extraction.x_label or extraction.y_label))
+        if len(legend) > len(series):
+            # e.g. stacked or grouped bars, which are read as a single series
+            extraction.confidence = min(extraction.confidence, CONFIDENCE_THRESHOLD - 0.1)
+    return _limit_confidence(extraction, len(all_axes))
+
+
+def _cluster(values, key, tolerance):
+    groups = []
+    for item in sorted(values, key=key):
+        if groups and abs(key(item) - key(groups[-1][-1])) <= tolerance:
+            groups[-1].append(item)
+        else:
+            groups.append([item])
+    return groups
+
+
+def _text_lines(words):
+    lines = []
+    for row in _cluster(words, lambda w: round(w.y, 1), 0.5):
+        row.sort(key=lambda w: w.x)
+        merged = [row[0]]
+        last = row[0]
+        for word in row[1:]:
+            previous = merged[-1]
+            end = last.x + 0.6 * last.size * len(last.text)
+            if word.x - end > 1.2 * max(word.size, last.size):
+                merged.append(word)
+                last = word
+                continue
+            if word.run == last.run:
+                joiner = " "
+            else:
+                # Glyph runs split by ligatures (e.g. "In" "ﬂ" "ation") join without a space
+                gap = word.x - (last.x + 0.5 * last.size * len(last.text))
+                joiner = "" if gap < 0.15 * last.size else " "
+            merged[-1] = _Word(previous.text + joiner + word.text, previous.x, previous.y,
+                               max(previous.size, word.size), previous.angle, word.run)
+            last = word
+        lines.extend(merged)
+    return lines
+
+
+def _tick_pixel(word, vertical, grid):
+    # Labels sit on their baseline, the tick itself lines up with the label center
+    pixel = word.y - 0.35 * word.size if vertical else word.center
+    near = [g for g in grid if abs(g - pixel) <= 0.8 * word.size]
+    return min(near, key=lambda g: abs(g - pixel)) if near else pixel
+
+
+def _grid_positions(shapes, vertical):
+    """
+    Returns the pixel positions of straight grid or tick lines running across a value axis.
+    """
+    positions = []
+    for shape in shapes:
+        if shape.closed or len(shape.points) < 2:
+            continue
+        x0, y0, x1, y1 = shape.bbox
+        if vertical and y1 - y0 < 0.5 and x1 - x0 > 2:
+            positions.append((y0 + y1) / 2)
+        elif not vertical and x1 - x0 < 0.5 and y1 - y0 > 2:
+            positions.append((x0 + x1) / 2)
+    return positions
+
+
+def _find_numeric_axis(words, shapes, vertical):
+    """
+    Looks for a column (vertical axis) or row (horizontal axis) of numeric tick labels
+    that maps linearly onto pixel positions.
+    """
+    grid = _grid_positions(shapes, vertical)
+    numeric = [w for w in words if _parse_number(w.text) is not None and abs(w.angle) < 5]
+    if vertical:
+        groups = _cluster(numeric, lambda w: w.x + 0.6 * w.size * len(w.text), 4.0)
+    else:
+        groups = _cluster(numeric, lambda w: w.y, 1.0)
+    best = None
+    for group in groups:
+        if len(group) < 3:
+            continue
+        ticks = [(w.text, _tick_pixel(w, vertical, grid)) for w in group]
+        fit = _linear_map(ticks)
+        if fit is None or fit[2] < 0.995:
+            continue
+        if best is None or len(group) > len(best[0]):
+            best = (group, ticks, fit)
+    return best
+
+
+def _extract_generic(root):
+    extraction = ChartExtraction()
+    words, shapes = collect_scene(root)
+    if not words:
+        return extraction
+
+    value_axis = _find_numeric_axis(words, shapes, vertical=True)
+    horizontal = False
+    if value_axis is None:
+        value_axis = _find_numeric_axis(words, shapes, vertical=False)
+        horizontal = value_axis is not None
+    if value_axis is None:
+        return extraction
+    axis_words, value_ticks, (a, b, r2) = value_axis
+    size = axis_words[0].size
+    low = min(p for _, p in value_ticks)
+    high = max(p for _, p in value_ticks)
+    axis_ids = {id(w) for w in axis_words}
+
+    # Category labels sit just outside the plot, across from the value axis
+    if horizontal:
+        anchor_x = min(w.x for w in axis_words)
+        candidates = [w for w in words if id(w) not in axis_ids and w.x < low
+                      and low - 8 * size <= w.x and min(w.y for w in axis_words) - size > w.y]
+        candidates = [w for w in candidates if w.y <= max(w2.y for w2 in axis_words)]
+        categories = [(w.text, w.y - 0.35 * w.size) for w in candidates]
+        plot = (low, None, high, anchor_x)
+    else:
+        anchor_x = max(w.x for w in axis_words)
+        rows = _cluster([w for w in words if id(w) not in axis_ids and w.x > anchor_x
+                         and high < w.y <= high + 3 * size], lambda w: w.y, 1.0)
+        rows = [r for r in rows if len(r) >= 2]
+        categories = [(w.text, w.center) for w in rows[0]] if rows else []
+        plot = (anchor_x, low, None, high)
+    if len(categories) < 2:
+        return extraction
+    categories.sort(key=lambda c: c[1])
+    spacing = _spacing(categories)
+
+    fit = (a, b, _precision(value_ticks, 1))
+    series = _series_from_markers(shapes, categories, spacing, fit, low, high, size, horizontal)
+    chart_type = "line"
+    if not series:
+        series = _series_from_bars(shapes, categories, spacing, fit, low, high, horizontal)
+        chart_type = "horizontal bar" if horizontal else "bar"
+    if not series and not horizontal:
+        series = _series_from_lines(shapes, categories, spacing, fit, low, high)
+        chart_type = "line"
+    if not series:
+        return extraction
+
+    extraction.series = series
+    extraction.chart_type = chart_type
+    _label_generic(extraction, words, axis_words, categories, shapes, plot, low, high, size, horizontal)
+    coverage = max(len(s.points) for s in series) / len(categories)
+    extraction.confidence = min(1.0, 0.5 * coverage + 0.2 * (r2 > 0.999) + 0.1 * bool(extraction.title)
+                                + 0.1 + 0.1 * bool(extraction.x_label or extraction.y_label))
+    return _limit_confidence(extraction)
+
+
+def _series_from_markers(shapes, categories, spacing, fit, low, high, size, horizontal):
+    a, b, digits = fit
+    by_color = {}
+    for shape in shapes:
+        if not shape.closed or not shape.fill or shape.fill == "none":
+            continue
+        x0, y0, x1, y1 = shape.bbox
+        if not (0 < x1 - x0 <= 2 * size and 0 < y1 - y0 <= 2 * size):
+            continue
+        cx, cy = (x0 + x1) / 2, (y0 + y1) / 2
+        value_pixel, category_pixel = (cx, cy) if horizontal else (cy, cx)
+        if not (low - size <= value_pixel <= high + size):
+            continue
+        by_color.setdefault(shape.fill, []).append((category_pixel, value_pixel))
+    series = []
+    for color, markers in by_color.items():
+        points = []
+        for label, position in categories:
+            near = [m for m in markers if not spacing or abs(m[0] - position) <= spacing / 2]
+            if near:
+                closest = min(near, key=lambda m: abs(m[0] - position))
+                points.append((label, round(a * closest[1] + b, digits)))
+        if len(points) >= max(2, len(categories) // 2):
+            series.append(ChartSeries(color=color, points=points))
+    return series
+
+
+def _series_from_bars(shapes, categories, spacing, fit, low, high, horizontal):
+    a, b, digits = fit
+    zero = -b / a if a else None
+    points_by_color = {}
+    for shape in shapes:
+        if not shape.closed or not shape.fill or shape.fill in ("none", "#ffffff", "white"):
+            continue
+        x0, y0, x1, y1 = shape.bbox
+        width, height = (y1 - y0, x1 - x0) if horizontal else (x1 - x0, y1 - y0)
+        start, end = (x0, x1) if horizontal else (y0, y1)
+        center = (y0 + y1) / 2 if horizontal else (x0 + x1) / 2
+        if width <= 1 or height <= 0 or (spacing and width > spacing * 1.1):
+            continue
+        if start < low - 1 or end > high + 1:
+            continue
+        label = _nearest_label(categories, center, spacing)
+        if label is None:
+            continue
+        edge = end if zero is None or abs(end - zero) >= abs(start - zero) else start
+        points_by_color.setdefault(shape.fill, []).append((center, label, round(a * edge + b, digits)))
+    series = []
+    for color, bars in points_by_color.items():
+        bars.sort()
+        if len(bars) >= 2:
+            series.append(ChartSeries(color=color, points=[(label, value) for _, label, value in bars]))
+    return series
+
+
+def _series_from_lines(shapes, categories, spacing, fit, low, high):
+    a, b, digits = fit
+    first, last = categories[0][1], categories[-1][1]
+    series = []
+    for shape in shapes:
+        if shape.closed or not shape.stroke or shape.stroke == "none" or len(shape.points) < 3:
+            continue
+        xs = [p[0] for p in shape.points]
+        ys = [p[1] for p in shape.points]
+        if max(ys) - min(ys) < 1 or max(xs) - min(xs) < 0.5 * (last - first):
+            continue
+        if min(ys) < low - 1 or max(ys) > high + 1:
+            continue
+        vertices = sorted(shape.points)
+        points = []
+        for label, position in categories:
+            y = _interpolate(vertices, position)
+            if y is not None:
+                points.append((label, round(a * y + b, digits)))
+        if points:
+            series.append(ChartSeries(color=shape.stroke, points=points))
+    return series
+
+
+def _interpolate(vertices, x):
+    for (x0, y0), (x1, y1) in zip(vertices, vertices[1:]):
+        if x0 <= x <= x1:
+            if x1 == x0:
+                return y0
+            return y0 + (y1 - y0) * (x - x0) / (x1 - x0)
+    return None
+
+
+def _label_generic(extraction, words, axis_words, categories, shapes, plot, low, high, size, horizontal):
+    label_texts = {label for label, _ in categories} | {w.text for w in axis_words}
+    lines = [line for line in _text_lines(words) if line.text not in label_texts]
+    if horizontal:
+        top = min(w.y for w in axis_words) - 10 * size
+        bottom = max(w.y for w in axis_words)
+        left, right = low, high
+    else:
+        top, bottom = low, high
+        left = plot[0]
+        right = max(pos for _, pos in categories) + size
+    height = bottom - top
+    width = right - left
+
+    above = [line for line in lines if top - 0.35 * height <= line.y < top
+             and left - 0.1 * width <= line.x <= right and abs(line.angle) < 5]
+    if above:
+        largest = max(line.size for line in above)
+        extraction.title = max((l for l in above if l.size >= largest - 0.1), key=lambda l: l.y).text
+
+    rotated = [line for line in lines if abs(abs(line.angle) - 90) < 5 and line.x < left]
+    if rotated:
+        extraction.y_label = max(rotated, key=lambda l: l.x).text
+
+    below = [line for line in lines if bottom + size < line.y <= bottom + 5 * size and abs(line.angle) < 5]
+    for line in sorted(below, key=lambda l: l.y):
+        # A small sample shape right before the text marks a legend entry, not an axis title
+        samples = [s for s in shapes
+                   if line.x - 3 * size <= s.bbox[2] <= line.x and abs((s.bbox[1] + s.bbox[3]) / 2 - line.y) <= size]
+        if samples:
+            # The entry names the series drawn in the color of its sample
+            colors = {c for s in samples for c in (s.fill, s.stroke)}
+            unnamed = [s for s in extraction.series if not s.name]
+            matching = [s for s in unnamed if s.color in colors]
+            if not matching and len(extraction.series) == 1:
+                matching = unnamed
+            if matching:
+                matching[0].name = line.text
+        elif not extraction.x_label and "highcharts" not in line.text.lower():
+            extraction.x_label = line.text
+    if any("highcharts" in line.text.lower() for line in lines):
+        extraction.generator = "Highcharts"
+
+
+# ---------------------------------------------------------------------------- #
+
+def parse_svg(svg_text):
+    """
+    Parses SVG markup keeping comments, which matplotlib uses to carry text drawn as glyph paths.
+    """
+    parser = ET.XMLParser(target=ET.TreeBuilder(insert_comments=True))
+    return ET.fromstring(svg_text, parser=parser)
+
+
+def extract_chart(svg_text):
+    """
+    Extracts the title, axis labels and data points of a chart directly from its SVG.
+    Handles matplotlib and Highcharts output, and falls back to a geometric analysis
+    of tick labels, markers, bars and lines for other SVGs (e.g. Inkscape PDF exports).
+    The confidence of the result tells whether it can replace the LLM description.
+
+    Parameters:
+    - svg_text (str): The raw SVG markup.
+    """
+    try:
+        root = parse_svg(svg_text)
+        if "highcharts-root" in _classes(root):
+            extraction = _extract_highcharts(root)
+            if extraction.confidence:
+                return extraction
+        if any(local_name(e.tag) == "g" and e.get("id") == "figure_1" for e in root.iter()):
+            extraction = _extract_matplotlib(root)
+            if extraction.confidence:
+                return extraction
+        return _extract_generic(root)
+    except (ET.ParseError, ValueError):
+        # Markup the extractors cannot read is left to the LLM description
+        return ChartExtraction()
@@ -0,0 +1,307 @@
+import functools
+import io
+import re
+import xml.etree.ElementTree as ET
+from dataclasses import dataclass
+
+from chart_cache import normalize_svg
+from svg_extract import NUMBER_RE, PATH_ARITY, PATH_TOKEN_RE, path_vertices
+
+# Token budget for the SVG part of the chart description prompt
+DEFAULT_TOKEN_BUDGET = 16000
+# Vertices kept per path once the budget forces path simplification
+MAX_PATH_VERTICES = 120
+
+# Elements that never carry chart semantics
+_DROPPED_ELEMENTS = {
+    "defs", "clipPath", "mask", "style", "script", "metadata", "namedview", "font",
+    "font-face", "glyph", "missing-glyph", "pattern", "filter", "linearGradient",
+    "radialGradient", "marker", "symbol",
+}
+_TEXT_ELEMENTS = {"text", "tspan", "textPath", "title", "desc"}
+_CONTAINERS = {"svg", "g", "a", "switch"}
+_KEPT_ATTRIBUTES = {
+    "d", "x", "y", "dx", "dy", "x1", "y1", "x2", "y2", "cx", "cy", "r", "rx", "ry",
+    "width", "height", "points", "transform", "viewBox", "fill", "stroke",
+    "font-size", "font-weight", "text-anchor", "class", "aria-label",
+}
+_STYLE_PROPERTIES = {"fill", "stroke", "font-size", "font-weight", "text-anchor"}
+_NUMERIC_ATTRIBUTES = {
+    "d", "x", "y", "dx", "dy", "x1", "y1", "x2", "y2", "cx", "cy", "r", "rx", "ry",
+    "width", "height", "points", "transform", "viewBox",
+}
+# matplotlib encodes the chart structure in its ids, other generators' ids are noise
+_SEMANTIC_ID_RE = re.compile(r"^(figure|axes|patch|line2d|xtick|ytick|text|legend|matplotlib\.axis)_\d+$")
+
+
+@dataclass
+class MinifyReport:
+    bytes_in: int
+    bytes_out: int
+    tokens_in: int
+    tokens_out: int
+    level: int
+
+    @property
+    def tokens_saved(self):
+        return self.tokens_in - self.tokens_out
+
+    def __str__(self):
+        return (f"SVG reduced from {self.bytes_in} to {self.bytes_out} bytes "
+                f"(~{self.tokens_in} -> ~{self.tokens_out} tokens, ~{self.tokens_saved} saved, level {self.level})")
+
+
+@functools.lru_cache(maxsize=None)
+def _encoding(model):
+    try:
+        import tiktoken
+        return tiktoken.encoding_for_model(model)
+    except Exception:
+        # tiktoken is optional and cannot fetch its vocabulary when offline
+        return None
+
+
+def estimate_tokens(text, model="gpt-4-turbo"):
+    """
+    Estimates the number of prompt tokens of text. Uses tiktoken when it is available
+    and falls back to the usual four characters per token otherwise.
+    """
+    encoding = _encoding(model)
+    if encoding is None:
+        return len(text) // 4 + 1
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def _format_number(value, decimals):
+    text = f"{value:.{decimals}f}"
+    if "." in text:
+        text = text.rstrip("0").rstrip(".")
+    return "0" if text in ("-0", "") else text
+
+
+def _round_numbers(text, decimals):
+    return NUMBER_RE.sub(lambda m: _format_number(float(m.group(0)), decimals), text)
+
+
+def _compact_path(d, decimals):
+    """
+    Rounds path coordinates, drops segments that repeat the previous one or do not
+    move the pen, and writes the path without redundant separators.
+    """
+    tokens = PATH_TOKEN_RE.findall(d)
+    segments = []
+    command = None
+    i = 0
+    while i < len(tokens):
+        if tokens[i].isalpha():
+            command = tokens[i]
+            i += 1
+            if command in "Zz":
+                segments.append((command, ()))
+                continue
+        if command is None:
+            break
+        arity = PATH_ARITY[command.upper()]
+        args = tokens[i:i + arity]
+        if len(args) < arity or any(a.isalpha() for a in args):
+            break
+        i += arity
+        values = tuple(_format_number(float(a), decimals) for a in args)
+        if command in "lhv" and all(v == "0" for v in values):
+            continue
+        if segments and segments[-1] == (command, values) and command in "LHV":
+            continue
+        segments.append((command, values))
+        if command in "Mm":
+            command = "l" if command == "m" else "L"
+
+    parts = []
+    previous = None
+    for command, values in segments:
+        # Repeated commands can be left implicit
+        implicit = previous == command and command not in "MmZz"
+        parts.append(("" if implicit else command) + " ".join(values))
+        previous = command
+    return " ".join(parts)
+
+
+def _simplify_path(d, decimals, max_vertices):
+    points, closed = path_vertices(d)
+    if len(points) <= max_vertices:
+        return _compact_path(d, decimals)
+    step = len(points) / max_vertices
+    sampled = [points[int(i * step)] for i in range(max_vertices)] + [points[-1]]
+    coordinates = [f"{_format_number(x, decimals)} {_format_number(y, decimals)}" for x, y in sampled]
+    return "M" + coordinates[0] + "L" + " ".join(coordinates[1:]) + ("Z" if closed else "")
+
+
+def _local(name):
+    return name.rsplit("}", 1)[-1]
+
+
+def _escape(text):
+    return text.replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;")
+
+
+def _quote(value):
+    return '"' + _escape(value).replace('"', "&quot;") + '"'
+
+
+def _attributes(elem, tag, decimals, simplify):
+    attributes = {}
+    for name, value in elem.attrib.items():
+        local = _local(name)
+        if name.startswith("{") and not name.startswith("{http://www.w3.org/2000/svg}"):
+            continue
+        if local == "id" and _SEMANTIC_ID_RE.match(value):
+            attributes["id"] = value
+        elif local == "style":
+            for declaration in value.split(";"):
+                key, _, style_value = declaration.partition(":")
+                if key.strip() in _STYLE_PROPERTIES and style_value.strip():
+                    attributes[key.strip()] = style_value.strip()
+        elif local in _KEPT_ATTRIBUTES:
+            attributes[local] = value
+    for name, value in attributes.items():
+        if name == "d":
+            attributes[name] = _simplify_path(value, decimals, MAX_PATH_VERTICES) if simplify else _compact_path(value, decimals)
+        elif name in ("x", "y") and tag in ("text", "tspan"):
+            # Per-glyph position lists only matter at their first value
+            attributes[name] = _round_numbers(value.split()[0] if value.split() else value, decimals)
+        elif name in _NUMERIC_ATTRIBUTES:
+            attributes[name] = _round_numbers(value, decimals)
+    return "".join(f" {name}={_quote(value)}" for name, value in attributes.items())
+
+
+@dataclass
+class _Open:
+    tag: str
+    start: str
+    element: object
+    keeps_text: bool
+    transparent: bool = False
+    emitted: bool = False
+    text_written: bool = False
+
+
+def _reduce(source, decimals, simplify):
+    out = []
+    stack = []
+    skip_depth = 0
+    last_ended = None
+    seen_leaves = set()
+
+    def flush():
+        # Start tags are written lazily so that elements left empty can be dropped
+        for entry in stack:
+            if not entry.emitted and not entry.transparent:
+                out.append(entry.start + ">")
+            entry.emitted = True
+
+    def write_text(entry):
+        text = entry.element.text
+        if entry.keeps_text and not entry.text_written and text and text.strip():
+            flush()
+            out.append(_escape(text))
+        entry.text_written = True
+
+    for event, elem in ET.iterparse(source, events=("start", "end", "comment")):
+        # The tail of the previous element is only complete once the parser moves on
+        if last_ended is not None:
+            tail = last_ended.tail
+            if not skip_depth and stack and stack[-1].keeps_text and tail and tail.strip():
+                flush()
+                out.append(_escape(tail))
+            last_ended.clear()
+            last_ended = None
+
+        if event == "comment":
+            # matplotlib writes the text of glyph-outlined labels into comments
+            if not skip_depth and elem.text and elem.text.strip():
+                flush()
+                out.append(f"<!--{elem.text}-->")
+            continue
+
+        tag = _local(elem.tag)
+        if event == "start":
+            glyph_reference = tag == "use" and elem.get("x") is None and elem.get("y") is None
+            if skip_depth or tag in _DROPPED_ELEMENTS or glyph_reference:
+                skip_depth += 1
+                continue
+            if stack:
+                write_text(stack[-1])
+            attributes = _attributes(elem, tag, decimals, simplify)
+            start = f"<{tag}{attributes}"
+            if tag == "svg" and not stack:
+                start += ' xmlns="http://www.w3.org/2000/svg"'
+            keeps_text = tag in _TEXT_ELEMENTS or bool(stack and stack[-1].keeps_text)
+            transparent = bool(stack) and tag in _CONTAINERS and not attributes
+            stack.append(_Open(tag, start, elem, keeps_text, transparent))
+            continue
+
+        if skip_depth:
+            skip_depth -= 1
+            if not skip_depth:
+                elem.clear()
+            continue
+        entry = stack[-1]
+        write_text(entry)
+        stack.pop()
+        if entry.emitted:
+            if not entry.transparent:
+                out.append(f"</{tag}>")
+        elif tag not in _CONTAINERS:
+            leaf = entry.start + "/>"
+            # Identical leaves (e.g. duplicated markers or grid lines) are sent once
+            if leaf not in seen_leaves:
+                flush()
+                out.append(leaf)
+                seen_leaves.add(leaf)
+        last_ended = elem
+    return "".join(out)
+
+
+def minify_svg(source, token_budget=DEFAULT_TOKEN_BUDGET, decimals=1, model="gpt-4-turbo"):
+    """
+    Reduces an SVG to the parts an LLM needs to describe the chart: drops definitions,
+    clip paths, styles, metadata and font glyph outlines, keeps semantic attributes,
+    rounds coordinates and removes repeated path segments. The file is parsed as a
+    stream. If the result still exceeds token_budget, coordinates are rounded further,
+    long paths are resampled and finally the markup is truncated. Malformed SVGs are
+    only whitespace-normalized (level 0).
+
+    Parameters:
+    - source (str or file-like): Path to the SVG file or an open binary stream.
+    - token_budget (int): Maximum estimated tokens of the reduced SVG.
+    - decimals (int): Decimals kept in coordinates at the first reduction level.
+    - model (str): Model whose tokenizer is used for the estimate.
+
+    Returns the reduced SVG text and a MinifyReport.
+    """
+    if isinstance(source, str):
+        with open(source, "rb") as f:
+            raw = f.read()
+    else:
+        raw = source.read()
+    raw_text = raw.decode("utf-8", errors="replace") if isinstance(raw, bytes) else raw
+    data = raw if isinstance(raw, bytes) else raw.encode("utf-8")
+    tokens_in = estimate_tokens(raw_text, model)
+
+    levels = [(decimals, False), (0, False), (0, True)]
+    for level, (level_decimals, simplify) in enumerate(levels, start=1):
+        try:
+            reduced = _reduce(io.BytesIO(data), level_decimals, simplify)
+        except ET.ParseError:
+            # Malformed markup cannot be streamed, only its whitespace and comments are removed
+            reduced = normalize_svg(raw_text)
+            level = 0
+        tokens_out = estimate_tokens(reduced, model)
+        if tokens_out <= token_budget or level == 0:
+            break
+    if tokens_out > token_budget:
+        level = len(levels) + 1
+        reduced = reduced[:token_budget * 3] + "<!-- truncated -->"
+        tokens_out = estimate_tokens(reduced, model)
+
+    report = MinifyReport(len(data), len(reduced.encode("utf-8")), tokens_in, tokens_out, level)
+    return reduced, report
@@ -0,0 +1,34 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from chart_render import STYLES, _templates, render_chart
+
+
+def rendered_axes(style="default"):
+    # render_chart leaves the last chart drawn on the figure template of the thread
+    return _templates.figures[STYLES[style]][1]
+
+
+def test_numeric_x_keeps_real_positions():
+    image = render_chart("line", [(2015, 1.5), (2016, 1.8), (2017, 2.1)])
+    ax = rendered_axes()
+    left, right = ax.get_xlim()
+    assert image
+    assert 2014 < left < 2015 and 2017 < right < 2018
+    labels = [tick.get_text() for tick in ax.get_xticklabels()]
+    assert not any(label.startswith("Item") for label in labels)
+    assert {"2015", "2016", "2017"} <= set(labels)
+
+
+def test_categorical_x_labels_ticks():
+    render_chart("bar", {"a": 1, "b": 2, "c": 3})
+    ax = rendered_axes()
+    assert [tick.get_text() for tick in ax.get_xticklabels()] == ["a", "b", "c"]
+
+
+def test_values_without_x_are_numbered():
+    render_chart("bar", [4, 5, 6])
+    ax = rendered_axes()
+    assert [tick.get_text() for tick in ax.get_xticklabels()] == ["Item 1", "Item 2", "Item 3"]
@@ -0,0 +1,31 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from svg_extract import CONFIDENCE_THRESHOLD, collect_scene, extract_chart, parse_length, parse_svg
+
+SVG = ('<svg xmlns="http://www.w3.org/2000/svg">'
+       '<rect width="100%" height="100%" fill="white"/>'
+       '<rect x="3px" y="4" width="10mm" height="5" fill="red"/>'
+       '<line x1="0" y1="0" x2="50%" y2="3" stroke="black"/>'
+       '</svg>')
+
+
+def test_parse_length_units():
+    assert parse_length("3px") == 3.0
+    assert parse_length("1in") == 96.0
+    assert parse_length(None) == 0.0
+    assert parse_length("100%") is None
+    assert parse_length("auto") is None
+
+
+def test_relative_lengths_skip_shapes():
+    _, shapes = collect_scene(parse_svg(SVG))
+    assert len(shapes) == 1
+    assert shapes[0].fill == "red"
+
+
+def test_unreadable_svg_falls_back():
+    assert extract_chart(SVG).confidence < CONFIDENCE_THRESHOLD
+    assert extract_chart('<svg xmlns="http://www.w3.org/2000/svg"><rect x="1e"/></svg>').confidence == 0.0
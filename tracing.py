@@ -0,0 +1,392 @@
+import argparse
+import contextlib
+import contextvars
+import json
+import os
+import sys
+import threading
+import time
+import uuid
+from collections import deque
+from dataclasses import dataclass, field
+
+import numpy as np
+from llama_index.core.instrumentation import get_dispatcher
+from llama_index.core.instrumentation.event_handlers import BaseEventHandler
+from llama_index.core.bridge.pydantic import PrivateAttr
+from llama_index.core.tools.types import AsyncBaseTool, adapt_to_async_tool
+
+# Spans are appended to TRACE_FILE as they end, as JSON lines or as OTLP/JSON export
+# requests that OpenTelemetry collectors and viewers read. No file is written by default.
+TRACE_FILE = os.getenv("TRACE_FILE", "")
+TRACE_FORMAT = os.getenv("TRACE_FORMAT", "jsonl")
+TRACE_FORMATS = ("jsonl", "otlp")
+# Finished spans kept in memory for the summaries and the web app debug panel
+MAX_SPANS = 10000
+SERVICE_NAME = "chart-question-answering"
+
+_current_span = contextvars.ContextVar("trace_span", default=None)
+
+
+@dataclass
+class Span:
+    name: str
+    kind: str
+    trace_id: str
+    span_id: str
+    parent_id: str = None
+    start: float = 0.0  # Epoch seconds
+    duration: float = None  # Seconds, None while the span is open
+    attributes: dict = field(default_factory=dict)
+    error: str = None
+    _clock: float = field(default=0.0, repr=False, compare=False)
+
+    @property
+    def ms(self):
+        return None if self.duration is None else self.duration * 1000
+
+    def to_dict(self):
+        return {"name": self.name, "kind": self.kind, "trace_id": self.trace_id, "span_id": self.span_id,
+                "parent_id": self.parent_id, "start": self.start, "duration": self.duration,
+                "attributes": self.attributes, "error": self.error}
+
+    @classmethod
+    def from_dict(cls, record):
+        return cls(**record)
+
+    def to_otlp(self):
+        """
+        Returns the span as an OTLP/JSON export request holding this span alone.
+        """
+        start = int(self.start * 1e9)
+        attributes = [_otlp_attribute("cqp.kind", self.kind)]
+        attributes += [_otlp_attribute(key, value) for key, value in self.attributes.items()]
+        span = {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": 1,  # SPAN_KIND_INTERNAL
+            "startTimeUnixNano": str(start),
+            "endTimeUnixNano": str(start + int((self.duration or 0.0) * 1e9)),
+            "attributes": attributes,
+            "status": {"code": 2, "message": self.error} if self.error else {"code": 1},
+        }
+        if self.parent_id:
+            span["parentSpanId"] = self.parent_id
+        return {"resourceSpans": [{
+            "resource": {"attributes": [_otlp_attribute("service.name", SERVICE_NAME)]},
+            "scopeSpans": [{"scope": {"name": __name__}, "spans": [span]}],
+        }]}
+
+
+def _otlp_attribute(key, value):
+    if isinstance(value, bool):
+        typed = {"boolValue": value}
+    elif isinstance(value, int):
+        typed = {"intValue": str(value)}
+    elif isinstance(value, float):
+        typed = {"doubleValue": value}
+    else:
+        typed = {"stringValue": str(value)}
+    return {"key": key, "value": typed}
+
+
+def current_span():
+    return _current_span.get()
+
+
+class Tracer:
+    """
+    Records timed spans of the work done for a question or an ingestion run. A span
+    started inside another span becomes its child, also across asyncio tasks and
+    asyncio.to_thread, and shares its trace id. Finished spans are kept in memory, up
+    to max_spans, and written to path if one is given.
+
+    Parameters:
+    - path (str): File the spans are appended to, or "" to keep them in memory only.
+    - format (str): "jsonl" for one span per line, or "otlp" for OTLP/JSON export requests.
+    - max_spans (int): Finished spans kept in memory.
+    """
+
+    def __init__(self, path=TRACE_FILE, format=TRACE_FORMAT, max_spans=MAX_SPANS):
+        if format not in TRACE_FORMATS:
+            raise ValueError(f"Unknown trace format {format}, expected one of {TRACE_FORMATS}")
+        self.path = path
+        self.format = format
+        self.spans = deque(maxlen=max_spans)
+        self._lock = threading.Lock()
+
+    def start_span(self, name, kind, parent=None, **attributes):
+        """
+        Opens a span below parent, the current span by default, without making it the
+        current span. Close it with end_span.
+        """
+        parent = parent or _current_span.get()
+        return Span(name, kind, parent.trace_id if parent else uuid.uuid4().hex, uuid.uuid4().hex[:16],
+                    parent.span_id if parent else None, time.time(), attributes=attributes,
+                    _clock=time.perf_counter())
+
+    def end_span(self, span, error=None, **attributes):
+        if span.duration is not None:
+            return span
+        span.duration = time.perf_counter() - span._clock
+        span.attributes.update(attributes)
+        span.error = str(error) if error else None
+        self._finish(span)
+        return span
+
+    def record(self, name, kind, seconds, **attributes):
+        """
+        Adds a finished span for work timed elsewhere, e.g. in a worker process, that
+        ended now and took seconds.
+        """
+        span = self.start_span(name, kind, **attributes)
+        span.start -= seconds
+        span.duration = seconds
+        self._finish(span)
+        return span
+
+    def _finish(self, span):
+        with self._lock:
+            self.spans.append(span)
+            if self.path:
+                record = span.to_otlp() if self.format == "otlp" else span.to_dict()
+                with open(self.path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(record, default=str) + "\n")
+
+    @contextlib.contextmanager
+    def activate(self, span):
+        """
+        Makes span the parent of the spans started inside the block.
+        """
+        token = _current_span.set(span)
+        try:
+            yield span
+        finally:
+            _current_span.reset(token)
+
+    @contextlib.contextmanager
+    def span(self, name, kind, **attributes):
+        """
+        Times the block as a span that is the parent of the spans started inside it.
+        """
+        span = self.start_span(name, kind, **attributes)
+        try:
+            with self.activate(span):
+                yield span
+        except BaseException as error:
+            self.end_span(span, error=f"{type(error).__name__}: {error}")
+            raise
+        self.end_span(span)
+
+    def trace(self, trace_id):
+        """
+        Returns the finished spans of a trace, in the order they started.
+        """
+        with self._lock:
+            return sorted((s for s in self.spans if s.trace_id == trace_id), key=lambda s: s.start)
+
+    def summary(self, kind=None):
+        return summarize_spans(list(self.spans), kind)
+
+
+def summarize_spans(spans, kind=None):
+    """
+    Returns {(kind, name): stats} with the count, total, mean, p50 and p95 in
+    milliseconds of the finished spans, optionally only those of one kind.
+    """
+    groups = {}
+    for span in spans:
+        if span.duration is not None and (kind is None or span.kind == kind):
+            groups.setdefault((span.kind, span.name), []).append(span.duration * 1000)
+    summary = {}
+    for key, values in sorted(groups.items()):
+        ms = np.asarray(values)
+        summary[key] = {"count": int(ms.size), "total_ms": float(ms.sum()), "mean_ms": float(ms.mean()),
+                        "p50_ms": float(np.percentile(ms, 50)), "p95_ms": float(np.percentile(ms, 95))}
+    return summary
+
+
+def summary_report(summary):
+    lines = [f"{'kind':<12}{'name':<28}{'count':>7}{'p50 ms':>10}{'p95 ms':>10}{'total s':>10}"]
+    for (kind, name), stats in summary.items():
+        lines.append(f"{kind:<12}{name[:27]:<28}{stats['count']:>7}{stats['p50_ms']:>10.1f}"
+                     f"{stats['p95_ms']:>10.1f}{stats['total_ms'] / 1000:>10.2f}")
+    return "\n".join(lines)
+
+
+def trace_rows(spans):
+    """
+    Flattens the spans of one trace into table rows in tree order: the name indented by
+    depth, the kind, the start offset and duration in milliseconds and the attributes.
+    """
+    if not spans:
+        return []
+    children = {}
+    ids = {span.span_id for span in spans}
+    for span in sorted(spans, key=lambda s: s.start):
+        children.setdefault(span.parent_id if span.parent_id in ids else None, []).append(span)
+    origin = min(span.start for span in spans)
+    rows = []
+
+    def visit(parent_id, depth):
+        for span in children.get(parent_id, []):
+            rows.append({"span": "  " * depth + span.name, "kind": span.kind,
+                         "start ms": round((span.start - origin) * 1000, 1), "ms": round(span.ms or 0.0, 1),
+                         "details": ", ".join(f"{k}={v}" for k, v in span.attributes.items()),
+                         "error": span.error or ""})
+            visit(span.span_id, depth + 1)
+    visit(None, 0)
+    return rows
+
+
+def _token_counts(response):
+    # OpenAI responses carry the usage in additional_kwargs, other clients in the raw response
+    counts = dict(getattr(response, "additional_kwargs", None) or {})
+    usage = getattr(getattr(response, "raw", None), "usage", None) or \
+        (response.raw.get("usage") if isinstance(getattr(response, "raw", None), dict) else None)
+    for key in ("prompt_tokens", "completion_tokens", "total_tokens"):
+        if key not in counts and usage is not None:
+            value = usage.get(key) if isinstance(usage, dict) else getattr(usage, key, None)
+            if value is not None:
+                counts[key] = value
+    return {key: int(counts[key]) for key in ("prompt_tokens", "completion_tokens", "total_tokens")
+            if isinstance(counts.get(key), (int, float))}
+
+
+class LlamaIndexTraceHandler(BaseEventHandler):
+    """
+    Turns the instrumentation events of llama_index into spans: agent steps, LLM calls
+    with their token counts, retrievals and embedding requests. A start and its end
+    event carry the same llama_index span id, which pairs them.
+    """
+
+    _tracer: Tracer = PrivateAttr()
+    _open: dict = PrivateAttr(default_factory=dict)
+    _lock: object = PrivateAttr(default_factory=threading.Lock)
+
+    def __init__(self, tracer, **kwargs):
+        super().__init__(**kwargs)
+        self._tracer = tracer
+
+    @classmethod
+    def class_name(cls):
+        return "LlamaIndexTraceHandler"
+
+    def _start(self, family, event, name, kind, activate=False, **attributes):
+        span = self._tracer.start_span(name, kind, **attributes)
+        # Agent steps become the parent of their tool calls until their end event
+        token = _current_span.set(span) if activate else None
+        with self._lock:
+            self._open.setdefault((family, event.span_id), []).append((span, token))
+
+    def _end(self, family, event, error=None, **attributes):
+        with self._lock:
+            stack = self._open.get((family, event.span_id))
+            if not stack:
+                return
+            span, token = stack.pop()
+            if not stack:
+                del self._open[(family, event.span_id)]
+        self._tracer.end_span(span, error, **attributes)
+        if token is not None:
+            try:
+                _current_span.reset(token)
+            except ValueError:
+                pass  # Ended in another context, which never saw the span as current
+
+    def handle(self, event, **kwargs):
+        name = event.class_name()
+        if name == "AgentRunStepStartEvent":
+            self._start("agent", event, "agent_step", "agent", activate=True, task_id=event.task_id)
+        elif name == "AgentRunStepEndEvent":
+            output = event.step_output
+            self._end("agent", event, is_last=output.is_last,
+                      tool_calls=len(getattr(output.output, "sources", None) or []))
+        elif name in ("LLMChatStartEvent", "LLMCompletionStartEvent"):
+            call = "chat" if name == "LLMChatStartEvent" else "complete"
+            self._start("llm", event, call, "llm", model=event.model_dict.get("model", ""))
+        elif name in ("LLMChatEndEvent", "LLMCompletionEndEvent"):
+            self._end("llm", event, **_token_counts(event.response))
+        elif name == "RetrievalStartEvent":
+            query = getattr(event.str_or_query_bundle, "query_str", event.str_or_query_bundle)
+            self._start("retrieval", event, "retrieve", "retrieval", query=str(query)[:200])
+        elif name == "RetrievalEndEvent":
+            self._end("retrieval", event, nodes=len(event.nodes))
+        elif name == "EmbeddingStartEvent":
+            self._start("embedding", event, "embed", "embedding", model=event.model_dict.get("model_name", ""))
+        elif name == "EmbeddingEndEvent":
+            self._end("embedding", event, chunks=len(event.chunks))
+        elif name == "SpanDropEvent":
+            # The method raised before its end event, close whatever it opened
+            for family in ("agent", "llm", "retrieval", "embedding"):
+                while (family, event.span_id) in self._open:
+                    self._end(family, event, error=event.err_str)
+
+
+class TracedTool(AsyncBaseTool):
+    """
+    Wraps an agent tool so that every call is a span of kind "tool" named after the
+    tool. The agent sees the metadata and the outputs of the wrapped tool.
+
+    Parameters:
+    - tool (BaseTool): The tool to trace.
+    """
+
+    def __init__(self, tool):
+        self._tool = tool
+        self._async_tool = adapt_to_async_tool(tool)
+
+    @property
+    def metadata(self):
+        return self._tool.metadata
+
+    @property
+    def tool(self):
+        return self._tool
+
+    def call(self, *args, **kwargs):
+        with get_tracer().span(self.metadata.name, "tool"):
+            return self._tool.call(*args, **kwargs)
+
+    async def acall(self, *args, **kwargs):
+        with get_tracer().span(self.metadata.name, "tool"):
+            return await self._async_tool.acall(*args, **kwargs)
+
+
+_tracer = None
+_tracer_lock = threading.Lock()
+
+
+def get_tracer():
+    """
+    Returns the process-wide tracer, creating it on first use together with the handler
+    that traces the llama_index events.
+    """
+    global _tracer
+    with _tracer_lock:
+        if _tracer is None:
+            _tracer = Tracer()
+            get_dispatcher().add_event_handler(LlamaIndexTraceHandler(_tracer))
+        return _tracer
+
+
+def load_spans(path):
+    """
+    Reads the spans of a JSON lines trace file.
+    """
+    with open(path, encoding="utf-8") as f:
+        return [Span.from_dict(json.loads(line)) for line in f if line.strip()]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="p50/p95 per span name of a JSON lines trace file.")
+    parser.add_argument("trace_file", help="File written with TRACE_FILE and TRACE_FORMAT=jsonl")
+    parser.add_argument("--kind", help="Only spans of this kind, e.g. tool, llm, retrieval or ingest")
+    args = parser.parse_args(argv)
+    print(summary_report(summarize_spans(load_spans(args.trace_file), args.kind)))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
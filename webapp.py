@@ -1,21 +1,50 @@
 import streamlit as st
 from streamlit import pyplot as plt
 from streamlit_pdf_viewer import pdf_viewer
-from CQP_MVP import *
-from llama_index.llms.openai import OpenAI
-from llama_index.core.agent import FunctionCallingAgentWorker, AgentRunner
+from CQP_MVP import InquiryResult, astream_inquiry, get_app_context
+from artifact_store import get_artifact_store
+from tracing import get_tracer, trace_rows
 from PIL import Image
-# Initialize OpenAI model
-llm = OpenAI(model="gpt-4-turbo")
-
-# Initialize AgentRunner
-agent_worker = FunctionCallingAgentWorker.from_tools(
-    tool_retriever=obj_index.as_retriever(similarity_top_k=5),
-    llm=llm,
-    verbose=True,
-    allow_parallel_tool_calls=True,
-)
-agent = AgentRunner(agent_worker)
+import asyncio
+import io
+import os
+import time
+import uuid
+
+# Seconds between two progress updates while the agent works
+TICK = 0.5
+
+
+# Streamlit re-executes this script on every interaction. Everything that does not belong
+# to a single session is created once per process by these cached functions.
+@st.cache_resource
+def app_context():
+    """
+    The indexes, tools, LLM client and tool ObjectIndex shared by all sessions. They are
+    loaded with the first page view instead of the first question.
+    """
+    context = get_app_context()
+    context.obj_index
+    context.llm
+    print(context.timing_report())
+    return context
+
+
+@st.cache_resource
+def static_image(path, size_path, scale):
+    """
+    Returns the image at path as PNG bytes, resized to scale times the size of the image
+    at size_path. Encoded bytes are cached, a PIL image would be encoded again by st.image
+    on every rerun.
+    """
+    with Image.open(size_path) as reference:
+        width, height = reference.size
+    with Image.open(path) as image:
+        resized = image.resize((int(scale[0] * width), int(scale[1] * height)))
+    buffer = io.BytesIO()
+    resized.save(buffer, format="PNG")
+    return buffer.getvalue()
+
 
 # ---------------------------------------------------------------------------- #
 # ---------------------------------------------------------------------------- #
@@ -38,7 +67,7 @@ st.title('Chart Question Answering')
 col2, col1 = st.columns(2)  # Adjusted the order here
 # col1.markdown("###     CQA Tool Instruction will be displayed here") 
 # col1.image(Image.open("./img/tool_function_overview.png").resize((int(0.8 * Image.open("./img/tool_function_overview.png").width), int(0.8 * Image.open("./img/tool_function_overview.png").height))))
-col1.image(Image.open("./img/embedded.png").resize((int(.8 * Image.open("./img/tool_function_overview.png").width), int(1.8 * Image.open("./img/tool_function_overview.png").height))))
+col1.image(static_image("./img/embedded.png", "./img/tool_function_overview.png", (.8, 1.8)))
 
 col2.markdown("### Chat, inquire, and modify the chart")
 
@@ -51,6 +80,13 @@ if 'conversation' not in st.session_state:
     st.session_state['conversation'] = []
 if 'response_history' not in st.session_state:
     st.session_state['response_history'] = []
+# Each session talks to its own agent, the indexes and tools are loaded once per process
+if 'agent' not in st.session_state:
+    st.session_state['agent'] = app_context().new_agent()
+if 'session_id' not in st.session_state:
+    st.session_state['session_id'] = uuid.uuid4().hex
+# Artifact cleanup leaves the charts of sessions that are still in use alone
+get_artifact_store().touch_session(st.session_state['session_id'])
 
 # Display the conversation history dynamically
 def display_conversation_history():
@@ -61,40 +97,102 @@ def display_conversation_history():
 
     for i in range(len(st.session_state['conversation'])):
         col2.write(f"User: {st.session_state['conversation'][i]}")
-        if i < len(st.session_state['response_history']):
-            col2.write(f"{st.session_state['response_history'][i]}")
-
-        # Additionally check for image responses and display them
-        if i < len(st.session_state['response_history']) and isinstance(st.session_state['response_history'][i], str) and st.session_state['response_history'][i].endswith('.png'):
-            st.image(st.session_state['response_history'][i], caption="Generated Chart")
+        if i >= len(st.session_state['response_history']):
+            continue
+        response = st.session_state['response_history'][i]
+
+        # Charts are kept as image data, their files may have been cleaned up since
+        if isinstance(response, dict):
+            if response['image'] is not None:
+                st.image(response['image'], caption="Generated Chart")
+            elif os.path.exists(response['path']):
+                st.image(response['path'], caption="Generated Chart")
+            else:
+                col2.caption("This chart is no longer available.")
+        else:
+            col2.write(f"{response}")
 
 
 # Display the conversation history and any images first
 display_conversation_history()
 
+# Optional debug panel with the spans of the last answer, see tracing
+show_timings = st.sidebar.checkbox("Show timing breakdown", value=False)
+
+
+def display_timings(trace_id):
+    spans = get_tracer().trace(trace_id)
+    if not spans:
+        return
+    with col2.expander("Timing breakdown of the last answer", expanded=True):
+        totals = []
+        for kind, label in (("llm", "LLM calls"), ("retrieval", "retrievals"), ("tool", "tool calls")):
+            group = [span for span in spans if span.kind == kind]
+            if group:
+                totals.append(f"{len(group)} {label} {sum(span.duration for span in group):.2f} s")
+        tokens = sum(span.attributes.get("total_tokens", 0) for span in spans if span.kind == "llm")
+        st.caption(f"Total {spans[0].ms / 1000:.2f} s: " + ", ".join(totals) + f", {tokens} tokens")
+        st.dataframe(trace_rows(spans), use_container_width=True, hide_index=True)
+
+
 def send_message():
-    user_message = st.session_state['current_message']
-    if user_message:
-        # Append message to conversation
-        st.session_state['conversation'].append(user_message)
-
-        # Generate a response using the agent, which might include generating an image
-        latest_image_path = process_inquiry_and_show_latest_image(user_message)
-        if latest_image_path:
-            # If an image is generated, use the image path as the response to display
-            st.session_state['response_history'].append(latest_image_path)
-            st.image(latest_image_path, caption="Latest Generated Chart")
-
-        # Otherwise, generate a text response using the agent
-        else:
-            response = agent.chat(user_message)
-            st.session_state['response_history'].append(response)
+    # The answer is computed further down in the script run, where it can stream into col2
+    if st.session_state['current_message']:
+        st.session_state['pending_message'] = st.session_state['current_message']
 
         # Clear the current message to reset the text input box
         st.session_state['current_message'] = ""
 
-        # # Optionally rerun to update the UI
-        # st.rerun()
+
+async def stream_answer(user_message, status):
+    """
+    Runs the inquiry and shows the tool calls of the agent in status as they finish.
+    While the agent works the elapsed time is updated every TICK seconds; each update lets
+    Streamlit stop the script when the user presses Stop, which cancels the agent.
+    """
+    start = time.perf_counter()
+    events = astream_inquiry(user_message, st.session_state['agent'], st.session_state['session_id'])
+    pending = asyncio.ensure_future(anext(events))
+    try:
+        while True:
+            done, _ = await asyncio.wait({pending}, timeout=TICK)
+            if not done:
+                status.update(label=f"Working... {time.perf_counter() - start:.0f} s")
+                continue
+            event = pending.result()
+            if isinstance(event, InquiryResult):
+                status.update(label=f"Answered in {time.perf_counter() - start:.1f} s", state="complete")
+                return event
+            status.write(f"**{event.tool}**: {event.output[:500]}")
+            pending = asyncio.ensure_future(anext(events))
+    finally:
+        # Cancelling the pending step closes the generator, which drops the agent's task
+        pending.cancel()
+        await asyncio.gather(pending, return_exceptions=True)
+        await events.aclose()
+
+
+if 'pending_message' in st.session_state:
+    user_message = st.session_state.pop('pending_message')
+    col2.write(f"User: {user_message}")
+    col2.button("Stop")
+    result = asyncio.run(stream_answer(user_message, col2.status("Working...", expanded=True)))
+    st.session_state['last_trace_id'] = result.trace_id
+
+    # The exchange enters the history only once it is answered
+    st.session_state['conversation'].append(user_message)
+    if result.image_path:
+        # If an image is generated, keep the image itself as the response to display
+        st.session_state['response_history'].append({'image': result.image, 'path': result.image_path})
+        col2.image(result.image or result.image_path, caption="Latest Generated Chart")
+
+    # Otherwise, show the text of the same answer
+    else:
+        st.session_state['response_history'].append(result.text)
+        col2.write(result.text)
+
+if show_timings and st.session_state.get('last_trace_id'):
+    display_timings(st.session_state['last_trace_id'])
 
 if 'current_message' not in st.session_state:
     st.session_state['current_message'] = ""